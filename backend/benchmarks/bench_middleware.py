@@ -0,0 +1,193 @@
+"""
+Middleware Overhead Benchmark
+
+Measures the per-request cost of the middleware stack by driving the ASGI
+application directly (no sockets), comparing the previous
+BaseHTTPMiddleware-based request logging and rate limiting (which buffered
+and regex-scanned the whole upload) with the current pure ASGI middleware.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_middleware [--requests 2000] [--body-kb 256]
+"""
+
+import os
+import re
+import io
+import sys
+import time
+import asyncio
+import argparse
+import contextlib
+import statistics
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+# Limits are kept per process so the benchmark needs no Redis
+os.environ.pop("REDIS_URL", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.middleware import RequestLoggingMiddleware, RateLimitMiddleware
+
+BOUNDARY = "----BlindBenchmarkBoundary"
+
+# ============================================================================
+# Previous Middleware (BaseHTTPMiddleware)
+# ============================================================================
+
+class LegacyRequestLoggingMiddleware(BaseHTTPMiddleware):
+    """Request logging as implemented before the ASGI rewrite"""
+    
+    async def dispatch(self, request: Request, call_next):
+        start_time = time.time()
+        client_ip = request.client.host if request.client else "unknown"
+        print(f"[{datetime.utcnow().isoformat()}] {request.method} {request.url.path} from {client_ip}")
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        print(f"[{datetime.utcnow().isoformat()}] {request.method} {request.url.path} - Status: {response.status_code} - Time: {process_time:.2f}s")
+        response.headers["X-Process-Time"] = str(process_time)
+        return response
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    """Rate limiting as implemented before the ASGI rewrite (limit never hit here)"""
+    
+    def __init__(self, app, max_requests: int = 10, window_seconds: int = 60):
+        super().__init__(app)
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.request_counts = defaultdict(list)
+    
+    async def dispatch(self, request: Request, call_next):
+        session_id = request.query_params.get("session_id")
+        if not session_id and "multipart/form-data" in request.headers.get("content-type", ""):
+            body_str = (await request.body()).decode('utf-8', errors='ignore')
+            match = re.search(r'name="session_id"\r?\n\r?\n([^\r\n]+)', body_str)
+            if match:
+                session_id = match.group(1).strip()
+        if not session_id:
+            session_id = request.client.host if request.client else "unknown"
+        
+        now = datetime.utcnow()
+        cutoff_time = now - timedelta(seconds=self.window_seconds)
+        self.request_counts[session_id] = [
+            req_time for req_time in self.request_counts[session_id]
+            if req_time > cutoff_time
+        ]
+        self.request_counts[session_id].append(now)
+        return await call_next(request)
+
+# ============================================================================
+# Benchmark Application
+# ============================================================================
+
+async def upload(request: Request):
+    """Read the whole upload, like the analyze endpoint does"""
+    body = await request.body()
+    return Response(str(len(body)), media_type="text/plain")
+
+async def stream(request: Request):
+    """Small streamed response, like the streaming audio mode"""
+    async def chunks():
+        for _ in range(8):
+            yield b"\0" * 1024
+    return StreamingResponse(chunks(), media_type="audio/wav")
+
+def build_app(middleware_classes) -> Starlette:
+    """Starlette app with the given middleware (outermost first)"""
+    middleware = []
+    for cls in middleware_classes:
+        kwargs = {"max_requests": 10 ** 9, "window_seconds": 60} if "RateLimit" in cls.__name__ else {}
+        middleware.append(Middleware(cls, **kwargs))
+    routes = [Route("/upload", upload, methods=["POST"]), Route("/stream", stream)]
+    return Starlette(routes=routes, middleware=middleware)
+
+def multipart_body(body_kb: int) -> bytes:
+    """Multipart form shaped like the firmware's (session_id first, then image)"""
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"session_id\"\r\n\r\n"
+        f"bench-session\r\n--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"image\"; "
+        f"filename=\"image.jpg\"\r\nContent-Type: image/jpeg\r\n\r\n"
+    ).encode() + b"\xff" * (body_kb * 1024) + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+async def request_once(app, method: str, path: str, body: bytes, chunk_size: int = 65536):
+    """Send one request through the ASGI app"""
+    headers = [(b"host", b"bench")]
+    if body:
+        headers.append((b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()))
+        headers.append((b"content-length", str(len(body)).encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "headers": headers,
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80)
+    }
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.Event().wait()
+    
+    async def send(message):
+        pass
+    
+    await app(scope, receive, send)
+
+async def run_case(app, method: str, path: str, body: bytes, requests: int) -> list:
+    """Per-request latencies in microseconds"""
+    for _ in range(min(100, requests)):
+        await request_once(app, method, path, body)
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await request_once(app, method, path, body)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+def percentile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+# ============================================================================
+# Main
+# ============================================================================
+
+async def main(requests: int, body_kb: int):
+    body = multipart_body(body_kb)
+    stacks = {
+        "no middleware": [],
+        "BaseHTTPMiddleware (before)": [LegacyRequestLoggingMiddleware, LegacyRateLimitMiddleware],
+        "pure ASGI (now)": [RequestLoggingMiddleware, RateLimitMiddleware],
+    }
+    cases = [
+        ("POST upload", "POST", "/upload", body),
+        ("GET stream", "GET", "/stream", b""),
+    ]
+    
+    print(f"{requests} requests per case, upload body {len(body) // 1024} KB")
+    print(f"{'case':<14}{'stack':<30}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}")
+    for case_name, method, path, case_body in cases:
+        for stack_name, classes in stacks.items():
+            app = build_app(classes)
+            # The middleware logs every request; keep it out of the output
+            with contextlib.redirect_stdout(io.StringIO()):
+                samples = await run_case(app, method, path, case_body, requests)
+            print(f"{case_name:<14}{stack_name:<30}{statistics.mean(samples):>10.1f}"
+                  f"{percentile(samples, 0.5):>10.1f}{percentile(samples, 0.99):>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Middleware overhead benchmark")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per case")
+    parser.add_argument("--body-kb", type=int, default=256, help="Upload size in KB")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.body_kb))
@@ -5,15 +5,29 @@ Handles session creation, storage, and retrieval with language awareness.
 Supports Redis for production and in-memory storage for development.
 """
 
+import os
 import uuid
 import time
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timezone
 import json
 
-# Try to import Redis, fall back to in-memory storage
+from services.circuit_breaker import CircuitBreaker
+from services.timer_wheel import TimerWheel
+
+# Compact binary encoding of stored interactions (JSON if unavailable)
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# Try to import Redis (asyncio client), fall back to in-memory storage
 try:
-    import redis
+    import redis.asyncio as aioredis
     REDIS_AVAILABLE = True
 except ImportError:
     REDIS_AVAILABLE = False
@@ -23,15 +37,84 @@ except ImportError:
 # Session Data Structure
 # ============================================================================
 
+# Interactions kept per session
+MAX_INTERACTIONS = 10
+
+# Turns time.monotonic() readings into Unix time, so sessions keep cheap
+# monotonic floats and only format ISO timestamps at the API/storage boundary
+_WALL_CLOCK_OFFSET = time.time() - time.monotonic()
+
+def _to_iso(monotonic_time: float) -> str:
+    """UTC ISO timestamp (naive, as datetime.utcnow) of a monotonic time"""
+    wall_time = datetime.fromtimestamp(monotonic_time + _WALL_CLOCK_OFFSET, timezone.utc)
+    return wall_time.replace(tzinfo=None).isoformat()
+
+def _from_iso(value: str) -> float:
+    """Monotonic time of a UTC ISO timestamp (now if it cannot be parsed)"""
+    try:
+        wall_time = datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return time.monotonic()
+    return wall_time.timestamp() - _WALL_CLOCK_OFFSET
+
 class SessionData:
     """Represents a user session with chat history and language preference"""
     
+    # Tens of thousands of idle sessions may be held in memory
+    __slots__ = (
+        "session_id",
+        "created",
+        "last_active",
+        "detected_language",
+        "chat_history",
+        "pending_interactions",
+        "version"
+    )
+    
     def __init__(self, session_id: str = None):
+        now = time.monotonic()
         self.session_id = session_id or str(uuid.uuid4())
-        self.created_at = datetime.utcnow().isoformat()
-        self.last_activity = datetime.utcnow().isoformat()
+        self.created = now       # monotonic
+        self.last_active = now   # monotonic
         self.detected_language = None
         self.chat_history = []
+        # Interactions added since the session was last persisted
+        self.pending_interactions = []
+        # Version token of the stored copy this object was loaded from
+        self.version = None
+    
+    def copy(self) -> 'SessionData':
+        """Independent copy (interactions themselves are never mutated)"""
+        session = SessionData(self.session_id)
+        session.created = self.created
+        session.last_active = self.last_active
+        session.detected_language = self.detected_language
+        session.chat_history = list(self.chat_history)
+        session.pending_interactions = list(self.pending_interactions)
+        session.version = self.version
+        return session
+    
+    @property
+    def created_at(self) -> str:
+        """Creation time as a UTC ISO timestamp"""
+        return _to_iso(self.created)
+    
+    @created_at.setter
+    def created_at(self, value: str):
+        self.created = _from_iso(value)
+    
+    @property
+    def last_activity(self) -> str:
+        """Last activity as a UTC ISO timestamp"""
+        return _to_iso(self.last_active)
+    
+    @last_activity.setter
+    def last_activity(self, value: str):
+        self.last_active = _from_iso(value)
+    
+    def touch(self):
+        """Mark the session as active now"""
+        self.last_active = time.monotonic()
     
     def to_dict(self) -> Dict:
         """Convert session to dictionary"""
@@ -47,8 +130,10 @@ class SessionData:
     def from_dict(cls, data: Dict) -> 'SessionData':
         """Create session from dictionary"""
         session = cls(data.get("session_id"))
-        session.created_at = data.get("created_at", datetime.utcnow().isoformat())
-        session.last_activity = data.get("last_activity", datetime.utcnow().isoformat())
+        if data.get("created_at"):
+            session.created_at = data["created_at"]
+        if data.get("last_activity"):
+            session.last_activity = data["last_activity"]
         session.detected_language = data.get("detected_language")
         session.chat_history = data.get("chat_history", [])
         return session
@@ -56,24 +141,419 @@ class SessionData:
     def add_interaction(self, user_query: str, detected_language: str, 
                        image_path: str, ai_response: str):
         """Add an interaction to chat history"""
+        self.touch()
         interaction = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": _to_iso(self.last_active),
             "user_query": user_query,
             "detected_language": detected_language,
             "image_path": image_path,
             "ai_response": ai_response
         }
         self.chat_history.append(interaction)
+        self.pending_interactions.append(interaction)
         
         # Keep only last 10 interactions
-        if len(self.chat_history) > 10:
-            self.chat_history = self.chat_history[-10:]
+        if len(self.chat_history) > MAX_INTERACTIONS:
+            self.chat_history = self.chat_history[-MAX_INTERACTIONS:]
         
         # Update language if not set
         if not self.detected_language:
             self.detected_language = detected_language
+
+# ============================================================================
+# Storage Backends
+# ============================================================================
+
+class MemorySessionBackend:
+    """
+    Sessions kept in process memory (development, or Redis outages)
+    
+    Expiry is tracked on a timer wheel advanced by a background task, so
+    expiring sessions never requires scanning all of them.
+    """
+    
+    def __init__(self, session_ttl: int = 1800, tick_seconds: float = 1.0):
+        """
+        Initialize in-memory backend
+        
+        Args:
+            session_ttl: Idle seconds after which a session expires
+            tick_seconds: Expiry granularity (background task interval)
+        """
+        self.session_ttl = session_ttl
+        self.tick_seconds = tick_seconds
+        self.sessions = {}
+        # One wheel rotation covers the TTL, so no deadline wraps around
+        self.wheel = TimerWheel(tick_seconds, slots=int(session_ttl / tick_seconds) + 2)
+        self.expired_count = 0
+        self.expiry_task = None
+    
+    def load(self, session_id: str) -> Optional[SessionData]:
+        """Get a session object and refresh its TTL"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        now = time.monotonic()
+        if self.wheel.is_expired(session_id, now):
+            # Expired, but its tick has not run yet
+            self.delete(session_id)
+            self.expired_count += 1
+            return None
+        self.wheel.schedule(session_id, now + self.session_ttl)
+        return session
+    
+    def save(self, session: SessionData):
+        """Store a session object"""
+        session.pending_interactions = []
+        self.sessions[session.session_id] = session
+        self.wheel.schedule(session.session_id, session.last_active + self.session_ttl)
+    
+    def append(self, session: SessionData):
+        """Store a session object after new interactions"""
+        self.save(session)
+    
+    def delete(self, session_id: str):
+        """Remove a session"""
+        self.sessions.pop(session_id, None)
+        self.wheel.cancel(session_id)
+    
+    def expire(self, now: float = None) -> int:
+        """
+        Drop sessions whose TTL has passed
+        
+        Returns:
+            Number of sessions removed
+        """
+        expired = self.wheel.advance(time.monotonic() if now is None else now)
+        for session_id in expired:
+            self.sessions.pop(session_id, None)
+        self.expired_count += len(expired)
+        return len(expired)
+    
+    def start(self):
+        """Start the background expiry task (on the running event loop)"""
+        if self.expiry_task is None:
+            self.expiry_task = asyncio.ensure_future(self._run_expiry())
+    
+    async def stop(self):
+        """Stop the background expiry task"""
+        if self.expiry_task:
+            self.expiry_task.cancel()
+            try:
+                await self.expiry_task
+            except asyncio.CancelledError:
+                pass
+            self.expiry_task = None
+    
+    async def _run_expiry(self):
+        """Advance the timer wheel once per tick"""
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            try:
+                self.expire()
+            except Exception as e:
+                print(f"Session expiry failed: {e}")
+
+def _encode_interaction(interaction: Dict) -> bytes:
+    """Serialize one interaction (MessagePack, or JSON without msgpack)"""
+    if MSGPACK_AVAILABLE:
+        return msgpack.packb(interaction, use_bin_type=True)
+    return json.dumps(interaction, ensure_ascii=False).encode("utf-8")
+
+def _decode_interaction(raw: bytes) -> Dict:
+    """Deserialize one interaction written by _encode_interaction"""
+    # A MessagePack map never starts with "{", a JSON object always does
+    if raw[:1] == b"{" or not MSGPACK_AVAILABLE:
+        return json.loads(raw)
+    return msgpack.unpackb(raw, raw=False)
+
+class LocalSessionCache:
+    """Per-process LRU of sessions with the version token they were stored at"""
+    
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # session_id -> SessionData (with version)
+        self.lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "stale": 0,
+            "misses": 0,
+            "invalidations": 0
+        }
+    
+    def get(self, session_id: str) -> Optional[SessionData]:
+        """Cached copy of a session (not yet validated against Redis)"""
+        with self.lock:
+            session = self.entries.get(session_id)
+            if session is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(session_id)
+            return session.copy()
+    
+    def put(self, session: SessionData):
+        """Cache a copy of a session whose version matches Redis"""
+        if self.max_entries <= 0 or not session.version:
+            return
+        with self.lock:
+            self.entries[session.session_id] = session.copy()
+            self.entries.move_to_end(session.session_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+    
+    def evict(self, session_id: str, reason: str = None):
+        """Drop a session"""
+        with self.lock:
+            if self.entries.pop(session_id, None) is not None and reason:
+                self.stats[reason] += 1
+    
+    def record_hit(self):
+        with self.lock:
+            self.stats["hits"] += 1
+    
+    def get_stats(self) -> Dict:
+        """Get hit/stale/invalidation counters"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self.entries)
+        return stats
+
+class RedisSessionBackend:
+    """
+    Sessions stored incrementally in Redis through a pooled asyncio client
+    
+    Each session is a small metadata hash (session:{id}:meta) plus a list
+    of encoded interactions (session:{id}:log). A turn appends one entry and
+    trims the list to the window kept by SessionData, instead of rewriting
+    the whole session. Sessions in the legacy single-key JSON format
+    (session:{id}) are migrated when first loaded.
+    
+    Recently used sessions are also kept in a per-process cache. Every write
+    stores a new random version token in the metadata hash, and a cached
+    session is only used after a one-field read (HGET v, pipelined with the
+    TTL refresh) confirms Redis still holds that version, so a session that
+    another worker changed is never served stale. Writes are also announced
+    on a pub/sub channel so other workers drop their copies early.
+    """
+    
+    INVALIDATION_CHANNEL = "session-invalidations"
+    
+    def __init__(self, redis_url: str, session_ttl: int, pool_size: int = 20,
+                 socket_timeout: float = 0.5, local_cache_size: int = 1000):
+        """
+        Initialize Redis backend (no connection is made until first use)
+        
+        Args:
+            redis_url: Redis connection URL
+            session_ttl: Session time-to-live in seconds
+            pool_size: Maximum pooled connections per worker
+            socket_timeout: Seconds before a Redis call counts as failed
+            local_cache_size: Sessions cached in this process (0 disables)
+        """
+        self.session_ttl = session_ttl
+        # Binary replies: interactions are MessagePack-encoded
+        self.pool = aioredis.ConnectionPool.from_url(
+            redis_url,
+            max_connections=pool_size,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_timeout,
+            decode_responses=False
+        )
+        self.client = aioredis.Redis(connection_pool=self.pool)
+        self.local_cache = LocalSessionCache(local_cache_size)
+        # Identifies this process's own invalidation messages
+        self.instance_id = uuid.uuid4().hex
+        self.listener_task = None
+    
+    @staticmethod
+    def _keys(session_id: str) -> Tuple[str, str]:
+        """Metadata hash and interaction list keys of a session"""
+        return f"session:{session_id}:meta", f"session:{session_id}:log"
+    
+    @staticmethod
+    def _legacy_key(session_id: str) -> str:
+        """Key of a session in the old whole-JSON format"""
+        return f"session:{session_id}"
+    
+    @staticmethod
+    def _meta(session: SessionData) -> Dict:
+        """Metadata hash fields of a session"""
+        return {
+            "session_id": session.session_id,
+            "created_at": session.created_at,
+            "last_activity": session.last_activity,
+            "detected_language": session.detected_language or ""
+        }
+    
+    @staticmethod
+    def _new_version() -> str:
+        """Random version token (tokens never repeat, even after a delete)"""
+        return uuid.uuid4().hex[:16]
+    
+    async def ping(self):
+        """Check the connection"""
+        await self.client.ping()
+    
+    def start_invalidation(self):
+        """Start listening for other workers' writes (keeps retrying if Redis is down)"""
+        if self.local_cache.max_entries > 0 and self.listener_task is None:
+            self.listener_task = asyncio.ensure_future(self._listen_invalidations())
+    
+    async def load(self, session_id: str) -> Optional[SessionData]:
+        """Load a session and refresh its TTL in one round trip"""
+        meta_key, log_key = self._keys(session_id)
+        
+        cached = self.local_cache.get(session_id)
+        if cached is not None:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hget(meta_key, "v")
+            pipe.expire(meta_key, self.session_ttl)
+            pipe.expire(log_key, self.session_ttl)
+            version, _, _ = await pipe.execute()
+            if version is not None and version.decode("utf-8") == cached.version:
+                self.local_cache.record_hit()
+                return cached
+            self.local_cache.evict(session_id, "stale")
+        
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(meta_key)
+        pipe.lrange(log_key, 0, -1)
+        pipe.expire(meta_key, self.session_ttl)
+        pipe.expire(log_key, self.session_ttl)
+        meta, log, _, _ = await pipe.execute()
+        
+        if not meta:
+            return await self._migrate_legacy(session_id)
+        
+        meta = {key.decode("utf-8"): value.decode("utf-8") for key, value in meta.items()}
+        session = SessionData(meta.get("session_id") or session_id)
+        session.created_at = meta.get("created_at", session.created_at)
+        session.last_activity = meta.get("last_activity", session.last_activity)
+        session.detected_language = meta.get("detected_language") or None
+        session.chat_history = [_decode_interaction(raw) for raw in log]
+        session.version = meta.get("v")
+        self.local_cache.put(session)
+        return session
+    
+    async def save(self, session: SessionData):
+        """Write a whole session (new sessions and migrations)"""
+        meta_key, log_key = self._keys(session.session_id)
+        version = self._new_version()
+        
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(log_key)
+        pipe.hset(meta_key, mapping=dict(self._meta(session), v=version))
+        if session.chat_history:
+            pipe.rpush(log_key, *[_encode_interaction(item) for item in session.chat_history])
+            pipe.expire(log_key, self.session_ttl)
+        pipe.expire(meta_key, self.session_ttl)
+        pipe.publish(self.INVALIDATION_CHANNEL, self._invalidation(session.session_id))
+        await pipe.execute()
+        
+        session.pending_interactions = []
+        session.version = version
+        self.local_cache.put(session)
+    
+    async def append(self, session: SessionData):
+        """
+        Persist metadata and the interactions added since the last write
+        
+        Falls back to a full save() when Redis no longer holds the session
+        (expired or evicted since it was loaded, or written to memory during
+        a Redis outage), so its earlier interactions are not lost.
+        """
+        meta_key, log_key = self._keys(session.session_id)
+        version = self._new_version()
+        
+        pipe = self.client.pipeline(transaction=True)
+        # Version before this write (MULTI: nothing can run in between)
+        pipe.hget(meta_key, "v")
+        # All metadata fields, so a hash recreated here is never partial
+        pipe.hset(meta_key, mapping=dict(self._meta(session), v=version))
+        if session.pending_interactions:
+            pipe.rpush(log_key, *[_encode_interaction(item) for item in session.pending_interactions])
+            pipe.ltrim(log_key, -MAX_INTERACTIONS, -1)
+        pipe.expire(meta_key, self.session_ttl)
+        pipe.expire(log_key, self.session_ttl)
+        pipe.publish(self.INVALIDATION_CHANNEL, self._invalidation(session.session_id))
+        results = await pipe.execute()
+        
+        if results[0] is None:
+            # The log may be gone too: rewrite the whole session
+            await self.save(session)
+            return
+        
+        previous = results[0].decode("utf-8")
+        session.pending_interactions = []
+        if previous == session.version:
+            # No other write in between: this object is exactly what Redis holds
+            session.version = version
+            self.local_cache.put(session)
+        else:
+            # Another worker wrote since this session was loaded
+            session.version = None
+            self.local_cache.evict(session.session_id)
+    
+    async def delete(self, session_id: str):
+        """Remove a session (both formats)"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(*self._keys(session_id), self._legacy_key(session_id))
+        pipe.publish(self.INVALIDATION_CHANNEL, self._invalidation(session_id))
+        await pipe.execute()
+        self.local_cache.evict(session_id)
+    
+    async def _migrate_legacy(self, session_id: str) -> Optional[SessionData]:
+        """Convert a session stored as one JSON value to the incremental format"""
+        legacy_key = self._legacy_key(session_id)
+        data = await self.client.get(legacy_key)
+        if not data:
+            return None
         
-        self.last_activity = datetime.utcnow().isoformat()
+        session = SessionData.from_dict(json.loads(data))
+        await self.save(session)
+        await self.client.delete(legacy_key)
+        print(f"Migrated session {session_id} to incremental storage")
+        return session
+    
+    def _invalidation(self, session_id: str) -> str:
+        """Invalidation message for a session"""
+        return f"{self.instance_id}:{session_id}"
+    
+    async def _listen_invalidations(self):
+        """Drop local copies of sessions written by other workers"""
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.INVALIDATION_CHANNEL)
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if not message:
+                        continue
+                    instance_id, _, session_id = message["data"].decode("utf-8").partition(":")
+                    if instance_id != self.instance_id:
+                        self.local_cache.evict(session_id, "invalidations")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Reads stay correct through version checks; retry shortly
+                print(f"Session invalidation listener error: {e}")
+                await asyncio.sleep(1.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+    
+    async def close(self):
+        """Stop the invalidation listener and close pooled connections"""
+        if self.listener_task:
+            self.listener_task.cancel()
+            try:
+                await self.listener_task
+            except asyncio.CancelledError:
+                pass
+            self.listener_task = None
+        await self.pool.disconnect()
 
 # ============================================================================
 # Session Manager
@@ -91,95 +571,138 @@ class SessionManager:
             session_ttl: Session time-to-live in seconds (default: 30 minutes)
         """
         self.session_ttl = session_ttl
-        self.redis_client = None
-        self.memory_storage = {}
+        self.redis_backend = None
+        self.memory_backend = MemorySessionBackend(
+            session_ttl,
+            tick_seconds=float(os.getenv("SESSION_EXPIRY_TICK_SECONDS", "1"))
+        )
+        self.memory_storage = self.memory_backend.sessions
+        
+        # Redis failures open the circuit; sessions then live in memory
+        # until a trial call succeeds again
+        self.breaker = CircuitBreaker(
+            "Redis",
+            failure_threshold=int(os.getenv("REDIS_FAILURE_THRESHOLD", "3")),
+            reset_timeout=float(os.getenv("REDIS_RESET_TIMEOUT", "30"))
+        )
         
         if REDIS_AVAILABLE and redis_url:
             try:
-                self.redis_client = redis.from_url(redis_url, decode_responses=True)
-                self.redis_client.ping()
-                print(f"Connected to Redis at {redis_url}")
+                self.redis_backend = RedisSessionBackend(
+                    redis_url,
+                    session_ttl,
+                    pool_size=int(os.getenv("REDIS_POOL_SIZE", "20")),
+                    socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5")),
+                    local_cache_size=int(os.getenv("SESSION_LOCAL_CACHE_SIZE", "1000"))
+                )
             except Exception as e:
-                print(f"Failed to connect to Redis: {e}")
+                print(f"Invalid Redis configuration: {e}")
                 print("Falling back to in-memory storage")
-                self.redis_client = None
+                self.redis_backend = None
         else:
             print("Using in-memory storage for sessions")
     
-    def create_session(self, session_id: str = None) -> SessionData:
+    async def connect(self) -> bool:
+        """
+        Start in-memory expiry and check the Redis connection (warm-up step)
+        
+        Returns:
+            True (sessions are usable with or without Redis)
+        """
+        self.memory_backend.start()
+        if self.redis_backend:
+            self.redis_backend.start_invalidation()
+            try:
+                await self.redis_backend.ping()
+                self.breaker.record_success()
+                print("Connected to Redis")
+            except Exception as e:
+                self.breaker.record_failure(e)
+                print(f"Failed to connect to Redis, using in-memory storage until it recovers: {e}")
+        return True
+    
+    async def close(self):
+        """Stop in-memory expiry and release Redis connections"""
+        await self.memory_backend.stop()
+        if self.redis_backend:
+            await self.redis_backend.close()
+    
+    async def _call_redis(self, method: str, *args):
+        """
+        Call the Redis backend through the circuit breaker
+        
+        Returns:
+            Tuple of (used_redis, result); used_redis is False when the
+            circuit is open or the call failed
+        """
+        if not self.redis_backend or not self.breaker.allow():
+            return False, None
+        try:
+            result = await getattr(self.redis_backend, method)(*args)
+        except Exception as e:
+            self.breaker.record_failure(e)
+            return False, None
+        self.breaker.record_success()
+        return True, result
+    
+    async def create_session(self, session_id: str = None) -> SessionData:
         """Create a new session"""
         session = SessionData(session_id)
-        self._save_session(session)
+        await self._save_session(session)
         return session
     
-    def get_session(self, session_id: str) -> Optional[SessionData]:
-        """Retrieve a session by ID"""
-        if self.redis_client:
-            try:
-                data = self.redis_client.get(f"session:{session_id}")
-                if data:
-                    return SessionData.from_dict(json.loads(data))
-            except Exception as e:
-                print(f"Error retrieving session from Redis: {e}")
-        else:
-            if session_id in self.memory_storage:
-                return self.memory_storage[session_id]
-        
-        return None
+    async def get_session(self, session_id: str) -> Optional[SessionData]:
+        """Retrieve a session by ID (refreshing its TTL)"""
+        used_redis, session = await self._call_redis("load", session_id)
+        if used_redis:
+            return session
+        return self.memory_backend.load(session_id)
     
-    def update_session(self, session: SessionData):
-        """Update an existing session"""
-        session.last_activity = datetime.utcnow().isoformat()
-        self._save_session(session)
+    async def update_session(self, session: SessionData):
+        """Update an existing session (only new interactions are written)"""
+        session.touch()
+        used_redis, _ = await self._call_redis("append", session)
+        if not used_redis:
+            self.memory_backend.append(session)
     
-    def delete_session(self, session_id: str):
+    async def delete_session(self, session_id: str):
         """Delete a session"""
-        if self.redis_client:
-            try:
-                self.redis_client.delete(f"session:{session_id}")
-            except Exception as e:
-                print(f"Error deleting session from Redis: {e}")
-        else:
-            if session_id in self.memory_storage:
-                del self.memory_storage[session_id]
+        await self._call_redis("delete", session_id)
+        self.memory_backend.delete(session_id)
     
-    def _save_session(self, session: SessionData):
+    async def _save_session(self, session: SessionData):
         """Save session to storage backend"""
-        if self.redis_client:
-            try:
-                key = f"session:{session.session_id}"
-                value = json.dumps(session.to_dict())
-                self.redis_client.setex(key, self.session_ttl, value)
-            except Exception as e:
-                print(f"Error saving session to Redis: {e}")
-        else:
-            self.memory_storage[session.session_id] = session
-    
-    def cleanup_expired_sessions(self):
-        """Clean up expired sessions (for in-memory storage only)"""
-        if not self.redis_client:
-            now = datetime.utcnow()
-            expired_sessions = []
-            
-            for session_id, session in self.memory_storage.items():
-                last_activity = datetime.fromisoformat(session.last_activity)
-                if now - last_activity > timedelta(seconds=self.session_ttl):
-                    expired_sessions.append(session_id)
-            
-            for session_id in expired_sessions:
-                del self.memory_storage[session_id]
-            
-            if expired_sessions:
-                print(f"Cleaned up {len(expired_sessions)} expired sessions")
-    
-    def get_or_create_session(self, session_id: str = None) -> SessionData:
+        used_redis, _ = await self._call_redis("save", session)
+        if not used_redis:
+            self.memory_backend.save(session)
+    
+    def cleanup_expired_sessions(self) -> int:
+        """
+        Clean up expired sessions (for in-memory storage only)
+        
+        Runs every tick in the background once connect() has been awaited;
+        only sessions due in the elapsed ticks are examined.
+        """
+        return self.memory_backend.expire()
+    
+    async def get_or_create_session(self, session_id: str = None) -> SessionData:
         """Get existing session or create new one"""
         if session_id:
-            session = self.get_session(session_id)
+            session = await self.get_session(session_id)
             if session:
                 return session
         
-        return self.create_session(session_id)
+        return await self.create_session(session_id)
+    
+    def get_stats(self) -> Dict:
+        """Get storage backend and circuit breaker state"""
+        return {
+            "backend": "redis" if self.redis_backend else "memory",
+            "memory_sessions": len(self.memory_storage),
+            "memory_expired": self.memory_backend.expired_count,
+            "redis_circuit": self.breaker.get_stats() if self.redis_backend else None,
+            "local_cache": self.redis_backend.local_cache.get_stats() if self.redis_backend else None
+        }
 
 # ============================================================================
 # Global Session Manager Instance
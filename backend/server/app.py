@@ -8,26 +8,46 @@ Provides REST API endpoints for image analysis and audio response.
 import os
 import io
 from typing import Optional
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 # Import services and handlers
-from services.stt_service import init_stt_service
-from services.gemini_service import init_gemini_service
-from services.tts_service import init_tts_service
-from models.session import init_session_manager
+from services.stt_service import init_stt_service, get_stt_service
+from services.gemini_service import (
+    init_gemini_service,
+    get_gemini_service,
+    AI_UNAVAILABLE_MESSAGE,
+    ANALYSIS_ERROR_MESSAGES
+)
+from services.tts_service import init_tts_service, get_tts_service
+from services.executor import init_stage_executor, get_stage_executor, StageExecutor
+from services.audio_codec import get_audio_encoder, DEFAULT_AUDIO_FORMAT
+from services.scene_cache import get_scene_cache
+from services.context_manager import get_context_manager
+from services.rate_limiter import get_rate_limiter
+from services.metrics import render_metrics, get_stage_percentiles
+from models.session import init_session_manager, get_session_manager, SessionManager
 from server.handlers import (
     handle_analyze_request,
+    handle_analyze_request_stream,
     handle_session_reset,
     handle_get_session,
-    generate_error_audio
+    generate_error_audio,
+    AUDIO_FALLBACK_MESSAGES
+)
+from server.readiness import (
+    init_readiness_tracker,
+    get_readiness_tracker,
+    WarmupStep
 )
 from server.middleware import (
     RequestLoggingMiddleware,
     RateLimitMiddleware,
     global_exception_handler,
+    RATE_LIMIT_MESSAGE,
+    UNEXPECTED_ERROR_MESSAGES,
     get_cors_config
 )
 
@@ -39,6 +59,21 @@ load_dotenv()
 # Application Lifespan Management
 # ============================================================================
 
+def _fixed_phrases():
+    """All fixed spoken messages, as (text, language) pairs for TTS prewarming"""
+    phrases = [(RATE_LIMIT_MESSAGE, "en"), (AI_UNAVAILABLE_MESSAGE, "en")]
+    for messages in (UNEXPECTED_ERROR_MESSAGES, AUDIO_FALLBACK_MESSAGES, ANALYSIS_ERROR_MESSAGES):
+        phrases.extend((text, language) for language, text in messages.items())
+    return phrases
+
+# Modules of the jobs sent to the CPU process pool (image conditioning and
+# scene hashing), imported by each worker during warm-up
+CPU_WORKER_MODULES = ("services.image_service", "services.scene_cache")
+
+async def _warm_up_cpu_pool(executor: StageExecutor) -> bool:
+    """Start the CPU pool workers before the first frame arrives"""
+    return await executor.warm_up_cpu(CPU_WORKER_MODULES)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager for startup/shutdown"""
@@ -48,18 +83,51 @@ async def lifespan(app: FastAPI):
     # Initialize services
     gemini_key = os.getenv("GEMINI_API_KEY")
     redis_url = os.getenv("REDIS_URL")
+    session_ttl = int(os.getenv("SESSION_TTL", "1800"))
+    
+    stage_executor = init_stage_executor()
+    readiness = init_readiness_tracker()
     
-    init_stt_service()  # Now using free backends (SpeechRecognition + Vosk)
-    init_gemini_service(gemini_key)
-    init_tts_service()
-    init_session_manager(redis_url)
+    # Load models and warm up services in the background, so liveness
+    # probes are answered while Vosk models load
+    await readiness.start([
+        WarmupStep(
+            "stt", "stt",
+            init=init_stt_service,  # Now using free backends (SpeechRecognition + Vosk)
+            warmup=lambda stt: stt.warm_up()
+        ),
+        WarmupStep(
+            "gemini", "gemini",
+            init=lambda: init_gemini_service(gemini_key, session_ttl),
+            warmup=lambda gemini: gemini.model is not None
+        ),
+        WarmupStep(
+            "tts", "tts",
+            init=init_tts_service,
+            warmup=lambda tts: tts.warm_up(_fixed_phrases())
+        ),
+        WarmupStep(
+            "cpu_pool", "image",
+            init=get_stage_executor,
+            warmup=_warm_up_cpu_pool
+        ),
+        WarmupStep(
+            "session", "session",
+            init=lambda: init_session_manager(redis_url, session_ttl),
+            warmup=SessionManager.connect
+        ),
+    ])
     
-    print("All services initialized successfully!")
+    print("Server accepting connections, services warming up in background...")
     
     yield
     
     # Shutdown
     print("Shutting down backend...")
+    await readiness.stop()
+    await get_session_manager().close()
+    await get_rate_limiter().close()
+    stage_executor.shutdown()
 
 # ============================================================================
 # FastAPI Application
@@ -86,7 +154,8 @@ app.add_middleware(
 # Add request logging middleware
 app.add_middleware(RequestLoggingMiddleware)
 
-# Add rate limiting middleware (10 requests per minute per session)
+# Add rate limiting middleware (10 requests per minute per session, shared
+# by all workers through Redis when REDIS_URL is set)
 app.add_middleware(RateLimitMiddleware, max_requests=10, window_seconds=60)
 
 # Add global exception handler
@@ -107,23 +176,65 @@ async def root():
 
 @app.get("/api/v1/health")
 async def health_check():
-    """Health check endpoint"""
+    """
+    Liveness endpoint
+    
+    Always answers while the process is up, including during warm-up,
+    and reports the current state of every service.
+    """
+    snapshot = get_readiness_tracker().snapshot()
     return {
         "status": "healthy",
-        "services": {
-            "stt": "available",
-            "gemini": "available",
-            "tts": "available",
-            "session": "available"
-        }
+        "ready": snapshot["ready"],
+        "services": {name: state["status"] for name, state in snapshot["services"].items()}
     }
 
+@app.get("/api/v1/ready")
+async def readiness_check():
+    """
+    Readiness endpoint
+    
+    Returns 200 once every service has been initialized and warmed up,
+    503 before that (or if a service failed to start). Includes
+    per-service state and warm-up timings.
+    """
+    snapshot = get_readiness_tracker().snapshot()
+    if snapshot["ready"]:
+        snapshot["stt_recognizer_pool"] = get_stt_service().get_recognizer_pool_stats()
+        snapshot["tts_cache"] = get_tts_service().get_cache_stats()
+        snapshot["scene_cache"] = get_scene_cache().get_stats()
+        snapshot["sessions"] = get_session_manager().get_stats()
+        snapshot["rate_limit"] = get_rate_limiter().get_stats()
+        snapshot["gemini_calls"] = get_gemini_service().get_call_stats()
+        snapshot["gemini_chats"] = get_gemini_service().get_chat_store_stats()
+        snapshot["gemini_context"] = get_context_manager().get_stats()
+        snapshot["gemini_context_cache"] = get_gemini_service().get_context_cache_stats()
+        snapshot["stage_latency"] = get_stage_percentiles()
+    return JSONResponse(
+        content=snapshot,
+        status_code=200 if snapshot["ready"] else 503
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics endpoint
+    
+    Per-stage latency histograms (session, stt, image, gemini, tts,
+    response_write; STT and TTS labelled by backend and language) and
+    per-route request counters, in the Prometheus text format.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.post("/api/v1/analyze")
 async def analyze(
+    request: Request,
     session_id: str = Form(...),
     mode: str = Form(...),
     image: UploadFile = File(...),
-    audio: Optional[UploadFile] = File(None)
+    audio: Optional[UploadFile] = File(None),
+    stream: bool = Form(False),
+    audio_format: Optional[str] = Form(None)
 ):
     """
     Main analysis endpoint
@@ -133,10 +244,19 @@ async def analyze(
     - mode: "snapshot" or "conversation"
     - image: JPEG image file
     - audio: WAV audio file (optional, for conversation mode)
+    - stream: "true" to receive speech sentence by sentence as it is synthesized
+    - audio_format: Output encoding (wav, wav_dac, mulaw, ima_adpcm); may also
+      be sent as the X-Audio-Format header. Defaults to 16kHz 16-bit WAV.
     
     Returns:
-    - Audio stream (MP3 format) with AI response
+    - Audio stream (WAV format) with AI response
     """
+    # Requests arriving during warm-up wait for it instead of stalling on
+    # (or duplicating) model loading
+    ready_timeout = float(os.getenv("READINESS_WAIT_SECONDS", "30"))
+    if not await get_readiness_tracker().wait_until_ready(ready_timeout):
+        raise HTTPException(status_code=503, detail="Service is starting up, please retry")
+    
     try:
         # Get file size limits from environment or use defaults
         MAX_IMAGE_SIZE_MB = float(os.getenv("MAX_IMAGE_SIZE_MB", "5"))
@@ -146,6 +266,13 @@ async def analyze(
         if mode not in ["snapshot", "conversation"]:
             raise HTTPException(status_code=400, detail="Invalid mode. Must be 'snapshot' or 'conversation'")
         
+        # Negotiate output encoding (form field wins over header)
+        audio_format = (audio_format or request.headers.get("x-audio-format") or DEFAULT_AUDIO_FORMAT).lower()
+        try:
+            get_audio_encoder(audio_format)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
         # Validate image format and size
         if not image.filename.lower().endswith(('.jpg', '.jpeg')):
             raise HTTPException(status_code=400, detail="Image must be JPEG format")
@@ -190,12 +317,34 @@ async def analyze(
             if len(audio_data) < 4 or audio_data[:4] != b'RIFF':
                 raise HTTPException(status_code=400, detail="Invalid WAV file")
         
+        # Streaming mode: chunked WAV body, spoken while Gemini is still
+        # generating (no X-Response-Text, the text is not known up front)
+        if stream:
+            audio_chunks, detected_language = await handle_analyze_request_stream(
+                session_id=session_id,
+                mode=mode,
+                image_data=image_data,
+                audio_data=audio_data,
+                audio_format=audio_format
+            )
+            return StreamingResponse(
+                audio_chunks,
+                media_type="audio/wav",
+                headers={
+                    "X-Detected-Language": detected_language,
+                    "X-Audio-Format": audio_format,
+                    "X-Audio-Streaming": "true",
+                    "Content-Disposition": "attachment; filename=response.wav"
+                }
+            )
+        
         # Process request
-        audio_response, response_text, detected_language = await handle_analyze_request(
+        audio_response, response_text, detected_language, audio_format = await handle_analyze_request(
             session_id=session_id,
             mode=mode,
             image_data=image_data,
-            audio_data=audio_data
+            audio_data=audio_data,
+            audio_format=audio_format
         )
         
         if not audio_response:
@@ -208,7 +357,8 @@ async def analyze(
             headers={
                 "X-Response-Text": response_text[:200],  # First 200 chars for debugging
                 "X-Detected-Language": detected_language,
-                "Content-Disposition": f"attachment; filename=response.wav"
+                "X-Audio-Format": audio_format,
+                "Content-Disposition": "attachment; filename=response.wav"
             }
         )
     
@@ -217,7 +367,7 @@ async def analyze(
     except Exception as e:
         print(f"Error in analyze endpoint: {e}")
         # Generate error audio
-        error_audio = generate_error_audio(str(e), "en")
+        error_audio = await get_stage_executor().run("tts", generate_error_audio, str(e), "en")
         if error_audio:
             return StreamingResponse(
                 io.BytesIO(error_audio),
@@ -239,7 +389,7 @@ async def reset_session(session_id: str = Form(...)):
         Success confirmation
     """
     try:
-        success = handle_session_reset(session_id)
+        success = await handle_session_reset(session_id)
         return {
             "status": "success" if success else "failed",
             "session_id": session_id,
@@ -260,7 +410,7 @@ async def get_session(session_id: str):
         Session data or 404 if not found
     """
     try:
-        session_data = handle_get_session(session_id)
+        session_data = await handle_get_session(session_id)
         
         if session_data:
             return JSONResponse(content=session_data)
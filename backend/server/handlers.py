@@ -5,16 +5,25 @@ Implements the main processing pipeline for the Interactive AI Vision Assistant.
 Handles multipart requests, processes audio/image, and returns audio responses.
 """
 
-import io
-import os
-import tempfile
-from typing import Tuple, Optional
-from fastapi import UploadFile
+import time
+import asyncio
+import threading
+from typing import AsyncIterable, AsyncIterator, Callable, Iterator, Tuple, Optional
 
 from services.stt_service import get_stt_service
-from services.gemini_service import get_gemini_service
-from services.tts_service import get_tts_service
-from models.session import get_session_manager
+from services.gemini_service import (
+    get_gemini_service,
+    AI_UNAVAILABLE_MESSAGE,
+    ANALYSIS_ERROR_MESSAGES
+)
+from services.tts_service import get_tts_service, PhraseSplitter, encode_audio
+from services.audio_codec import get_audio_encoder, DEFAULT_AUDIO_FORMAT
+from services.image_service import condition_image, get_image_profile
+from services.scene_cache import compute_dhash, get_scene_cache
+from services.executor import get_stage_executor
+from services.metrics import record_stage
+from models.session import SessionData, get_session_manager
+from server.middleware import log_service_time, UNEXPECTED_ERROR_MESSAGES
 
 # ============================================================================
 # Constants
@@ -22,6 +31,12 @@ from models.session import get_session_manager
 
 SUPPORTED_LANGUAGES = {'en', 'hi'}
 
+# Spoken when speech synthesis of the answer fails
+AUDIO_FALLBACK_MESSAGES = {
+    "en": "Sorry, I couldn't generate audio response.",
+    "hi": "क्षमा करें, मैं ऑडियो प्रतिक्रिया उत्पन्न नहीं कर सका।"
+}
+
 # ============================================================================
 # Helper Functions
 # ============================================================================
@@ -50,95 +65,437 @@ async def handle_analyze_request(
     session_id: str,
     mode: str,
     image_data: bytes,
-    audio_data: Optional[bytes] = None
-) -> Tuple[bytes, str, str]:
+    audio_data: Optional[bytes] = None,
+    audio_format: str = DEFAULT_AUDIO_FORMAT
+) -> Tuple[bytes, str, str, str]:
     """
     Process analyze request and return audio response
     
+    Every blocking call runs on the thread pool of its pipeline stage, so
+    the event loop keeps serving other devices while this request waits
+    on Redis, Google Web Speech, Gemini or gTTS.
+    
     Args:
         session_id: User session ID
         mode: "snapshot" or "conversation"
         image_data: Image data as bytes (JPEG)
         audio_data: Audio data as bytes (WAV, optional)
+        audio_format: Negotiated output encoding (wav, wav_dac, mulaw, ima_adpcm)
     
     Returns:
-        Tuple of (audio_data, response_text, detected_language)
+        Tuple of (audio_data, response_text, detected_language, audio_format)
     """
-    # Get service instances
-    stt = get_stt_service()
-    gemini = get_gemini_service()
-    tts = get_tts_service()
-    session_mgr = get_session_manager()
+    executor = get_stage_executor()
+    
+    response_text, safe_language = await _generate_response_text(
+        session_id, mode, image_data, audio_data
+    )
+    
+    # Convert response to speech (WAV format for I2S DAC compatibility)
+    audio_response = await _synthesize(response_text, safe_language)
+    
+    if not audio_response:
+        # Fallback error message
+        error_text = AUDIO_FALLBACK_MESSAGES.get(safe_language, AUDIO_FALLBACK_MESSAGES["en"])
+        audio_response = await _synthesize(error_text, safe_language)
+    
+    # Re-encode for the device link if a compact format was negotiated
+    if audio_response and audio_format != DEFAULT_AUDIO_FORMAT:
+        encoded = await executor.run("tts", encode_audio, audio_response, audio_format)
+        if encoded:
+            audio_response = encoded
+        else:
+            audio_format = DEFAULT_AUDIO_FORMAT
+    
+    return audio_response, response_text, safe_language, audio_format
+
+async def handle_analyze_request_stream(
+    session_id: str,
+    mode: str,
+    image_data: bytes,
+    audio_data: Optional[bytes] = None,
+    audio_format: str = DEFAULT_AUDIO_FORMAT
+) -> Tuple[AsyncIterator[bytes], str]:
+    """
+    Process analyze request and return a streaming audio response
+    
+    Gemini's answer is streamed token by token, cut into speakable phrases
+    as they complete, and each phrase is synthesized while the model is
+    still generating the rest. Audio frames are yielded as soon as they are
+    ready, after a single WAV header. The interaction is recorded in the
+    session once generation has finished.
     
-    # Get or create session
-    session = session_mgr.get_or_create_session(session_id)
+    Args:
+        session_id: User session ID
+        mode: "snapshot" or "conversation"
+        image_data: Image data as bytes (JPEG)
+        audio_data: Audio data as bytes (WAV, optional)
+        audio_format: Negotiated output encoding (wav, wav_dac, mulaw, ima_adpcm)
+    
+    Returns:
+        Tuple of (audio_chunk_iterator, detected_language)
+    """
+    # Condition and hash the frame on the CPU pool while the session and STT run
+    image_task = asyncio.ensure_future(_condition_image(image_data, mode))
+    hash_task = asyncio.ensure_future(_hash_scene(image_data))
+    try:
+        session, user_query, detected_language = await _prepare_query(
+            session_id, mode, audio_data
+        )
+        image_data = await image_task
+        scene_hash = await hash_task
+    except BaseException:
+        await _cancel_tasks(image_task, hash_task)
+        raise
+    safe_language = _validate_language(detected_language)
+    
+    scene_cache = get_scene_cache()
+    cached_text = scene_cache.lookup(session_id, scene_hash, user_query, detected_language)
+    
+    async def phrases():
+        splitter = PhraseSplitter()
+        
+        if cached_text:
+            # Same question about the same scene: replay the previous answer
+            # (its phrases are usually still in the TTS cache)
+            print(f"Scene cache hit: {cached_text[:100]}...")
+            for phrase in splitter.feed(cached_text) + splitter.flush():
+                yield phrase
+            get_gemini_service().record_turn(session_id, user_query, cached_text, detected_language)
+            await _record_interaction(session, user_query, safe_language, cached_text)
+            return
+        
+        gemini = get_gemini_service()
+        fragments = []
+        # Timed by hand: this generator runs while the response streams
+        started = time.perf_counter()
+        
+        async for fragment in iterate_in_stage(
+            "gemini",
+            gemini.analyze_image_stream,
+            image_data=image_data,
+            user_query=user_query,
+            chat_history=session.chat_history,
+            language=detected_language,
+            session_id=session_id,
+            scene_hash=scene_hash
+        ):
+            fragments.append(fragment)
+            for phrase in splitter.feed(fragment):
+                yield phrase
+        
+        record_stage("gemini", time.perf_counter() - started)
+        for phrase in splitter.flush():
+            yield phrase
+        
+        response_text = "".join(fragments).strip()
+        print(f"Gemini response: {response_text[:100]}...")
+        if _is_reusable_answer(response_text):
+            scene_cache.store(session_id, scene_hash, user_query, detected_language, response_text)
+        await _record_interaction(session, user_query, safe_language, response_text)
+    
+    return stream_speech(phrases(), safe_language, audio_format), safe_language
+
+async def _generate_response_text(
+    session_id: str,
+    mode: str,
+    image_data: bytes,
+    audio_data: Optional[bytes] = None
+) -> Tuple[str, str]:
+    """
+    Run session load, STT and Gemini, and record the interaction
+    
+    Returns:
+        Tuple of (response_text, validated_language)
+    """
+    # Condition and hash the frame on the CPU pool while the session and STT run
+    image_task = asyncio.ensure_future(_condition_image(image_data, mode))
+    hash_task = asyncio.ensure_future(_hash_scene(image_data))
+    try:
+        session, user_query, detected_language = await _prepare_query(
+            session_id, mode, audio_data
+        )
+        image_data = await image_task
+        scene_hash = await hash_task
+    except BaseException:
+        await _cancel_tasks(image_task, hash_task)
+        raise
+    
+    # Same question about the same scene: reuse the previous answer
+    scene_cache = get_scene_cache()
+    response_text = scene_cache.lookup(session_id, scene_hash, user_query, detected_language)
+    
+    if response_text:
+        print(f"Scene cache hit: {response_text[:100]}...")
+        get_gemini_service().record_turn(session_id, user_query, response_text, detected_language)
+    else:
+        response_text = await _analyze_scene(
+            session, image_data, user_query, detected_language, scene_hash
+        )
+        
+        print(f"Gemini response: {response_text[:100]}...")
+        
+        if _is_reusable_answer(response_text):
+            scene_cache.store(session_id, scene_hash, user_query, detected_language, response_text)
+    
+    # Validate and sanitize language
+    safe_language = _validate_language(detected_language)
+    
+    await _record_interaction(session, user_query, safe_language, response_text)
+    
+    return response_text, safe_language
+
+async def _prepare_query(
+    session_id: str,
+    mode: str,
+    audio_data: Optional[bytes] = None
+) -> Tuple[SessionData, str, str]:
+    """
+    Load the session and transcribe the spoken query, if any
+    
+    Returns:
+        Tuple of (session, user_query, detected_language)
+    """
+    # Get or create session (async Redis, overlaps with transcription)
+    session_task = asyncio.ensure_future(_load_session(session_id))
     
     # Initialize variables
     user_query = ""
-    detected_language = session.detected_language or "en"
     
     # Process audio if in conversation mode
     if mode == "conversation" and audio_data:
         # Transcribe audio
-        transcribed_text, lang = stt.transcribe(audio_data, "wav")
+        try:
+            transcribed_text, lang = await _transcribe(audio_data)
+        except BaseException:
+            session_task.cancel()
+            raise
+        session = await session_task
         user_query = transcribed_text
         detected_language = lang
         
         print(f"Transcribed query: '{user_query}' (language: {detected_language})")
     else:
+        session = await session_task
+        detected_language = session.detected_language or "en"
         # Snapshot mode - use default language or session language
         if not session.detected_language:
             detected_language = "en"
     
-    # Save image temporarily for session tracking
-    image_path = f"temp_{session_id}.jpg"
-    
-    # Analyze image with Gemini
-    response_text = gemini.analyze_image(
-        image_data=image_data,
-        user_query=user_query,
-        chat_history=session.chat_history,
-        language=detected_language,
-        session_id=session_id
+    return session, user_query, detected_language
+
+@log_service_time("session")
+async def _load_session(session_id: str) -> SessionData:
+    """Get or create the session"""
+    return await get_session_manager().get_or_create_session(session_id)
+
+@log_service_time("stt")
+async def _transcribe(audio_data: bytes) -> Tuple[str, str]:
+    """Transcribe the spoken query on the STT stage (labelled with backend and language)"""
+    return await get_stage_executor().run("stt", get_stt_service().transcribe, audio_data, "wav")
+
+@log_service_time("gemini")
+async def _analyze_scene(session: SessionData, image_data: bytes, user_query: str,
+                         language: str, scene_hash: Optional[int]) -> str:
+    """
+    Analyze image with Gemini (async client with deadline, retries and
+    hedging; shares the gemini stage's concurrency limit)
+    """
+    async with get_stage_executor().limit("gemini"):
+        return await get_gemini_service().analyze_image_async(
+            image_data=image_data,
+            user_query=user_query,
+            chat_history=session.chat_history,
+            language=language,
+            session_id=session.session_id,
+            scene_hash=scene_hash
+        )
+
+@log_service_time("tts")
+async def _synthesize(text: str, language: str) -> Optional[bytes]:
+    """Synthesize a whole answer as WAV (labelled with the TTS backend)"""
+    return await get_stage_executor().run(
+        "tts",
+        get_tts_service().synthesize,
+        text=text,
+        language=language,
+        output_format="wav"
     )
+
+@log_service_time("tts")
+async def _synthesize_pcm(text: str, language: str) -> Optional[bytes]:
+    """Synthesize one streamed phrase as PCM (labelled with the TTS backend)"""
+    return await get_stage_executor().run("tts", get_tts_service().synthesize_pcm, text, language)
+
+@log_service_time("image")
+async def _condition_image(image_data: bytes, mode: str) -> bytes:
+    """Downscale/recompress the frame for upload, per the mode's profile"""
+    profile = get_image_profile(mode)
+    conditioned = await get_stage_executor().run_cpu(
+        condition_image, image_data, profile["max_side"], profile["quality"]
+    )
+    if len(conditioned) != len(image_data):
+        print(f"Image conditioned for upload: {len(image_data)} -> {len(conditioned)} bytes")
+    return conditioned
+
+async def _hash_scene(image_data: bytes) -> Optional[int]:
+    """Perceptual hash of the original frame, for the scene cache"""
+    return await get_stage_executor().run_cpu(compute_dhash, image_data)
+
+async def _cancel_tasks(*tasks: asyncio.Future):
+    """Cancel the frame tasks of a failed request and collect their outcome"""
+    for task in tasks:
+        task.cancel()
+    # Retrieves their exceptions, so none is logged as never retrieved
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def _is_reusable_answer(response_text: str) -> bool:
+    """Error and fallback messages are never cached as scene answers"""
+    if not response_text or response_text == AI_UNAVAILABLE_MESSAGE:
+        return False
+    return response_text not in ANALYSIS_ERROR_MESSAGES.values()
+
+async def _record_interaction(session: SessionData, user_query: str,
+                              language: str, response_text: str):
+    """Add the finished interaction to the session and persist it"""
+    session_mgr = get_session_manager()
     
-    print(f"Gemini response: {response_text[:100]}...")
-    
-    # Validate and sanitize language
-    safe_language = _validate_language(detected_language)
+    # Save image temporarily for session tracking
+    image_path = f"temp_{session.session_id}.jpg"
     
     # Update session with interaction
     session.add_interaction(
         user_query=user_query if user_query else "[Snapshot Mode]",
-        detected_language=safe_language,
+        detected_language=language,
         image_path=image_path,
         ai_response=response_text
     )
-    session_mgr.update_session(session)
+    await session_mgr.update_session(session)
+
+# ============================================================================
+# Streaming Speech
+# ============================================================================
+
+async def iterate_in_stage(stage: str, func: Callable[..., Iterator],
+                           *args, **kwargs) -> AsyncIterator:
+    """
+    Consume a blocking iterator on a stage thread and yield its items
     
-    # Convert response to speech (WAV format for I2S DAC compatibility)
-    audio_response = tts.synthesize(
-        text=response_text,
-        language=safe_language,
-        output_format="wav"
-    )
+    Args:
+        stage: Executor stage whose thread pool runs the iterator
+        func: Callable returning the blocking iterator
+        *args, **kwargs: Arguments passed to func
     
-    if not audio_response:
-        # Fallback error message
-        error_messages = {
-            "en": "Sorry, I couldn't generate audio response.",
-            "hi": "क्षमा करें, मैं ऑडियो प्रतिक्रिया उत्पन्न नहीं कर सका।"
-        }
-        error_text = error_messages.get(safe_language, error_messages["en"])
-        audio_response = tts.synthesize(error_text, safe_language, "wav")
+    Yields:
+        Items of the iterator, as soon as each one is produced
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stopped = threading.Event()
+    done = object()
+    
+    def pump():
+        try:
+            for item in func(*args, **kwargs):
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
     
-    return audio_response, response_text, safe_language
+    producer = asyncio.ensure_future(get_stage_executor().run(stage, pump))
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            yield item
+        # Surface errors raised by the iterator
+        await producer
+    finally:
+        # Consumer went away early: let the worker thread stop
+        stopped.set()
+
+async def stream_speech(phrases: AsyncIterable[str], language: str,
+                        audio_format: str = DEFAULT_AUDIO_FORMAT,
+                        prefetch: int = 2) -> AsyncIterator[bytes]:
+    """
+    Synthesize phrases in order and yield a streaming WAV body
+    
+    The WAV header is yielded first, then the encoded frames of each phrase.
+    Up to `prefetch` phrases are synthesized ahead of the one being sent.
+    
+    Args:
+        phrases: Phrases to speak, in order
+        language: Validated language code (en, hi)
+        audio_format: Negotiated output encoding
+        prefetch: Maximum phrases synthesized ahead
+    
+    Yields:
+        WAV header, then audio chunks in the negotiated encoding
+    """
+    executor = get_stage_executor()
+    encoder = get_audio_encoder(audio_format)
+    
+    async def encode(pcm: bytes) -> bytes:
+        if audio_format == DEFAULT_AUDIO_FORMAT:
+            return pcm
+        # Encoders are stateful, so chunks are encoded strictly in order
+        return await executor.run("tts", encoder.encode, pcm)
+    
+    yield encoder.header()
+    
+    pending = asyncio.Queue(maxsize=prefetch)
+    done = object()
+    
+    async def schedule():
+        try:
+            async for phrase in phrases:
+                await pending.put(asyncio.ensure_future(_synthesize_pcm(phrase, language)))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Headers are already sent, so end the speech where it stopped
+            print(f"Error while producing phrases for streaming: {e}")
+        await pending.put(done)
+    
+    scheduler = asyncio.ensure_future(schedule())
+    sent_audio = False
+    
+    try:
+        while True:
+            task = await pending.get()
+            if task is done:
+                break
+            pcm = await task
+            if pcm:
+                sent_audio = True
+                chunk = await encode(pcm)
+                if chunk:
+                    yield chunk
+        
+        if not sent_audio:
+            error_text = AUDIO_FALLBACK_MESSAGES.get(language, AUDIO_FALLBACK_MESSAGES["en"])
+            pcm = await _synthesize_pcm(error_text, language)
+            if pcm:
+                yield await encode(pcm)
+        
+        tail = encoder.flush()
+        if tail:
+            yield tail
+    finally:
+        # Client went away mid-stream: drop generation and prefetched phrases
+        scheduler.cancel()
+        while not pending.empty():
+            task = pending.get_nowait()
+            if task is not done:
+                task.cancel()
 
 # ============================================================================
 # Session Reset Handler
 # ============================================================================
 
-def handle_session_reset(session_id: str) -> bool:
+async def handle_session_reset(session_id: str) -> bool:
     """
     Reset a user session
     
@@ -152,11 +509,14 @@ def handle_session_reset(session_id: str) -> bool:
     gemini = get_gemini_service()
     
     # Clear session from session manager
-    session_mgr.delete_session(session_id)
+    await session_mgr.delete_session(session_id)
     
     # Clear Gemini chat history
     gemini.clear_session(session_id)
     
+    # Forget answers cached for this session's scenes
+    get_scene_cache().clear_session(session_id)
+    
     print(f"Session reset: {session_id}")
     return True
 
@@ -164,7 +524,7 @@ def handle_session_reset(session_id: str) -> bool:
 # Session Retrieval Handler
 # ============================================================================
 
-def handle_get_session(session_id: str) -> Optional[dict]:
+async def handle_get_session(session_id: str) -> Optional[dict]:
     """
     Retrieve session information
     
@@ -175,7 +535,7 @@ def handle_get_session(session_id: str) -> Optional[dict]:
         Session data as dictionary or None
     """
     session_mgr = get_session_manager()
-    session = session_mgr.get_session(session_id)
+    session = await session_mgr.get_session(session_id)
     
     if session:
         return session.to_dict()
@@ -190,8 +550,12 @@ def generate_error_audio(error_message: str, language: str = "en") -> bytes:
     """
     Generate audio for error message
     
+    The spoken text is a fixed phrase (prewarmed into the TTS cache at
+    startup); the error itself is only logged, since it would make every
+    error's text unique and uncacheable.
+    
     Args:
-        error_message: Error message text
+        error_message: Error message text (logged, not spoken)
         language: Language code (en, hi)
     
     Returns:
@@ -199,19 +563,11 @@ def generate_error_audio(error_message: str, language: str = "en") -> bytes:
     """
     tts = get_tts_service()
     
-    # Handle empty/None error messages
-    if not error_message:
-        error_message = "unknown error"
-    
     # Validate language
     safe_language = _validate_language(language)
     
-    error_messages = {
-        "en": f"Sorry, an error occurred: {error_message}",
-        "hi": f"क्षमा करें, एक त्रुटि हुई: {error_message}"
-    }
-    
-    text = error_messages.get(safe_language, error_messages["en"])
+    print(f"Speaking error message for: {error_message or 'unknown error'}")
+    text = UNEXPECTED_ERROR_MESSAGES.get(safe_language, UNEXPECTED_ERROR_MESSAGES["en"])
     audio_data = tts.synthesize(text, safe_language, "wav")
     
     return audio_data if audio_data else b""
@@ -1,52 +1,116 @@
 """
 Middleware and Error Handling Module
 
-Provides global exception handling, request logging, and rate limiting.
+Provides global exception handling, request logging (with per-stage
+Server-Timing), and rate limiting.
+The middlewares are plain ASGI callables (not BaseHTTPMiddleware), so they
+add no per-request task or stream wrapping and leave streaming responses
+and the request body untouched.
 """
 
+import math
 import time
+import asyncio
+import functools
 import traceback
 from fastapi import Request, Response
 from fastapi.responses import StreamingResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from collections import defaultdict
-from datetime import datetime, timedelta
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
 import io
 
 from services.tts_service import get_tts_service
+from services.executor import get_stage_executor
+from services.rate_limiter import init_rate_limiter
+from services.metrics import (
+    REQUEST_SECONDS,
+    REQUESTS,
+    start_request_timings,
+    record_stage,
+    time_stage,
+    server_timing_header
+)
+
+# ============================================================================
+# Fixed Spoken Messages (prewarmed into the TTS audio cache at startup)
+# ============================================================================
+
+RATE_LIMIT_MESSAGE = "Rate limit exceeded. Please wait before making another request."
+
+UNEXPECTED_ERROR_MESSAGES = {
+    "en": "Sorry, an unexpected error occurred. Please try again.",
+    "hi": "क्षमा करें, एक अप्रत्याशित त्रुटि हुई। कृपया पुनः प्रयास करें।"
+}
 
 # ============================================================================
 # Request Logging Middleware
 # ============================================================================
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    """Middleware for logging request details and processing time"""
+def _route_label(scope: Dict) -> str:
+    """Path template of the matched route (keeps metric label sets small)"""
+    if "endpoint" not in scope:
+        return "unmatched"
+    path = scope["path"]
+    for name, value in (scope.get("path_params") or {}).items():
+        path = path.replace(str(value), "{" + name + "}")
+    return path
+
+class RequestLoggingMiddleware:
+    """Middleware for logging request details, processing time and stage timings (ASGI)"""
+    
+    def __init__(self, app):
+        self.app = app
     
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
         # Log request start
         start_time = time.time()
+        timings = start_request_timings()
+        headers_sent_at = None
         
         # Extract request metadata
-        client_ip = request.client.host if request.client else "unknown"
-        method = request.method
-        path = request.url.path
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+        method = scope["method"]
+        path = scope["path"]
         
         print(f"[{datetime.utcnow().isoformat()}] {method} {path} from {client_ip}")
         
+        async def send_with_timing(message):
+            nonlocal headers_sent_at
+            if message["type"] == "http.response.start":
+                # Log response (when its headers are sent, as before)
+                headers_sent_at = time.time()
+                process_time = headers_sent_at - start_time
+                status_code = message["status"]
+                
+                print(f"[{datetime.utcnow().isoformat()}] {method} {path} - Status: {status_code} - Time: {process_time:.2f}s")
+                
+                route = _route_label(scope)
+                REQUEST_SECONDS.observe(process_time, method=method, route=route)
+                REQUESTS.inc(method=method, route=route, status=status_code)
+                
+                # Add processing time and the stages finished so far
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-process-time", str(process_time).encode("latin-1")),
+                    (b"server-timing", server_timing_header(timings, process_time).encode("latin-1"))
+                ]
+                await send(message)
+                return
+            
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Body fully handed to the server (the whole stream, when streaming)
+                record_stage("response_write", time.time() - headers_sent_at)
+        
         # Process request
         try:
-            response = await call_next(request)
-            
-            # Log response
-            process_time = time.time() - start_time
-            status_code = response.status_code
-            
-            print(f"[{datetime.utcnow().isoformat()}] {method} {path} - Status: {status_code} - Time: {process_time:.2f}s")
-            
-            # Add processing time header
-            response.headers["X-Process-Time"] = str(process_time)
-            
-            return response
+            await self.app(scope, receive, send_with_timing)
             
         except Exception as e:
             # Log error
@@ -54,12 +118,173 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
             traceback.print_exc()
             raise
 
+# ============================================================================
+# Rate Limit Key Extraction
+# ============================================================================
+
+# Headers/query parameter that identify the device without reading the body
+RATE_LIMIT_KEY_HEADERS = (b"x-session-id", b"x-device-id")
+RATE_LIMIT_KEY_FIELD = "session_id"
+
+# Upper bound on body bytes inspected to find the key in a multipart form
+MAX_KEY_SCAN_BYTES = 4096
+MAX_KEY_LENGTH = 128
+
+def _valid_key(value: Optional[str]) -> Optional[str]:
+    """Stripped key, or None if empty or implausibly long"""
+    if not value:
+        return None
+    value = value.strip()
+    if not value or len(value) > MAX_KEY_LENGTH:
+        return None
+    return value
+
+def _header_or_query_key(scope: Dict) -> Optional[str]:
+    """Rate limit key from X-Session-Id / X-Device-Id or the query string"""
+    headers = dict(scope.get("headers") or [])
+    for name in RATE_LIMIT_KEY_HEADERS:
+        key = _valid_key(headers.get(name, b"").decode("latin-1"))
+        if key:
+            return key
+    
+    if scope.get("method") == "POST" and scope.get("query_string"):
+        values = parse_qs(scope["query_string"].decode("latin-1")).get(RATE_LIMIT_KEY_FIELD)
+        if values:
+            return _valid_key(values[0])
+    return None
+
+def _multipart_boundary(scope: Dict) -> Optional[bytes]:
+    """Boundary of a multipart/form-data POST, or None"""
+    if scope.get("method") != "POST":
+        return None
+    content_type = dict(scope.get("headers") or []).get(b"content-type", b"").decode("latin-1")
+    if not content_type.lower().startswith("multipart/form-data"):
+        return None
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "boundary" and value:
+            return value.strip('"').encode("latin-1")
+    return None
+
+def _parse_first_field(buffer: bytes, boundary: bytes) -> Tuple[bool, Optional[str]]:
+    """
+    Look for the key in the first part of a (partial) multipart body
+    
+    Args:
+        buffer: Body bytes received so far
+        boundary: Multipart boundary
+    
+    Returns:
+        (done, key): done is False while more bytes are needed to decide
+    """
+    delimiter = b"--" + boundary
+    start = buffer.find(delimiter + b"\r\n")
+    if start < 0:
+        return False, None
+    headers_start = start + len(delimiter) + 2
+    headers_end = buffer.find(b"\r\n\r\n", headers_start)
+    if headers_end < 0:
+        return False, None
+    
+    part_headers = buffer[headers_start:headers_end].decode("latin-1").lower()
+    if f'name="{RATE_LIMIT_KEY_FIELD}"' not in part_headers:
+        # Only the first field is inspected; never scan into the image
+        return True, None
+    
+    value_start = headers_end + 4
+    value_end = buffer.find(b"\r\n" + delimiter, value_start)
+    if value_end < 0:
+        return False, None
+    return True, _valid_key(buffer[value_start:value_end].decode("utf-8", errors="ignore"))
+
+async def _scan_multipart_key(receive, boundary: bytes) -> Tuple[Optional[str], List[Dict]]:
+    """
+    Read just enough of the body to find the key in the first form field
+    
+    Args:
+        receive: ASGI receive callable
+        boundary: Multipart boundary
+    
+    Returns:
+        (key or None, ASGI messages consumed, to be replayed downstream)
+    """
+    messages = []
+    buffer = b""
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            return None, messages
+        
+        # Keep at most MAX_KEY_SCAN_BYTES; large chunks are not copied
+        if len(buffer) < MAX_KEY_SCAN_BYTES:
+            buffer += message.get("body", b"")[:MAX_KEY_SCAN_BYTES - len(buffer)]
+        done, key = _parse_first_field(buffer, boundary)
+        if done or len(buffer) >= MAX_KEY_SCAN_BYTES or not message.get("more_body", False):
+            return key, messages
+
+def _replay_receive(messages: List[Dict], receive):
+    """Receive callable that returns already-read messages first"""
+    pending = deque(messages)
+    
+    async def replay():
+        if pending:
+            return pending.popleft()
+        return await receive()
+    
+    return replay
+
+async def extract_rate_limit_key(scope: Dict, receive) -> Tuple[str, object]:
+    """
+    Identify the client for rate limiting without buffering the upload
+    
+    Tries the X-Session-Id / X-Device-Id headers and the session_id query
+    parameter, then the first field of a multipart form (bounded scan),
+    then falls back to the client IP.
+    
+    Args:
+        scope: ASGI scope
+        receive: ASGI receive callable
+    
+    Returns:
+        (key, receive callable to pass downstream)
+    """
+    key = _header_or_query_key(scope)
+    
+    if not key:
+        boundary = _multipart_boundary(scope)
+        if boundary:
+            try:
+                key, messages = await _scan_multipart_key(receive, boundary)
+                receive = _replay_receive(messages, receive)
+            except Exception as e:
+                print(f"Could not extract session_id from form: {e}")
+    
+    if not key:
+        # Use IP address as fallback
+        client = scope.get("client")
+        key = client[0] if client else "unknown"
+    
+    return key, receive
+
 # ============================================================================
 # Rate Limiting Middleware
 # ============================================================================
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """Simple rate limiting middleware"""
+# Probes polled by load balancers and orchestrators, and the Prometheus
+# scrape; throttling them would mark a healthy worker as down or drop samples
+RATE_LIMIT_EXEMPT_PATHS = frozenset({
+    "/api/v1/health",
+    "/api/v1/ready",
+    "/metrics"
+})
+
+def _is_rate_limit_exempt(scope: Dict) -> bool:
+    """Probe and metrics reads are never limited"""
+    return scope["method"] in ("GET", "HEAD") and scope["path"] in RATE_LIMIT_EXEMPT_PATHS
+
+class RateLimitMiddleware:
+    """Per-client rate limiting middleware"""
     
     def __init__(self, app, max_requests: int = 10, window_seconds: int = 60):
         """
@@ -70,78 +295,57 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             max_requests: Maximum requests per window
             window_seconds: Time window in seconds
         """
-        super().__init__(app)
-        self.max_requests = max_requests
-        self.window_seconds = window_seconds
-        self.request_counts = defaultdict(list)
-    
-    async def dispatch(self, request: Request, call_next):
-        # Get session ID from form data or query params
-        session_id = None
-        
-        if request.method == "POST":
-            # Try to get session_id from query params first
-            session_id = request.query_params.get("session_id")
-            
-            # If not in query params, try to extract from multipart form data
-            if not session_id:
-                content_type = request.headers.get("content-type", "")
-                if "multipart/form-data" in content_type:
-                    try:
-                        # Clone the body stream for peeking
-                        body = await request.body()
-                        # Simple extraction: look for session_id field in form data
-                        body_str = body.decode('utf-8', errors='ignore')
-                        import re
-                        match = re.search(r'name="session_id"\r?\n\r?\n([^\r\n]+)', body_str)
-                        if match:
-                            session_id = match.group(1).strip()
-                    except Exception as e:
-                        print(f"Could not extract session_id from form: {e}")
-        
-        if not session_id:
-            # Use IP address as fallback
-            session_id = request.client.host if request.client else "unknown"
-        
-        # Check rate limit
-        now = datetime.utcnow()
-        cutoff_time = now - timedelta(seconds=self.window_seconds)
+        self.app = app
+        self.limiter = init_rate_limiter(max_requests, window_seconds)
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _is_rate_limit_exempt(scope):
+            await self.app(scope, receive, send)
+            return
         
-        # Remove old requests
-        self.request_counts[session_id] = [
-            req_time for req_time in self.request_counts[session_id]
-            if req_time > cutoff_time
-        ]
+        session_id, receive = await extract_rate_limit_key(scope, receive)
+        result = await self.limiter.check(session_id)
+        quota_headers = {
+            "X-RateLimit-Limit": str(result.limit),
+            "X-RateLimit-Remaining": str(result.remaining)
+        }
         
         # Check if limit exceeded
-        if len(self.request_counts[session_id]) >= self.max_requests:
+        if not result.allowed:
             print(f"Rate limit exceeded for session: {session_id}")
+            quota_headers["Retry-After"] = str(max(1, math.ceil(result.retry_after)))
             
             # Generate error audio
             tts = get_tts_service()
-            error_text = "Rate limit exceeded. Please wait before making another request."
-            audio_data = tts.synthesize(error_text, "en", "wav")
+            audio_data = await get_stage_executor().run("tts", tts.synthesize, RATE_LIMIT_MESSAGE, "en", "wav")
             
             if audio_data:
-                return StreamingResponse(
+                response = StreamingResponse(
                     io.BytesIO(audio_data),
                     media_type="audio/wav",
                     status_code=429,
-                    headers={"X-Rate-Limit-Exceeded": "true"}
+                    headers={"X-Rate-Limit-Exceeded": "true", **quota_headers}
                 )
             else:
-                return Response(
+                response = Response(
                     content="Rate limit exceeded",
                     status_code=429,
-                    media_type="text/plain"
+                    media_type="text/plain",
+                    headers=quota_headers
                 )
+            await response(scope, receive, send)
+            return
         
-        # Add current request
-        self.request_counts[session_id].append(now)
+        # Process request, reporting the remaining quota
+        raw_headers = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                       for name, value in quota_headers.items()]
         
-        # Process request
-        response = await call_next(request)
-        return response
+        async def send_with_quota(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + raw_headers
+            await send(message)
+        
+        await self.app(scope, receive, send_with_quota)
 
 # ============================================================================
 # Global Exception Handler
@@ -173,13 +377,8 @@ async def global_exception_handler(request: Request, exc: Exception) -> Response
     # Generate error audio
     tts = get_tts_service()
     
-    error_messages = {
-        "en": "Sorry, an unexpected error occurred. Please try again.",
-        "hi": "क्षमा करें, एक अप्रत्याशित त्रुटि हुई। कृपया पुनः प्रयास करें।"
-    }
-    
-    error_text = error_messages.get(language, error_messages["en"])
-    audio_data = tts.synthesize(error_text, language, "wav")
+    error_text = UNEXPECTED_ERROR_MESSAGES.get(language, UNEXPECTED_ERROR_MESSAGES["en"])
+    audio_data = await get_stage_executor().run("tts", tts.synthesize, error_text, language, "wav")
     
     if audio_data:
         return StreamingResponse(
@@ -204,28 +403,28 @@ async def global_exception_handler(request: Request, exc: Exception) -> Response
 
 def log_service_time(service_name: str):
     """
-    Decorator to log service processing time
+    Decorator to time a function as a pipeline stage
+    
+    The duration goes to the stage latency histogram (/metrics) and to the
+    Server-Timing header of the current request. Code running inside the
+    function, including stage threads, can label the stage (backend,
+    language) with annotate_stage().
     
     Args:
-        service_name: Name of the service
+        service_name: Name of the service (stage)
     """
     def decorator(func):
+        @functools.wraps(func)
         async def async_wrapper(*args, **kwargs):
-            start_time = time.time()
-            result = await func(*args, **kwargs)
-            elapsed_time = time.time() - start_time
-            print(f"[TIMING] {service_name}: {elapsed_time:.2f}s")
-            return result
+            with time_stage(service_name):
+                return await func(*args, **kwargs)
         
+        @functools.wraps(func)
         def sync_wrapper(*args, **kwargs):
-            start_time = time.time()
-            result = func(*args, **kwargs)
-            elapsed_time = time.time() - start_time
-            print(f"[TIMING] {service_name}: {elapsed_time:.2f}s")
-            return result
+            with time_stage(service_name):
+                return func(*args, **kwargs)
         
         # Check if function is async
-        import asyncio
         if asyncio.iscoroutinefunction(func):
             return async_wrapper
         else:
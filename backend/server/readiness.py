@@ -0,0 +1,202 @@
+"""
+Readiness Tracking Module
+
+Runs service initialization and warm-up in the background after the server
+has started accepting connections, and records per-service state and timings.
+Liveness probes are answered immediately; readiness is only reported once
+every service has finished warming up.
+"""
+
+import time
+import asyncio
+import traceback
+from typing import Callable, Dict, List, Optional
+
+from services.executor import get_stage_executor
+
+# ============================================================================
+# Service States
+# ============================================================================
+
+STATUS_PENDING = "pending"          # not started yet
+STATUS_STARTING = "starting"        # initialization running
+STATUS_WARMING = "warming"          # initialized, warm-up running
+STATUS_READY = "ready"              # initialized and warmed up
+STATUS_DEGRADED = "degraded"        # initialized, but warm-up failed
+STATUS_UNAVAILABLE = "unavailable"  # initialized without a usable backend
+STATUS_FAILED = "failed"            # initialization raised
+
+FINISHED_STATES = {STATUS_READY, STATUS_DEGRADED, STATUS_UNAVAILABLE, STATUS_FAILED}
+
+# ============================================================================
+# Warm-up Step
+# ============================================================================
+
+class WarmupStep:
+    """Initialization and warm-up of one service"""
+
+    def __init__(self, name: str, stage: str, init: Callable,
+                 warmup: Optional[Callable] = None):
+        """
+        Initialize warm-up step
+
+        Args:
+            name: Service name reported by the health/readiness endpoints
+            stage: Executor stage whose thread pool runs the blocking calls
+            init: Blocking callable creating the service; returns it
+            warmup: Optional callable taking the service; returns True if
+                    the service is usable, False if it has no backend.
+                    Coroutine functions are awaited on the event loop,
+                    other callables run on the stage's thread pool.
+        """
+        self.name = name
+        self.stage = stage
+        self.init = init
+        self.warmup = warmup
+
+# ============================================================================
+# Readiness Tracker Class
+# ============================================================================
+
+class ReadinessTracker:
+    """Tracks background startup of all services"""
+
+    def __init__(self):
+        self.services = {}
+        self.started_at = None
+        self.ready_at = None
+        self.task = None
+        self.ready_event = None
+
+    async def start(self, steps: List[WarmupStep]):
+        """
+        Start initializing and warming up services in the background
+
+        Args:
+            steps: One warm-up step per service; steps run concurrently
+        """
+        self.started_at = time.monotonic()
+        self.ready_event = asyncio.Event()
+        for step in steps:
+            self.services[step.name] = {
+                "status": STATUS_PENDING,
+                "init_seconds": None,
+                "warmup_seconds": None,
+                "error": None
+            }
+        self.task = asyncio.ensure_future(self._run(steps))
+
+    async def _run(self, steps: List[WarmupStep]):
+        """Run all steps, then mark the tracker ready"""
+        await asyncio.gather(*(self._run_step(step) for step in steps))
+
+        self.ready_at = time.monotonic()
+        total = self.ready_at - self.started_at
+        states = {name: state["status"] for name, state in self.services.items()}
+        print(f"Service warm-up finished in {total:.2f}s: {states}")
+        self.ready_event.set()
+
+    async def _run_step(self, step: WarmupStep):
+        """Initialize and warm up one service, recording state and timings"""
+        state = self.services[step.name]
+        executor = get_stage_executor()
+
+        state["status"] = STATUS_STARTING
+        start_time = time.monotonic()
+        try:
+            service = await executor.run(step.stage, step.init)
+        except Exception as e:
+            state["status"] = STATUS_FAILED
+            state["error"] = str(e)
+            print(f"Initialization of {step.name} failed: {e}")
+            traceback.print_exc()
+            return
+        finally:
+            state["init_seconds"] = round(time.monotonic() - start_time, 3)
+
+        if not step.warmup:
+            state["status"] = STATUS_READY
+            return
+
+        state["status"] = STATUS_WARMING
+        start_time = time.monotonic()
+        try:
+            if asyncio.iscoroutinefunction(step.warmup):
+                usable = await step.warmup(service)
+            else:
+                usable = await executor.run(step.stage, step.warmup, service)
+            state["status"] = STATUS_READY if usable else STATUS_UNAVAILABLE
+        except Exception as e:
+            state["status"] = STATUS_DEGRADED
+            state["error"] = str(e)
+            print(f"Warm-up of {step.name} failed: {e}")
+        finally:
+            state["warmup_seconds"] = round(time.monotonic() - start_time, 3)
+
+    def is_ready(self) -> bool:
+        """True once every service finished starting and none failed"""
+        if not self.ready_event or not self.ready_event.is_set():
+            return False
+        return all(state["status"] != STATUS_FAILED for state in self.services.values())
+
+    async def wait_until_ready(self, timeout: float) -> bool:
+        """
+        Wait for warm-up to finish
+
+        Args:
+            timeout: Maximum seconds to wait
+
+        Returns:
+            True if the service is ready
+        """
+        if not self.ready_event:
+            return False
+        if not self.ready_event.is_set():
+            try:
+                await asyncio.wait_for(asyncio.shield(self.ready_event.wait()), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return self.is_ready()
+
+    def snapshot(self) -> Dict:
+        """Get per-service state and timings for the health endpoints"""
+        if self.ready_at is not None:
+            startup_seconds = round(self.ready_at - self.started_at, 3)
+        elif self.started_at is not None:
+            startup_seconds = round(time.monotonic() - self.started_at, 3)
+        else:
+            startup_seconds = None
+
+        return {
+            "ready": self.is_ready(),
+            "startup_seconds": startup_seconds,
+            "services": {name: dict(state) for name, state in self.services.items()}
+        }
+
+    async def stop(self):
+        """Cancel warm-up if it is still running"""
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+# ============================================================================
+# Global Readiness Tracker Instance
+# ============================================================================
+
+readiness_tracker = None
+
+def init_readiness_tracker() -> ReadinessTracker:
+    """Initialize the global readiness tracker"""
+    global readiness_tracker
+    readiness_tracker = ReadinessTracker()
+    return readiness_tracker
+
+def get_readiness_tracker() -> ReadinessTracker:
+    """Get the global readiness tracker instance"""
+    global readiness_tracker
+    if readiness_tracker is None:
+        readiness_tracker = ReadinessTracker()
+    return readiness_tracker
@@ -0,0 +1,219 @@
+"""
+Synthesized Audio Cache Module
+
+Content-addressed cache for TTS output. Entries are keyed by a hash of
+text, language, backend and output format, held in an in-memory LRU with a
+byte budget, and optionally persisted to an on-disk store that survives
+restarts. Fixed phrases (error and throttling messages) can be pinned so
+they are never evicted.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# ============================================================================
+# Audio Cache Class
+# ============================================================================
+
+class AudioCache:
+    """Two-tier (memory LRU + optional disk) cache of synthesized audio"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024,
+                 disk_dir: str = None, disk_max_bytes: int = 256 * 1024 * 1024):
+        """
+        Initialize audio cache
+
+        Args:
+            max_bytes: Memory budget for unpinned entries
+            disk_dir: Directory of the on-disk store (None disables it)
+            disk_max_bytes: Size budget of the on-disk store
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self.entries = OrderedDict()   # key -> audio bytes, LRU order
+        self.pinned = {}               # key -> audio bytes, never evicted
+        self.current_bytes = 0
+        self.disk_index = OrderedDict()  # key -> file size, LRU order
+        self.disk_bytes = 0
+        self.lock = threading.Lock()
+
+        self.stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "disk_evictions": 0
+        }
+
+        if self.disk_dir:
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(text: str, language: str, backend: str, output_format: str) -> str:
+        """Build the content address of a synthesized phrase"""
+        material = "\x1f".join((backend or "", output_format, language, text))
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Look up audio by key
+
+        Returns:
+            Cached audio bytes or None on a miss
+        """
+        with self.lock:
+            data = self.pinned.get(key)
+            if data is None:
+                data = self.entries.get(key)
+                if data is not None:
+                    self.entries.move_to_end(key)
+            if data is not None:
+                self.stats["hits"] += 1
+                return data
+
+        data = self._disk_read(key)
+        with self.lock:
+            if data is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self._memory_store(key, data)
+        return data
+
+    def put(self, key: str, data: bytes, pin: bool = False):
+        """
+        Store audio under key
+
+        Args:
+            key: Key from make_key
+            data: Audio bytes
+            pin: Keep in memory regardless of the byte budget
+        """
+        if not data:
+            return
+
+        with self.lock:
+            self.stats["stores"] += 1
+            if pin:
+                if key in self.entries:
+                    self.current_bytes -= len(self.entries.pop(key))
+                self.pinned[key] = data
+            elif key not in self.pinned:
+                self._memory_store(key, data)
+
+        self._disk_write(key, data)
+
+    def get_stats(self) -> Dict:
+        """Get hit/miss counters and current sizes"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats.update({
+                "entries": len(self.entries),
+                "pinned": len(self.pinned),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self.disk_index),
+                "disk_bytes": self.disk_bytes
+            })
+        return stats
+
+    def _memory_store(self, key: str, data: bytes):
+        """Insert into the memory LRU and evict down to the byte budget (lock held)"""
+        if len(data) > self.max_bytes:
+            return
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= len(old)
+
+        self.entries[key] = data
+        self.current_bytes += len(data)
+
+        while self.current_bytes > self.max_bytes and self.entries:
+            _, evicted = self.entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+            self.stats["evictions"] += 1
+
+    # ------------------------------------------------------------------------
+    # On-disk store
+    # ------------------------------------------------------------------------
+
+    def _disk_path(self, key: str) -> str:
+        """Path of a cached entry on disk"""
+        return os.path.join(self.disk_dir, key[:2], f"{key}.audio")
+
+    def _load_disk_index(self):
+        """Index existing files, oldest first, so the disk budget holds across restarts"""
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            files = []
+            for root, _, names in os.walk(self.disk_dir):
+                for name in names:
+                    if name.endswith(".audio"):
+                        path = os.path.join(root, name)
+                        stat = os.stat(path)
+                        files.append((stat.st_mtime, name[:-len(".audio")], stat.st_size))
+            for _, key, size in sorted(files):
+                self.disk_index[key] = size
+                self.disk_bytes += size
+            print(f"Audio cache disk store: {len(self.disk_index)} entries in {self.disk_dir}")
+        except Exception as e:
+            print(f"Audio cache disk store unavailable, using memory only: {e}")
+            self.disk_dir = None
+
+    def _disk_read(self, key: str) -> Optional[bytes]:
+        """Read an entry from disk"""
+        if not self.disk_dir:
+            return None
+        with self.lock:
+            if key not in self.disk_index:
+                return None
+            self.disk_index.move_to_end(key)
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            with self.lock:
+                self.disk_bytes -= self.disk_index.pop(key, 0)
+            return None
+
+    def _disk_write(self, key: str, data: bytes):
+        """Write an entry to disk atomically and evict down to the disk budget"""
+        if not self.disk_dir:
+            return
+        with self.lock:
+            if key in self.disk_index:
+                return
+
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Audio cache disk write failed: {e}")
+            return
+
+        evicted = []
+        with self.lock:
+            self.disk_index[key] = len(data)
+            self.disk_bytes += len(data)
+            while self.disk_bytes > self.disk_max_bytes and len(self.disk_index) > 1:
+                old_key, size = self.disk_index.popitem(last=False)
+                self.disk_bytes -= size
+                self.stats["disk_evictions"] += 1
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            try:
+                os.unlink(self._disk_path(old_key))
+            except OSError:
+                pass
@@ -0,0 +1,453 @@
+"""
+Audio Codec Module
+
+In-process audio decoding and conversion for TTS output. MP3 decoding uses
+miniaudio (no ffmpeg subprocess, no temp files); channel mixing and
+resampling to the device format are vectorized with NumPy. Also provides
+the compact output encodings the device can negotiate (PCM at the DAC
+rate, 8-bit mu-law, IMA-ADPCM).
+"""
+
+import os
+import struct
+from typing import Optional, Tuple
+
+# Try to import NumPy for vectorized sample processing
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("NumPy not available, audio conversion will use pydub")
+
+# Try to import miniaudio for in-process MP3 decoding
+try:
+    import miniaudio
+    MINIAUDIO_AVAILABLE = True
+except ImportError:
+    MINIAUDIO_AVAILABLE = False
+    print("miniaudio not available, MP3 decoding will use pydub/ffmpeg")
+
+# ============================================================================
+# Device Audio Format
+# ============================================================================
+
+# 16kHz mono 16-bit PCM, played directly by the ESP32's I2S DAC
+DEVICE_SAMPLE_RATE = 16000
+DEVICE_CHANNELS = 1
+DEVICE_SAMPLE_WIDTH = 2
+
+# Half-width of the windowed-sinc low-pass filter used when downsampling
+_LOWPASS_HALF_TAPS = 32
+
+# ============================================================================
+# WAV Container
+# ============================================================================
+
+def build_wav_header(sample_rate: int = DEVICE_SAMPLE_RATE,
+                     channels: int = DEVICE_CHANNELS,
+                     sample_width: int = DEVICE_SAMPLE_WIDTH,
+                     data_size: Optional[int] = None) -> bytes:
+    """
+    Build a 44-byte PCM WAV header
+
+    Args:
+        sample_rate: Samples per second
+        channels: Number of channels
+        sample_width: Bytes per sample
+        data_size: Size of the PCM data, or None for a stream of unknown length
+
+    Returns:
+        WAV header bytes
+    """
+    if data_size is None:
+        # Unknown length: use the maximum sizes, as streaming WAV writers do
+        riff_size = 0xFFFFFFFF
+        data_size = 0xFFFFFFFF
+    else:
+        riff_size = 36 + data_size
+
+    byte_rate = sample_rate * channels * sample_width
+    block_align = channels * sample_width
+
+    return (
+        b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate,
+                                byte_rate, block_align, sample_width * 8)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+# ============================================================================
+# Decoding and Conversion
+# ============================================================================
+
+def codec_available() -> bool:
+    """True if in-process MP3 transcoding is possible"""
+    return NUMPY_AVAILABLE and MINIAUDIO_AVAILABLE
+
+def decode_mp3(mp3_data: bytes) -> Tuple["np.ndarray", int]:
+    """
+    Decode MP3 bytes in-process
+
+    Args:
+        mp3_data: MP3 audio data
+
+    Returns:
+        Tuple of (int16 samples shaped (frames, channels), sample_rate)
+    """
+    # Native rate and channels (decode() would first convert to 44.1kHz
+    # stereo, only for resample() to convert again)
+    decoded = miniaudio.mp3_read_s16(mp3_data)
+    samples = np.frombuffer(decoded.samples, dtype=np.int16)
+    return samples.reshape(-1, decoded.nchannels), decoded.sample_rate
+
+def pcm_to_samples(pcm: bytes, channels: int, sample_width: int) -> "np.ndarray":
+    """
+    Convert raw little-endian PCM bytes to int16 samples shaped (frames, channels)
+
+    Supports 8-bit unsigned, 16-bit, 24-bit and 32-bit signed PCM.
+    """
+    if sample_width == 1:
+        samples = (np.frombuffer(pcm, dtype=np.uint8).astype(np.int16) - 128) << 8
+    elif sample_width == 2:
+        samples = np.frombuffer(pcm, dtype="<i2")
+    elif sample_width == 3:
+        raw = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3)
+        # Keep the two most significant bytes
+        samples = (raw[:, 1].astype(np.int16) | (raw[:, 2].astype(np.int16) << 8))
+    elif sample_width == 4:
+        samples = (np.frombuffer(pcm, dtype="<i4") >> 16).astype(np.int16)
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+
+    frames = len(samples) // channels
+    return samples[:frames * channels].reshape(frames, channels)
+
+def to_mono(samples: "np.ndarray") -> "np.ndarray":
+    """Mix (frames, channels) samples down to a float32 mono signal"""
+    if samples.ndim == 1:
+        return samples.astype(np.float32)
+    return samples.astype(np.float32).mean(axis=1)
+
+def resample(signal: "np.ndarray", src_rate: int, dst_rate: int) -> "np.ndarray":
+    """
+    Resample a float mono signal
+
+    Downsampling applies a windowed-sinc low-pass at the new Nyquist
+    frequency first, then both directions use linear interpolation.
+
+    Args:
+        signal: Float mono samples
+        src_rate: Sample rate of signal
+        dst_rate: Target sample rate
+
+    Returns:
+        Resampled float32 signal
+    """
+    if src_rate == dst_rate or len(signal) == 0:
+        return signal.astype(np.float32)
+
+    if dst_rate < src_rate:
+        cutoff = dst_rate / src_rate  # fraction of the source Nyquist band
+        taps = np.arange(-_LOWPASS_HALF_TAPS, _LOWPASS_HALF_TAPS + 1)
+        kernel = cutoff * np.sinc(cutoff * taps) * np.hamming(len(taps))
+        kernel /= kernel.sum()
+        signal = np.convolve(signal, kernel, mode="same")
+
+    duration = len(signal) / src_rate
+    dst_length = int(round(duration * dst_rate))
+    src_times = np.arange(len(signal)) / src_rate
+    dst_times = np.arange(dst_length) / dst_rate
+    return np.interp(dst_times, src_times, signal).astype(np.float32)
+
+def to_pcm16(signal: "np.ndarray") -> bytes:
+    """Clip a float signal to 16-bit range and return little-endian PCM bytes"""
+    return np.clip(np.rint(signal), -32768, 32767).astype("<i2").tobytes()
+
+def convert_pcm(pcm: bytes, sample_rate: int, channels: int, sample_width: int,
+                dst_rate: int = DEVICE_SAMPLE_RATE) -> bytes:
+    """
+    Convert raw PCM to mono 16-bit PCM at dst_rate
+
+    Args:
+        pcm: Raw PCM bytes
+        sample_rate: Source sample rate
+        channels: Source channel count
+        sample_width: Source bytes per sample
+        dst_rate: Target sample rate
+
+    Returns:
+        Mono 16-bit PCM bytes
+    """
+    samples = pcm_to_samples(pcm, channels, sample_width)
+    return to_pcm16(resample(to_mono(samples), sample_rate, dst_rate))
+
+def transcode_mp3_to_pcm(mp3_data: bytes, dst_rate: int = DEVICE_SAMPLE_RATE) -> bytes:
+    """
+    Decode MP3 and convert it to mono 16-bit PCM at dst_rate, all in memory
+
+    Args:
+        mp3_data: MP3 audio data
+        dst_rate: Target sample rate
+
+    Returns:
+        Mono 16-bit PCM bytes
+    """
+    samples, sample_rate = decode_mp3(mp3_data)
+    return to_pcm16(resample(to_mono(samples), sample_rate, dst_rate))
+
+def transcode_mp3_to_wav(mp3_data: bytes) -> bytes:
+    """
+    Decode MP3 into a 16kHz mono 16-bit WAV, all in memory
+
+    Args:
+        mp3_data: MP3 audio data
+
+    Returns:
+        WAV audio data as bytes
+    """
+    pcm = transcode_mp3_to_pcm(mp3_data, DEVICE_SAMPLE_RATE)
+    return build_wav_header(data_size=len(pcm)) + pcm
+
+# ============================================================================
+# Output Encodings
+# ============================================================================
+
+# WAV format tags
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_MULAW = 0x0007
+WAVE_FORMAT_IMA_ADPCM = 0x0011
+
+# Sample rate of the ESP32's I2S DAC (firmware/esp32_master/config.h)
+DAC_SAMPLE_RATE = int(os.getenv("DAC_SAMPLE_RATE", "44100"))
+
+# IMA-ADPCM block layout (mono): 4-byte header + 252 bytes of 4-bit codes
+IMA_BLOCK_ALIGN = 256
+IMA_SAMPLES_PER_BLOCK = (IMA_BLOCK_ALIGN - 4) * 2 + 1  # 505
+
+_IMA_STEP_TABLE = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767
+]
+
+_IMA_INDEX_TABLE = [-1, -1, -1, -1, 2, 4, 6, 8]
+
+def _build_wav_container_header(format_tag: int, sample_rate: int, byte_rate: int,
+                                block_align: int, bits_per_sample: int,
+                                data_size: Optional[int], sample_count: Optional[int],
+                                extra: bytes = b"") -> bytes:
+    """
+    Build a WAV header for a non-PCM encoding (fmt with cbSize, fact chunk)
+
+    data_size/sample_count of None mark a stream of unknown length.
+    """
+    fmt = struct.pack("<HHIIHHH", format_tag, DEVICE_CHANNELS, sample_rate,
+                      byte_rate, block_align, bits_per_sample, len(extra)) + extra
+    fact = struct.pack("<I", 0xFFFFFFFF if sample_count is None else sample_count)
+
+    chunks = (
+        b"fmt " + struct.pack("<I", len(fmt)) + fmt
+        + b"fact" + struct.pack("<I", len(fact)) + fact
+    )
+
+    if data_size is None:
+        riff_size = 0xFFFFFFFF
+        data_size = 0xFFFFFFFF
+    else:
+        riff_size = 4 + len(chunks) + 8 + data_size
+
+    return (
+        b"RIFF" + struct.pack("<I", riff_size) + b"WAVE" + chunks
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+def encode_mulaw(samples: "np.ndarray") -> bytes:
+    """
+    Encode int16 samples as G.711 mu-law (vectorized)
+
+    Args:
+        samples: Mono int16 samples
+
+    Returns:
+        One mu-law byte per sample
+    """
+    values = samples.astype(np.int32)
+    sign = (values < 0).astype(np.int32)
+    magnitude = np.minimum(np.abs(values), 32635) + 0x84
+
+    # Segment number: position of the highest set bit above bit 7
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+
+    encoded = ~((sign << 7) | (exponent << 4) | mantissa) & 0xFF
+    return encoded.astype(np.uint8).tobytes()
+
+def encode_ima_adpcm_blocks(samples: "np.ndarray") -> bytes:
+    """
+    Encode int16 samples as WAV IMA-ADPCM blocks
+
+    Blocks are independent (each header carries its own predictor and step
+    index), so all blocks are encoded in parallel: the loop runs over the
+    505 sample positions of a block, each step vectorized across blocks.
+
+    Args:
+        samples: Mono int16 samples; a partial last block is padded with silence
+
+    Returns:
+        Encoded blocks of IMA_BLOCK_ALIGN bytes
+    """
+    if len(samples) == 0:
+        return b""
+
+    block_count = -(-len(samples) // IMA_SAMPLES_PER_BLOCK)
+    padded = np.zeros(block_count * IMA_SAMPLES_PER_BLOCK, dtype=np.int32)
+    padded[:len(samples)] = samples
+    blocks = padded.reshape(block_count, IMA_SAMPLES_PER_BLOCK)
+
+    step_table = np.array(_IMA_STEP_TABLE, dtype=np.int32)
+    index_table = np.array(_IMA_INDEX_TABLE * 2, dtype=np.int32)
+
+    # Start each block at the step size matching its opening slope
+    predictor = blocks[:, 0].copy()
+    opening_slope = np.abs(np.diff(blocks[:, :9], axis=1)).mean(axis=1)
+    index = np.clip(np.searchsorted(step_table, opening_slope), 0, 88).astype(np.int32)
+
+    header = np.zeros((block_count, 4), dtype=np.uint8)
+    header[:, 0:2] = predictor.astype("<i2").view(np.uint8).reshape(block_count, 2)
+    header[:, 2] = index
+
+    codes = np.zeros((block_count, IMA_SAMPLES_PER_BLOCK - 1), dtype=np.uint8)
+
+    for position in range(1, IMA_SAMPLES_PER_BLOCK):
+        step = step_table[index]
+        diff = blocks[:, position] - predictor
+        sign = diff < 0
+        diff = np.abs(diff)
+
+        code = np.zeros(block_count, dtype=np.int32)
+        delta = step >> 3
+        for bit, shift in ((4, 0), (2, 1), (1, 2)):
+            part = step >> shift
+            hit = diff >= part
+            code |= np.where(hit, bit, 0)
+            diff = np.where(hit, diff - part, diff)
+            delta = delta + np.where(hit, part, 0)
+
+        predictor = np.clip(np.where(sign, predictor - delta, predictor + delta), -32768, 32767)
+        index = np.clip(index + index_table[code], 0, 88)
+        codes[:, position - 1] = code | (sign.astype(np.int32) << 3)
+
+    # Two codes per byte, first sample in the low nibble
+    packed = codes[:, 0::2] | (codes[:, 1::2] << 4)
+    return np.concatenate([header, packed], axis=1).tobytes()
+
+class AudioEncoder:
+    """Encodes device PCM (16kHz mono 16-bit) into a negotiated WAV encoding"""
+
+    name = "wav"
+    sample_rate = DEVICE_SAMPLE_RATE
+
+    def header(self, data_size: Optional[int] = None,
+               sample_count: Optional[int] = None) -> bytes:
+        """WAV header; sizes of None mark a stream of unknown length"""
+        return build_wav_header(self.sample_rate, data_size=data_size)
+
+    def encode(self, pcm: bytes) -> bytes:
+        """Encode a chunk of device PCM (may buffer a partial block)"""
+        return pcm
+
+    def flush(self) -> bytes:
+        """Encode whatever is buffered at the end of the stream"""
+        return b""
+
+    def encode_all(self, pcm: bytes) -> bytes:
+        """Encode a complete response into a WAV file"""
+        body = self.encode(pcm) + self.flush()
+        sample_count = len(pcm) // DEVICE_SAMPLE_WIDTH
+        if self.sample_rate != DEVICE_SAMPLE_RATE:
+            sample_count = int(round(sample_count * self.sample_rate / DEVICE_SAMPLE_RATE))
+        return self.header(len(body), sample_count) + body
+
+class DacRatePCMEncoder(AudioEncoder):
+    """16-bit PCM resampled to the DAC's native rate"""
+
+    name = "wav_dac"
+    sample_rate = DAC_SAMPLE_RATE
+
+    def encode(self, pcm: bytes) -> bytes:
+        return convert_pcm(pcm, DEVICE_SAMPLE_RATE, DEVICE_CHANNELS,
+                           DEVICE_SAMPLE_WIDTH, self.sample_rate)
+
+class MuLawEncoder(AudioEncoder):
+    """8-bit G.711 mu-law at 16kHz (half the size of 16-bit PCM)"""
+
+    name = "mulaw"
+
+    def header(self, data_size: Optional[int] = None,
+               sample_count: Optional[int] = None) -> bytes:
+        return _build_wav_container_header(
+            WAVE_FORMAT_MULAW, self.sample_rate, self.sample_rate, 1, 8,
+            data_size, sample_count
+        )
+
+    def encode(self, pcm: bytes) -> bytes:
+        return encode_mulaw(np.frombuffer(pcm, dtype="<i2"))
+
+class ImaAdpcmEncoder(AudioEncoder):
+    """4-bit IMA-ADPCM at 16kHz (a quarter of the size of 16-bit PCM)"""
+
+    name = "ima_adpcm"
+
+    def __init__(self):
+        self.pending = np.zeros(0, dtype=np.int16)
+
+    def header(self, data_size: Optional[int] = None,
+               sample_count: Optional[int] = None) -> bytes:
+        byte_rate = self.sample_rate * IMA_BLOCK_ALIGN // IMA_SAMPLES_PER_BLOCK
+        return _build_wav_container_header(
+            WAVE_FORMAT_IMA_ADPCM, self.sample_rate, byte_rate, IMA_BLOCK_ALIGN, 4,
+            data_size, sample_count, extra=struct.pack("<H", IMA_SAMPLES_PER_BLOCK)
+        )
+
+    def encode(self, pcm: bytes) -> bytes:
+        samples = np.concatenate([self.pending, np.frombuffer(pcm, dtype="<i2")])
+        complete = len(samples) - len(samples) % IMA_SAMPLES_PER_BLOCK
+        self.pending = samples[complete:]
+        return encode_ima_adpcm_blocks(samples[:complete])
+
+    def flush(self) -> bytes:
+        samples, self.pending = self.pending, np.zeros(0, dtype=np.int16)
+        return encode_ima_adpcm_blocks(samples)
+
+AUDIO_ENCODERS = {
+    encoder.name: encoder
+    for encoder in (AudioEncoder, DacRatePCMEncoder, MuLawEncoder, ImaAdpcmEncoder)
+}
+
+DEFAULT_AUDIO_FORMAT = AudioEncoder.name
+
+def get_audio_encoder(audio_format: str = DEFAULT_AUDIO_FORMAT) -> AudioEncoder:
+    """
+    Create an encoder for a negotiated output format
+
+    Args:
+        audio_format: One of AUDIO_ENCODERS (wav, wav_dac, mulaw, ima_adpcm)
+
+    Returns:
+        A new (stateful) encoder instance
+
+    Raises:
+        ValueError: If the format is unknown or needs NumPy that is missing
+    """
+    encoder_class = AUDIO_ENCODERS.get(audio_format)
+    if encoder_class is None:
+        raise ValueError(f"Unsupported audio format '{audio_format}'. "
+                         f"Supported: {', '.join(AUDIO_ENCODERS)}")
+    if encoder_class is not AudioEncoder and not NUMPY_AVAILABLE:
+        raise ValueError(f"Audio format '{audio_format}' is not available on this server")
+    return encoder_class()
@@ -0,0 +1,200 @@
+"""
+Gemini Chat Store Module
+
+Bounded store for the per-session Gemini ChatSession objects. Chats expire
+with the user session (SESSION_TTL), the least recently used chats are
+evicted beyond a maximum count or memory budget, and image parts of earlier
+turns are dropped from retained history so only the current scene is kept.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict
+
+# Text part that replaces an image removed from an earlier turn
+STALE_IMAGE_PLACEHOLDER = "[earlier camera image omitted]"
+
+# ============================================================================
+# History Helpers
+# ============================================================================
+
+def _image_bytes(part) -> int:
+    """Size of the inline image data of a content part (0 for text parts)"""
+    inline_data = getattr(part, "inline_data", None)
+    data = getattr(inline_data, "data", None)
+    return len(data) if data else 0
+
+def estimate_history_bytes(history: list) -> int:
+    """Approximate memory held by a chat history (text plus inline images)"""
+    total = 0
+    for content in history:
+        for part in getattr(content, "parts", []):
+            total += len(getattr(part, "text", "") or "") + _image_bytes(part)
+    return total
+
+def strip_stale_images(chat, keep_latest: bool = True) -> int:
+    """
+    Replace image parts of earlier turns with a text placeholder
+
+    Args:
+        chat: Gemini ChatSession
+        keep_latest: Keep the images of the latest turn that has any
+
+    Returns:
+        Number of image parts removed
+    """
+    history = list(chat.history)
+
+    latest_image_turn = None
+    for index, content in enumerate(history):
+        if any(_image_bytes(part) for part in content.parts):
+            latest_image_turn = index
+    if latest_image_turn is None:
+        return 0
+    if not keep_latest:
+        latest_image_turn = -1
+
+    removed = 0
+    rebuilt = []
+    for index, content in enumerate(history):
+        if index == latest_image_turn or not any(_image_bytes(part) for part in content.parts):
+            rebuilt.append(content)
+            continue
+        parts = []
+        for part in content.parts:
+            if _image_bytes(part):
+                removed += 1
+                parts.append(STALE_IMAGE_PLACEHOLDER)
+            else:
+                parts.append(part)
+        rebuilt.append({"role": content.role, "parts": parts})
+
+    if removed:
+        chat.history = rebuilt
+    return removed
+
+# ============================================================================
+# Chat Store Class
+# ============================================================================
+
+class ChatStore:
+    """LRU/TTL store of Gemini chats with a memory budget"""
+
+    def __init__(self, ttl_seconds: float = 1800, max_entries: int = 500,
+                 max_bytes: int = 64 * 1024 * 1024):
+        """
+        Initialize chat store
+
+        Args:
+            ttl_seconds: Idle time after which a chat expires (session TTL)
+            max_entries: Maximum number of chats kept
+            max_bytes: Memory budget for all retained histories
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.entries = OrderedDict()  # session_id -> entry, least recently used first
+        self.current_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evicted_entries": 0,
+            "evicted_memory": 0,
+            "images_stripped": 0
+        }
+
+    def get(self, session_id: str):
+        """
+        Get the chat of a session
+
+        Returns:
+            ChatSession or None if missing or expired
+        """
+        with self.lock:
+            self._expire(time.monotonic())
+            entry = self.entries.get(session_id)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            entry["last_used"] = time.monotonic()
+            self.entries.move_to_end(session_id)
+            self.stats["hits"] += 1
+            return entry["chat"]
+
+    def put(self, session_id: str, chat):
+        """
+        Store a chat after a turn, trimming stale images and enforcing limits
+
+        Args:
+            session_id: User session ID
+            chat: Gemini ChatSession
+        """
+        try:
+            stripped = strip_stale_images(chat)
+            size = estimate_history_bytes(chat.history)
+        except Exception as e:
+            print(f"Could not trim chat history of {session_id}: {e}")
+            stripped, size = 0, 0
+
+        with self.lock:
+            old = self.entries.pop(session_id, None)
+            if old is not None:
+                self.current_bytes -= old["bytes"]
+
+            self.entries[session_id] = {
+                "chat": chat,
+                "bytes": size,
+                "last_used": time.monotonic()
+            }
+            self.current_bytes += size
+            self.stats["images_stripped"] += stripped
+
+            self._expire(time.monotonic())
+            while len(self.entries) > self.max_entries:
+                self._evict_oldest("evicted_entries")
+            while self.current_bytes > self.max_bytes and len(self.entries) > 1:
+                self._evict_oldest("evicted_memory")
+
+    def pop(self, session_id: str):
+        """Remove the chat of a session"""
+        with self.lock:
+            entry = self.entries.pop(session_id, None)
+            if entry is None:
+                return None
+            self.current_bytes -= entry["bytes"]
+            return entry["chat"]
+
+    def __contains__(self, session_id: str) -> bool:
+        with self.lock:
+            return session_id in self.entries
+
+    def get_stats(self) -> Dict:
+        """Get hit, expiry and eviction counters and current sizes"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats.update({
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes
+            })
+        return stats
+
+    def _expire(self, now: float):
+        """Drop chats idle for longer than the TTL (lock held)"""
+        # LRU order is also last-use order, so expired chats are at the front
+        while self.entries:
+            _, entry = next(iter(self.entries.items()))
+            if now - entry["last_used"] <= self.ttl_seconds:
+                break
+            self._evict_oldest("expired")
+
+    def _evict_oldest(self, reason: str):
+        """Evict the least recently used chat (lock held)"""
+        _, entry = self.entries.popitem(last=False)
+        self.current_bytes -= entry["bytes"]
+        self.stats[reason] += 1
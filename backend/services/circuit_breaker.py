@@ -0,0 +1,89 @@
+"""
+Circuit Breaker Module
+
+Stops calling a failing dependency (e.g. Redis) for a cool-down period
+after repeated failures, so requests fall back immediately instead of each
+waiting for its own timeout. After the cool-down a single trial call is let
+through; its outcome closes the circuit again or re-opens it.
+"""
+
+import time
+import threading
+from typing import Dict
+
+# ============================================================================
+# Circuit States
+# ============================================================================
+
+STATE_CLOSED = "closed"        # calls go through
+STATE_OPEN = "open"            # calls are skipped until the cool-down ends
+STATE_HALF_OPEN = "half_open"  # one trial call is in flight
+
+# ============================================================================
+# Circuit Breaker Class
+# ============================================================================
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        """
+        Initialize circuit breaker
+
+        Args:
+            name: Dependency name used in log messages
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+        self.stats = {
+            "failures": 0,
+            "short_circuited": 0,
+            "opened": 0
+        }
+
+    def allow(self) -> bool:
+        """True if the dependency may be called now"""
+        with self.lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let one trial call through
+                self.state = STATE_HALF_OPEN
+                return True
+            self.stats["short_circuited"] += 1
+            return False
+
+    def record_success(self):
+        """Record a successful call"""
+        with self.lock:
+            if self.state != STATE_CLOSED:
+                print(f"{self.name} circuit closed, dependency recovered")
+            self.state = STATE_CLOSED
+            self.failures = 0
+
+    def record_failure(self, error: Exception = None):
+        """Record a failed call, opening the circuit past the threshold"""
+        with self.lock:
+            self.failures += 1
+            self.stats["failures"] += 1
+            if self.state == STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != STATE_OPEN:
+                    self.stats["opened"] += 1
+                    print(f"{self.name} circuit opened for {self.reset_timeout}s: {error}")
+                self.state = STATE_OPEN
+                self.opened_at = time.monotonic()
+
+    def get_stats(self) -> Dict:
+        """Get state and counters"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["state"] = self.state
+        return stats
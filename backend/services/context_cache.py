@@ -0,0 +1,231 @@
+"""
+Gemini Context Cache Module
+
+Hands out the model a Gemini turn should be sent to. Locally, one model per
+language is built once with the system instruction attached, instead of
+passing the instruction with every new chat. With provider caching enabled,
+the system instruction and the session's current scene are stored once as
+explicit cached content (google-generativeai caching API) and later turns
+about the same scene reference that handle and upload only their text.
+
+Explicit caching has a provider-side minimum size (32k tokens for Gemini 1.5
+Flash), far above a system prompt plus one frame, so it is off by default;
+when the provider rejects a cache the local models are used instead.
+
+Provider calls go through a small provider object (GenaiCacheProvider for
+the real API), so tests can substitute an offline one.
+"""
+
+import time
+import threading
+import datetime
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.scene_cache import hamming_distance
+
+try:
+    import google.generativeai as genai
+    GEMINI_AVAILABLE = True
+except ImportError:
+    GEMINI_AVAILABLE = False
+
+try:
+    from google.generativeai import caching
+    CACHING_AVAILABLE = True
+except ImportError:
+    CACHING_AVAILABLE = False
+
+# Cached content is not used this close to its expiry
+_EXPIRY_MARGIN_SECONDS = 10
+
+# ============================================================================
+# Cache Handle
+# ============================================================================
+
+class CacheHandle:
+    """Model for one turn, and whether it already holds the current scene"""
+
+    def __init__(self, model, scene_cached: bool = False, name: Optional[str] = None):
+        """
+        Args:
+            model: GenerativeModel to send the turn to
+            scene_cached: The frame is part of the cached content, so the
+                          turn is sent without an image
+            name: Provider name of the cached content, if any
+        """
+        self.model = model
+        self.scene_cached = scene_cached
+        self.name = name
+
+# ============================================================================
+# Cache Providers
+# ============================================================================
+
+class GenaiCacheProvider:
+    """google-generativeai models and explicit cached content"""
+
+    available = CACHING_AVAILABLE
+
+    def local_model(self, model_name: str, system_instruction: str):
+        """Model with a system instruction attached"""
+        return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+    def create(self, model_name: str, system_instruction: str, contents: List[Dict],
+               ttl_seconds: int) -> Tuple[object, str]:
+        """
+        Store cached content and get a model that references it
+
+        Returns:
+            Tuple of (model, provider name of the cached content)
+        """
+        cached_content = caching.CachedContent.create(
+            model=model_name,
+            system_instruction=system_instruction,
+            contents=contents,
+            ttl=datetime.timedelta(seconds=ttl_seconds)
+        )
+        model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+        return model, cached_content.name
+
+# ============================================================================
+# Context Cache Class
+# ============================================================================
+
+class ContextCache:
+    """Per-language models plus optional provider-cached scenes per session"""
+
+    def __init__(self, model_name: str, instruction_for: Callable[[str], str],
+                 provider_enabled: bool = False, cache_model_name: str = None,
+                 ttl_seconds: int = 300, max_entries: int = 200,
+                 scene_distance: int = 6, provider=None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize context cache
+
+        Args:
+            model_name: Gemini model for uncached turns
+            instruction_for: Returns the system instruction of a language
+            provider_enabled: Use the provider's explicit context caching
+            cache_model_name: Versioned model name required by the caching API
+            ttl_seconds: Lifetime of cached content
+            max_entries: Cached scenes tracked (one per session and language)
+            scene_distance: Maximum frame-hash distance to reuse a cached scene
+            provider: Model/cache provider (default: GenaiCacheProvider)
+            clock: Monotonic time source (for cached content expiry)
+        """
+        self.model_name = model_name
+        self.instruction_for = instruction_for
+        self.provider = provider or GenaiCacheProvider()
+        self.clock = clock
+        self.provider_enabled = provider_enabled and self.provider.available
+        self.cache_model_name = cache_model_name or model_name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.scene_distance = scene_distance
+
+        self.models = {}               # language -> GenerativeModel
+        self.entries = OrderedDict()   # (session_id, language) -> cached scene
+        self.lock = threading.Lock()
+        self.stats = {
+            "local_turns": 0,
+            "scene_hits": 0,
+            "scene_creates": 0,
+            "provider_rejections": 0
+        }
+
+        if provider_enabled and not self.provider.available:
+            print("Context caching not supported by the installed google-generativeai, using local models")
+
+    def language_model(self, language: str):
+        """Model with the system instruction of a language, built once"""
+        with self.lock:
+            model = self.models.get(language)
+            if model is None:
+                model = self.provider.local_model(
+                    self.model_name, self.instruction_for(language)
+                )
+                self.models[language] = model
+            return model
+
+    def acquire(self, session_id: str, language: str, scene_hash: Optional[int],
+                image_part: Dict) -> CacheHandle:
+        """
+        Get the model for a turn about a frame
+
+        Blocking: creating provider cached content is a network call.
+
+        Args:
+            session_id: User session ID
+            language: Response language
+            scene_hash: Perceptual hash of the frame (None disables scene caching)
+            image_part: Inline image part of the frame
+
+        Returns:
+            CacheHandle for the turn
+        """
+        if not self.provider_enabled or not session_id or scene_hash is None:
+            with self.lock:
+                self.stats["local_turns"] += 1
+            return CacheHandle(self.language_model(language))
+
+        key = (session_id, language)
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if (entry and entry["expires_at"] > now
+                    and hamming_distance(entry["scene_hash"], scene_hash) <= self.scene_distance):
+                self.entries.move_to_end(key)
+                self.stats["scene_hits"] += 1
+                return CacheHandle(entry["model"], True, entry["name"])
+
+        try:
+            model, name = self.provider.create(
+                self.cache_model_name,
+                self.instruction_for(language),
+                [{"role": "user", "parts": [image_part]}],
+                self.ttl_seconds
+            )
+        except Exception as e:
+            self._reject(e)
+            return CacheHandle(self.language_model(language))
+
+        with self.lock:
+            self.entries[key] = {
+                "scene_hash": scene_hash,
+                "model": model,
+                "name": name,
+                "expires_at": now + self.ttl_seconds - _EXPIRY_MARGIN_SECONDS
+            }
+            self.entries.move_to_end(key)
+            self.stats["scene_creates"] += 1
+            # Dropped entries expire on the provider side with their TTL
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return CacheHandle(model, True, name)
+
+    def clear_session(self, session_id: str):
+        """Forget the cached scenes of a session"""
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == session_id]:
+                del self.entries[key]
+
+    def get_stats(self) -> Dict:
+        """Get local/provider usage counters"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["provider_enabled"] = self.provider_enabled
+            stats["cached_scenes"] = len(self.entries)
+        return stats
+
+    def _reject(self, error: Exception):
+        """Record a failed cache creation; stop trying if content is too small"""
+        message = str(error).lower()
+        with self.lock:
+            self.stats["provider_rejections"] += 1
+            if "too small" in message or "minimum" in message:
+                self.provider_enabled = False
+        if not self.provider_enabled:
+            print(f"Context caching rejected by provider, using local models: {error}")
+        else:
+            print(f"Could not create cached context, sending the frame inline: {error}")
@@ -0,0 +1,248 @@
+"""
+Conversation Context Module
+
+Keeps the Gemini chat history as the single source of conversation context
+and holds it within a token budget. Before each turn, images of earlier
+turns are dropped (only the new frame is sent), and the oldest turns are
+folded into a short extractive summary once the history exceeds the budget.
+Chats recreated after expiry are seeded from the session's stored
+interactions as text only.
+"""
+
+import os
+import re
+import threading
+from typing import Dict, List, Tuple
+
+from services.chat_store import strip_stale_images
+
+# Rough Gemini token cost of one image part
+IMAGE_TOKENS = 258
+
+# Marks the synthetic turn holding the running summary
+SUMMARY_PREFIXES = {
+    "en": "Summary of the earlier conversation:",
+    "hi": "पिछली बातचीत का सारांश:"
+}
+
+# Model reply paired with the summary, so the history keeps alternating roles
+SUMMARY_ACKNOWLEDGEMENT = "OK."
+
+_SENTENCE_END = re.compile(r"(?<=[.!?।])\s")
+
+# ============================================================================
+# Token Estimation
+# ============================================================================
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of a text
+
+    About four bytes of UTF-8 per token; this over-counts Devanagari a
+    little, which keeps Hindi conversations safely within the budget.
+    """
+    if not text:
+        return 0
+    return max(1, len(text.encode("utf-8")) // 4)
+
+def _content_text(content) -> str:
+    """Joined text parts of a chat content"""
+    if isinstance(content, dict):
+        parts = content.get("parts", [])
+    else:
+        parts = getattr(content, "parts", [])
+    texts = []
+    for part in parts:
+        text = part if isinstance(part, str) else getattr(part, "text", "")
+        if text:
+            texts.append(text)
+    return " ".join(texts)
+
+def _role(content) -> str:
+    """Role of a chat content (user or model)"""
+    if isinstance(content, dict):
+        return content.get("role", "")
+    return getattr(content, "role", "")
+
+def _content_tokens(content) -> int:
+    """Estimated tokens of a chat content, images included"""
+    tokens = estimate_tokens(_content_text(content))
+    for part in getattr(content, "parts", []):
+        inline_data = getattr(part, "inline_data", None)
+        if getattr(inline_data, "data", None):
+            tokens += IMAGE_TOKENS
+    return tokens
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    """First sentence of a text, cut to max_chars"""
+    sentence = _SENTENCE_END.split(text.strip(), 1)[0]
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars].rsplit(" ", 1)[0] + "..."
+    return sentence
+
+# ============================================================================
+# Context Manager Class
+# ============================================================================
+
+class ContextManager:
+    """Budgets and compacts Gemini chat history"""
+
+    def __init__(self, token_budget: int = 1500, recent_turns: int = 2,
+                 summary_max_chars: int = 600):
+        """
+        Initialize context manager
+
+        Args:
+            token_budget: Maximum estimated tokens of history sent per turn
+            recent_turns: Latest turns always kept verbatim
+            summary_max_chars: Maximum length of the running summary
+        """
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.summary_max_chars = summary_max_chars
+
+        self.lock = threading.Lock()
+        self.stats = {
+            "turns_summarized": 0,
+            "images_dropped": 0,
+            "chats_seeded": 0
+        }
+
+    def seed_history(self, chat_history: List[Dict], snapshot_prompt: str) -> list:
+        """
+        Build text-only chat history from stored session interactions
+
+        Args:
+            chat_history: Interactions stored in the session
+            snapshot_prompt: Prompt used for snapshot-mode turns
+
+        Returns:
+            History in chat content form (alternating user/model turns)
+        """
+        history = []
+        for interaction in chat_history or []:
+            user_query = interaction.get("user_query", "")
+            ai_response = interaction.get("ai_response", "")
+            if not ai_response:
+                continue
+            if not user_query or user_query == "[Snapshot Mode]":
+                user_query = snapshot_prompt
+            history.append({"role": "user", "parts": [user_query]})
+            history.append({"role": "model", "parts": [ai_response]})
+
+        if history:
+            with self.lock:
+                self.stats["chats_seeded"] += 1
+        return history
+
+    def prepare(self, chat, language: str) -> int:
+        """
+        Trim a chat's history before a new turn is sent
+
+        Drops all earlier images (the new turn carries the current frame)
+        and folds the oldest turns into the running summary until the
+        history fits the token budget.
+
+        Args:
+            chat: Gemini ChatSession
+            language: Response language (for the summary heading)
+
+        Returns:
+            Estimated tokens of the remaining history
+        """
+        dropped = strip_stale_images(chat, keep_latest=False)
+
+        summary_lines, turns = self._split_history(list(chat.history))
+        tokens = self._history_tokens(summary_lines, turns)
+
+        summarized = 0
+        while len(turns) > self.recent_turns and tokens > self.token_budget:
+            summary_lines.append(self._summarize_turn(turns.pop(0)))
+            summarized += 1
+            tokens = self._history_tokens(summary_lines, turns)
+
+        if summarized:
+            # Oldest summary lines go first when the summary itself grows too long
+            while len(summary_lines) > 1 and len(" ".join(summary_lines)) > self.summary_max_chars:
+                summary_lines.pop(0)
+            chat.history = self._build_history(summary_lines, turns, language)
+            tokens = self._history_tokens(summary_lines, turns)
+
+        with self.lock:
+            self.stats["turns_summarized"] += summarized
+            self.stats["images_dropped"] += dropped
+        return tokens
+
+    def get_stats(self) -> Dict:
+        """Get summarization and image-dropping counters"""
+        with self.lock:
+            stats = dict(self.stats)
+        stats["token_budget"] = self.token_budget
+        return stats
+
+    def _split_history(self, history: list) -> Tuple[List[str], List[Tuple]]:
+        """Split history into existing summary lines and (user, model) turns"""
+        summary_lines = []
+        if len(history) >= 2 and _role(history[0]) == "user":
+            text = _content_text(history[0])
+            for prefix in SUMMARY_PREFIXES.values():
+                if text.startswith(prefix):
+                    summary_lines = [line[2:] for line in text[len(prefix):].splitlines()
+                                     if line.startswith("- ")]
+                    history = history[2:]
+                    break
+
+        # Turns are (user, model) pairs; a trailing unanswered turn stays alone
+        turns = [tuple(history[index:index + 2]) for index in range(0, len(history), 2)]
+        return summary_lines, turns
+
+    def _summarize_turn(self, turn: Tuple) -> str:
+        """One extractive summary line for a turn: question -> first answer sentence"""
+        question = _first_sentence(_content_text(turn[0]), 80)
+        if len(turn) < 2:
+            return question
+        answer = _first_sentence(_content_text(turn[1]), 160)
+        return f"{question} -> {answer}"
+
+    def _history_tokens(self, summary_lines: List[str], turns: List[Tuple]) -> int:
+        """Estimated tokens of summary plus verbatim turns"""
+        tokens = sum(estimate_tokens(line) for line in summary_lines)
+        for turn in turns:
+            tokens += sum(_content_tokens(content) for content in turn)
+        return tokens
+
+    def _build_history(self, summary_lines: List[str], turns: List[Tuple],
+                       language: str) -> list:
+        """Reassemble history: summary turn first, then verbatim turns"""
+        history = []
+        if summary_lines:
+            prefix = SUMMARY_PREFIXES.get(language, SUMMARY_PREFIXES["en"])
+            summary = prefix + "\n" + "\n".join(f"- {line}" for line in summary_lines)
+            history.append({"role": "user", "parts": [summary]})
+            history.append({"role": "model", "parts": [SUMMARY_ACKNOWLEDGEMENT]})
+        for turn in turns:
+            history.extend(turn)
+        return history
+
+# ============================================================================
+# Global Context Manager Instance
+# ============================================================================
+
+context_manager = None
+
+def init_context_manager() -> ContextManager:
+    """Initialize the global context manager from environment settings"""
+    global context_manager
+    context_manager = ContextManager(
+        token_budget=int(os.getenv("GEMINI_CONTEXT_TOKEN_BUDGET", "1500")),
+        recent_turns=int(os.getenv("GEMINI_CONTEXT_RECENT_TURNS", "2")),
+        summary_max_chars=int(os.getenv("GEMINI_CONTEXT_SUMMARY_MAX_CHARS", "600"))
+    )
+    return context_manager
+
+def get_context_manager() -> ContextManager:
+    """Get the global context manager instance"""
+    global context_manager
+    if context_manager is None:
+        context_manager = init_context_manager()
+    return context_manager
@@ -0,0 +1,224 @@
+"""
+Staged Execution Engine Module
+
+Runs the blocking parts of the analyze pipeline off the asyncio event loop.
+Each pipeline stage (STT, Gemini, TTS, ...) gets its own bounded thread pool
+and concurrency limit, so a slow stage only queues requests for that stage
+instead of freezing every coroutine on the worker. CPU-heavy, picklable work
+(audio transcoding, image processing) can be sent to a shared process pool.
+"""
+
+import os
+import asyncio
+import functools
+import importlib
+import contextvars
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# ============================================================================
+# Stage Configuration
+# ============================================================================
+
+# Default concurrency limit per stage. Network-bound stages (Gemini, gTTS,
+# Google Web Speech) spend most of their time waiting, so they get
+# generous limits; each limit is also the size of the stage's thread pool.
+DEFAULT_STAGE_LIMITS = {
+    "stt": 16,
+    "gemini": 32,
+    "tts": 16,
+}
+
+def _start_cpu_worker(modules: Tuple[str, ...]):
+    """Warm-up job of a process pool worker: import what its jobs will need"""
+    for name in modules:
+        importlib.import_module(name)
+
+# ============================================================================
+# Stage Executor Class
+# ============================================================================
+
+class StageExecutor:
+    """Per-stage bounded thread pools plus a shared process pool"""
+
+    def __init__(self, stage_limits: Dict[str, int] = None, cpu_workers: int = 0):
+        """
+        Initialize stage executor
+
+        Args:
+            stage_limits: Maximum concurrent calls per stage name
+            cpu_workers: Size of the process pool for CPU-heavy work (0 disables it)
+        """
+        self.stage_limits = dict(DEFAULT_STAGE_LIMITS)
+        if stage_limits:
+            self.stage_limits.update(stage_limits)
+
+        self.thread_pools = {}
+        self.semaphores = {}
+        for stage, limit in self.stage_limits.items():
+            self._create_stage(stage, limit)
+
+        self.process_pool = None
+        self.cpu_workers = cpu_workers
+        if cpu_workers > 0:
+            try:
+                # Spawn (not fork) so children never inherit locked state
+                # from the stage threads of this process
+                self.process_pool = ProcessPoolExecutor(
+                    max_workers=cpu_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                print(f"CPU process pool started with {cpu_workers} workers")
+            except Exception as e:
+                print(f"Could not start CPU process pool, running CPU work in threads: {e}")
+                self.process_pool = None
+
+        print(f"Stage executor initialized: {self.stage_limits}")
+
+    def _create_stage(self, stage: str, limit: int):
+        """Create thread pool and semaphore for a stage"""
+        limit = max(1, int(limit))
+        self.stage_limits[stage] = limit
+        self.thread_pools[stage] = ThreadPoolExecutor(
+            max_workers=limit,
+            thread_name_prefix=f"stage-{stage}"
+        )
+        # Semaphores are created lazily per event loop (see _get_semaphore)
+        self.semaphores[stage] = None
+
+    def _get_semaphore(self, stage: str) -> asyncio.Semaphore:
+        """Get the concurrency limiter for a stage, creating it on first use"""
+        if stage not in self.thread_pools:
+            self._create_stage(stage, 4)
+
+        semaphore = self.semaphores.get(stage)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.stage_limits[stage])
+            self.semaphores[stage] = semaphore
+        return semaphore
+
+    async def run(self, stage: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking callable on the thread pool of a stage
+
+        Args:
+            stage: Stage name (stt, gemini, tts, ...)
+            func: Blocking callable to run
+            *args, **kwargs: Arguments passed to func
+
+        Returns:
+            Return value of func
+        """
+        semaphore = self._get_semaphore(stage)
+        loop = asyncio.get_running_loop()
+        # Run in the caller's context, so request-scoped state (stage
+        # timings) is visible on the stage thread
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+
+        async with semaphore:
+            return await loop.run_in_executor(self.thread_pools[stage], call)
+
+    def limit(self, stage: str) -> asyncio.Semaphore:
+        """
+        Concurrency limiter of a stage, for natively async calls
+
+        Use as `async with executor.limit("gemini"):` so async clients share
+        the stage's limit with calls made through run().
+        """
+        return self._get_semaphore(stage)
+
+    async def run_cpu(self, func: Callable, *args) -> Any:
+        """
+        Run CPU-heavy work on the process pool from async code
+
+        func and its arguments must be picklable (module-level function,
+        plain bytes/str arguments). Falls back to a thread when the
+        process pool is disabled.
+        """
+        loop = asyncio.get_running_loop()
+        if self.process_pool:
+            return await loop.run_in_executor(self.process_pool, func, *args)
+        return await loop.run_in_executor(None, func, *args)
+
+    async def warm_up_cpu(self, modules: Tuple[str, ...] = ()) -> bool:
+        """
+        Start every process pool worker with a trivial job
+
+        Spawned workers start lazily, each paying for a fresh interpreter
+        and its imports; warming them keeps that off the first requests.
+
+        Args:
+            modules: Modules the CPU jobs live in, imported by each worker
+
+        Returns:
+            True if the process pool is running, False without one
+        """
+        if not self.process_pool:
+            return False
+        loop = asyncio.get_running_loop()
+        # Submitted together, so the pool starts a worker for each job
+        await asyncio.gather(*(
+            loop.run_in_executor(self.process_pool, _start_cpu_worker, modules)
+            for _ in range(self.cpu_workers)
+        ))
+        print(f"CPU process pool warmed up ({self.cpu_workers} workers)")
+        return True
+
+    def run_cpu_sync(self, func: Callable, *args) -> Any:
+        """
+        Run CPU-heavy work on the process pool from a stage worker thread
+
+        Blocks the calling thread (never the event loop) until the result is
+        ready. Runs inline when the process pool is disabled or broken.
+        """
+        if self.process_pool:
+            try:
+                return self.process_pool.submit(func, *args).result()
+            except Exception as e:
+                print(f"Process pool task failed, retrying inline: {e}")
+        return func(*args)
+
+    def shutdown(self):
+        """Shut down all pools"""
+        for pool in self.thread_pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        if self.process_pool:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+        print("Stage executor shut down")
+
+# ============================================================================
+# Global Stage Executor Instance
+# ============================================================================
+
+stage_executor = None
+
+def _stage_limits_from_env() -> Dict[str, int]:
+    """Read per-stage limits from STAGE_LIMIT_<STAGE> environment variables"""
+    limits = {}
+    for stage in DEFAULT_STAGE_LIMITS:
+        value = os.getenv(f"STAGE_LIMIT_{stage.upper()}")
+        if value:
+            try:
+                limits[stage] = int(value)
+            except ValueError:
+                print(f"Warning: invalid STAGE_LIMIT_{stage.upper()}={value!r}, using default")
+    return limits
+
+def init_stage_executor(stage_limits: Dict[str, int] = None,
+                        cpu_workers: Optional[int] = None) -> StageExecutor:
+    """Initialize the global stage executor"""
+    global stage_executor
+    if stage_limits is None:
+        stage_limits = _stage_limits_from_env()
+    if cpu_workers is None:
+        cpu_workers = int(os.getenv("CPU_PROCESS_WORKERS", "2"))
+    stage_executor = StageExecutor(stage_limits, cpu_workers)
+    return stage_executor
+
+def get_stage_executor() -> StageExecutor:
+    """Get the global stage executor instance"""
+    global stage_executor
+    if stage_executor is None:
+        stage_executor = StageExecutor()
+    return stage_executor
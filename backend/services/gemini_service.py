@@ -6,9 +6,16 @@ Supports image analysis with conversational context and multilingual responses.
 """
 
 import os
+import time
+import random
+import asyncio
 import base64
-from typing import List, Dict, Optional
-import io
+from collections import deque
+from typing import Iterator, List, Dict, Optional, Tuple
+
+from services.chat_store import ChatStore
+from services.context_manager import get_context_manager
+from services.context_cache import ContextCache
 
 try:
     import google.generativeai as genai
@@ -17,6 +24,103 @@ except ImportError:
     GEMINI_AVAILABLE = False
     print("Google Generative AI library not available")
 
+try:
+    from google.api_core import exceptions as google_exceptions
+    # Upstream errors worth retrying: overload, throttling, 5xx, deadlines
+    TRANSIENT_ERRORS = (
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.TooManyRequests,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.GatewayTimeout,
+    )
+except ImportError:
+    TRANSIENT_ERRORS = ()
+
+# ============================================================================
+# Fixed Spoken Messages (prewarmed into the TTS audio cache at startup)
+# ============================================================================
+
+AI_UNAVAILABLE_MESSAGE = "Sorry, AI service is not available."
+
+ANALYSIS_ERROR_MESSAGES = {
+    "en": "Sorry, I couldn't analyze the image. Please try again.",
+    "hi": "क्षमा करें, मैं छवि का विश्लेषण नहीं कर सका। कृपया पुनः प्रयास करें।"
+}
+
+# Prompt of snapshot-mode turns (no spoken question)
+SNAPSHOT_PROMPTS = {
+    "en": "Describe what you see in detail, focusing on obstacles and important objects.",
+    "hi": "विस्तार से बताएं कि आप क्या देखते हैं, बाधाओं और महत्वपूर्ण वस्तुओं पर ध्यान केंद्रित करें।"
+}
+
+def _image_mime_type(image_data: bytes) -> str:
+    """Detect the MIME type of an encoded image from its magic bytes"""
+    if image_data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if image_data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+        return "image/webp"
+    # The analyze endpoint only accepts JPEG
+    return "image/jpeg"
+
+# ============================================================================
+# Model and Context Caching
+# ============================================================================
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+# Explicit context caching of the system instruction and current scene
+# (needs a versioned model name; off by default, see services/context_cache.py)
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() == "true"
+GEMINI_CACHE_MODEL = os.getenv("GEMINI_CACHE_MODEL", "models/gemini-1.5-flash-001")
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "300"))
+
+# ============================================================================
+# Call Policy (deadline, retries, hedging)
+# ============================================================================
+
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "12"))
+# Budget for a whole turn, all attempts and backoff included; must stay
+# below the device's HTTP timeout (30s) minus STT and TTS time
+GEMINI_DEADLINE_SECONDS = float(os.getenv("GEMINI_DEADLINE_SECONDS", "20"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+GEMINI_RETRY_BASE_SECONDS = float(os.getenv("GEMINI_RETRY_BASE_SECONDS", "0.25"))
+
+# A second, hedged request is sent when the first one is slower than this
+# percentile of recent call latencies (but never sooner than the minimum)
+GEMINI_HEDGE_ENABLED = os.getenv("GEMINI_HEDGE_ENABLED", "false").lower() == "true"
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95"))
+GEMINI_HEDGE_MIN_SECONDS = float(os.getenv("GEMINI_HEDGE_MIN_SECONDS", "2"))
+
+# Latencies needed before the percentile is trusted
+_HEDGE_MIN_SAMPLES = 20
+
+def _is_transient(error: Exception) -> bool:
+    """True if a failed call may succeed when retried"""
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    return bool(TRANSIENT_ERRORS) and isinstance(error, TRANSIENT_ERRORS)
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+    
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+    
+    def record(self, seconds: float):
+        """Record the latency of one successful call"""
+        self.samples.append(seconds)
+    
+    def percentile(self, percent: float) -> Optional[float]:
+        """Latency below which `percent` of recent calls finished"""
+        if len(self.samples) < _HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
 # ============================================================================
 # Gemini Service Class
 # ============================================================================
@@ -24,16 +128,39 @@ except ImportError:
 class GeminiService:
     """Google Gemini 1.5 Flash service for multimodal AI"""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, session_ttl: int = None):
         """
         Initialize Gemini service
         
         Args:
             api_key: Google AI API key
+            session_ttl: Idle seconds after which a chat is dropped (session TTL)
         """
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         self.model = None
-        self.sessions = {}  # Store chat sessions per user session
+        self.context_cache = None
+        
+        # Chat sessions per user session, expiring with the session
+        self.chats = ChatStore(
+            ttl_seconds=session_ttl or int(os.getenv("SESSION_TTL", "1800")),
+            max_entries=int(os.getenv("GEMINI_CHAT_MAX_ENTRIES", "500")),
+            max_bytes=int(float(os.getenv("GEMINI_CHAT_MAX_MB", "64")) * 1024 * 1024)
+        )
+        
+        self.timeout = GEMINI_TIMEOUT_SECONDS
+        self.deadline = GEMINI_DEADLINE_SECONDS
+        self.max_retries = GEMINI_MAX_RETRIES
+        self.retry_base = GEMINI_RETRY_BASE_SECONDS
+        self.hedge_enabled = GEMINI_HEDGE_ENABLED
+        self.latency = LatencyTracker()
+        self.stats = {
+            "calls": 0,
+            "timeouts": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "failures": 0
+        }
         
         if not self.api_key:
             print("Warning: No Gemini API key provided!")
@@ -45,7 +172,15 @@ class GeminiService:
         
         try:
             genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            self.model = genai.GenerativeModel(GEMINI_MODEL)
+            self.context_cache = ContextCache(
+                GEMINI_MODEL,
+                self.get_system_instruction,
+                provider_enabled=GEMINI_CONTEXT_CACHE,
+                cache_model_name=GEMINI_CACHE_MODEL,
+                ttl_seconds=GEMINI_CONTEXT_CACHE_TTL,
+                scene_distance=int(os.getenv("SCENE_CACHE_MAX_DISTANCE", "6"))
+            )
             print("Gemini 1.5 Flash initialized successfully")
         except Exception as e:
             print(f"Error initializing Gemini: {e}")
@@ -82,91 +217,361 @@ class GeminiService:
     
     def analyze_image(self, image_data: bytes, user_query: str, 
                      chat_history: List[Dict], language: str = "en",
-                     session_id: str = None) -> str:
+                     session_id: str = None, scene_hash: Optional[int] = None) -> str:
         """
         Analyze image with user query and chat history
         
         Args:
             image_data: Image data as bytes (JPEG format)
             user_query: User's question or empty for default description
-            chat_history: Previous interactions in this session
+            chat_history: Previous interactions in this session (seeds a new chat)
             language: Target language code (en, hi)
             session_id: Session ID for maintaining conversation
+            scene_hash: Perceptual hash of the frame, for context caching
         
         Returns:
             AI-generated response text
         """
         if not self.model:
-            return "Sorry, AI service is not available."
+            return AI_UNAVAILABLE_MESSAGE
+        
+        try:
+            chat, include_image = self._chat_for_turn(
+                session_id, language, chat_history, image_data, scene_hash
+            )
+            message = self._build_message(image_data, user_query, language, include_image)
+            
+            # Send message with image
+            response = chat.send_message(message)
+            
+            response_text = response.text.strip()
+            if session_id:
+                self.chats.put(session_id, chat)
+            
+            print(f"Gemini response (language: {language}): {response_text[:100]}...")
+            return response_text
+            
+        except Exception as e:
+            print(f"Gemini analysis error: {e}")
+            return self._error_message(language)
+    
+    async def analyze_image_async(self, image_data: bytes, user_query: str,
+                                  chat_history: List[Dict], language: str = "en",
+                                  session_id: str = None,
+                                  scene_hash: Optional[int] = None) -> str:
+        """
+        Analyze image without blocking a worker thread
+        
+        Same inputs and result as analyze_image. The whole turn must finish
+        within GEMINI_DEADLINE_SECONDS and each attempt within
+        GEMINI_TIMEOUT_SECONDS (or the time left, if less). Transient
+        failures are retried with jittered exponential backoff while a full
+        attempt still fits in the deadline, and if hedging is enabled a slow
+        attempt is raced against a second request on a copy of the chat.
+        
+        Returns:
+            AI-generated response text (on failure, the error message)
+        """
+        if not self.model:
+            return AI_UNAVAILABLE_MESSAGE
+        
+        self.stats["calls"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
         
         try:
-            # Get or create chat session
-            if session_id and session_id in self.sessions:
-                chat = self.sessions[session_id]
+            if self.context_cache.provider_enabled:
+                # Creating cached content is a blocking network call
+                chat, include_image = await loop.run_in_executor(
+                    None, self._chat_for_turn,
+                    session_id, language, chat_history, image_data, scene_hash
+                )
             else:
-                # Create new chat with system instruction
-                system_instruction = self.get_system_instruction(language)
-                # Pass system instruction when creating chat
-                chat = self.model.start_chat(
-                    history=[],
-                    system_instruction=system_instruction
+                chat, include_image = self._chat_for_turn(
+                    session_id, language, chat_history, image_data, scene_hash
                 )
+            message = self._build_message(image_data, user_query, language, include_image)
+        except Exception as e:
+            print(f"Gemini analysis error (preparing turn): {e}")
+            self.stats["failures"] += 1
+            return self._error_message(language)
+        
+        for attempt in range(self.max_retries + 1):
+            attempt_timeout = min(self.timeout, deadline - loop.time())
+            if attempt_timeout <= 0:
+                print("Gemini turn deadline reached before sending")
+                break
+            try:
+                winner, response = await self._send_hedged(chat, message, language, attempt_timeout)
                 if session_id:
-                    self.sessions[session_id] = chat
-            
-            # Prepare the prompt
-            if user_query:
-                prompt = user_query
-            else:
-                # Default prompt for snapshot mode
-                prompts = {
-                    "en": "Describe what you see in detail, focusing on obstacles and important objects.",
-                    "hi": "विस्तार से बताएं कि आप क्या देखते हैं, बाधाओं और महत्वपूर्ण वस्तुओं पर ध्यान केंद्रित करें।"
-                }
-                prompt = prompts.get(language, prompts["en"])
+                    # A winning hedged copy holds this turn and becomes the session chat
+                    self.chats.put(session_id, winner)
+                
+                response_text = response.text.strip()
+                print(f"Gemini response (language: {language}): {response_text[:100]}...")
+                return response_text
             
-            # Add context from chat history
-            if chat_history and len(chat_history) > 0:
-                context_prompts = {
-                    "en": "\n\nPrevious context:",
-                    "hi": "\n\nपिछला संदर्भ:"
-                }
-                prompt += context_prompts.get(language, context_prompts["en"])
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timeouts"] += 1
+                    print(f"Gemini call timed out after {attempt_timeout:.1f}s (attempt {attempt + 1})")
+                else:
+                    print(f"Gemini analysis error (attempt {attempt + 1}): {e}")
                 
-                # Include last 3 interactions for context
-                for interaction in chat_history[-3:]:
-                    user_q = interaction.get("user_query", "")
-                    ai_resp = interaction.get("ai_response", "")
-                    if user_q:
-                        prompt += f"\nUser: {user_q}"
-                    if ai_resp:
-                        prompt += f"\nAssistant: {ai_resp}"
+                if not _is_transient(e) or attempt == self.max_retries:
+                    break
+                
+                # Full jitter keeps retries from many devices from synchronizing
+                backoff = random.uniform(0, self.retry_base * (2 ** attempt))
+                if deadline - loop.time() - backoff < self.timeout:
+                    # A retry could not complete before the device gives up
+                    print("Not retrying Gemini call: not enough time left in the turn deadline")
+                    break
+                self.stats["retries"] += 1
+                await asyncio.sleep(backoff)
+        
+        self.stats["failures"] += 1
+        return self._error_message(language)
+    
+    async def _send_hedged(self, chat, message: list, language: str,
+                           timeout: float) -> Tuple[object, object]:
+        """
+        Send one turn within the timeout, hedging if the call is slow
+        
+        Args:
+            timeout: Seconds the attempt (hedge included) may take
+        
+        Returns:
+            Tuple of (chat that produced the response, response)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        primary = asyncio.ensure_future(self._send_timed(chat, message))
+        tasks = {primary: chat}
+        
+        try:
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is not None and hedge_delay < timeout:
+                done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+                if not done:
+                    # Hedge on a copy, so the two requests never share history
+                    self.stats["hedges"] += 1
+                    hedge_chat = self._new_chat(language, history=list(chat.history))
+                    hedge_chat.model = chat.model
+                    tasks[asyncio.ensure_future(self._send_timed(hedge_chat, message))] = hedge_chat
             
-            # Convert image to PIL Image for Gemini
-            from PIL import Image
-            image = Image.open(io.BytesIO(image_data))
+            error = None
+            while tasks:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                done, _ = await asyncio.wait(
+                    tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    task_chat = tasks.pop(task)
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task_chat, task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Loser or timed-out requests are abandoned
+            for task in tasks:
+                task.cancel()
+    
+    async def _send_timed(self, chat, message: list):
+        """Send one request and record its latency"""
+        start_time = time.monotonic()
+        response = await chat.send_message_async(message)
+        self.latency.record(time.monotonic() - start_time)
+        return response
+    
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None if hedging is off"""
+        if not self.hedge_enabled:
+            return None
+        threshold = self.latency.percentile(GEMINI_HEDGE_PERCENTILE)
+        if threshold is None:
+            return None
+        return max(GEMINI_HEDGE_MIN_SECONDS, threshold)
+    
+    def get_call_stats(self) -> Dict:
+        """Get timeout/retry/hedge counters and the current hedge threshold"""
+        stats = dict(self.stats)
+        threshold = self.latency.percentile(GEMINI_HEDGE_PERCENTILE)
+        stats["latency_p95"] = round(threshold, 3) if threshold is not None else None
+        stats["hedge_enabled"] = self.hedge_enabled
+        return stats
+    
+    def analyze_image_stream(self, image_data: bytes, user_query: str,
+                             chat_history: List[Dict], language: str = "en",
+                             session_id: str = None,
+                             scene_hash: Optional[int] = None) -> Iterator[str]:
+        """
+        Analyze image and yield the response text as it is generated
+        
+        Same inputs as analyze_image, but uses the SDK's streaming responses
+        so callers can start speaking before generation has finished. The
+        stream must finish within GEMINI_DEADLINE_SECONDS, so a stalled
+        stream cannot hold a gemini stage thread indefinitely.
+        
+        Yields:
+            Text fragments in order (on error, the error message)
+        """
+        if not self.model:
+            yield AI_UNAVAILABLE_MESSAGE
+            return
+        
+        deadline = time.monotonic() + self.deadline
+        produced = False
+        completed = False
+        try:
+            chat, include_image = self._chat_for_turn(
+                session_id, language, chat_history, image_data, scene_hash
+            )
+            message = self._build_message(image_data, user_query, language, include_image)
             
-            # Send message with image
-            response = chat.send_message([prompt, image])
+            response = chat.send_message(
+                message, stream=True, request_options={"timeout": self.deadline}
+            )
             
-            response_text = response.text.strip()
+            for chunk in response:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"stream exceeded {self.deadline}s")
+                text = chunk.text
+                if text:
+                    produced = True
+                    yield text
             
-            print(f"Gemini response (language: {language}): {response_text[:100]}...")
-            return response_text
+            completed = True
+            if session_id:
+                self.chats.put(session_id, chat)
+            print(f"Gemini streamed response complete (language: {language})")
             
         except Exception as e:
-            print(f"Gemini analysis error: {e}")
-            error_messages = {
-                "en": "Sorry, I couldn't analyze the image. Please try again.",
-                "hi": "क्षमा करें, मैं छवि का विश्लेषण नहीं कर सका। कृपया पुनः प्रयास करें।"
-            }
-            return error_messages.get(language, error_messages["en"])
+            print(f"Gemini streaming error: {e}")
+            if not produced:
+                yield self._error_message(language)
+        finally:
+            if not completed and session_id:
+                # A half-finished turn must not be replayed (or block the
+                # next send); the next turn re-seeds from the session history
+                self.chats.pop(session_id)
+    
+    def _get_chat(self, session_id: str, language: str):
+        """Get or create the chat session for a user session"""
+        if session_id:
+            chat = self.chats.get(session_id)
+            if chat is not None:
+                return chat
+        
+        chat = self._new_chat(language)
+        if session_id:
+            self.chats.put(session_id, chat)
+        return chat
+    
+    def _chat_for_turn(self, session_id: str, language: str, chat_history: List[Dict],
+                       image_data: bytes, scene_hash: Optional[int] = None) -> Tuple[object, bool]:
+        """
+        Get the session chat with its history trimmed for the next turn
+        
+        The chat history is the only conversation context sent to Gemini.
+        A chat recreated after expiry (or a restart) is seeded with the
+        session's stored interactions as text, then trimmed to the budget.
+        The chat is pointed at the model from the context cache, which may
+        already hold the frame.
+        
+        Returns:
+            Tuple of (chat, whether the turn must carry the image)
+        """
+        context = get_context_manager()
+        chat = self._get_chat(session_id, language)
+        if chat_history and not chat.history:
+            snapshot_prompt = SNAPSHOT_PROMPTS.get(language, SNAPSHOT_PROMPTS["en"])
+            chat.history = context.seed_history(chat_history, snapshot_prompt)
+        try:
+            context.prepare(chat, language)
+        except Exception as e:
+            print(f"Could not trim chat context, sending it unchanged: {e}")
+        
+        handle = self.context_cache.acquire(
+            session_id, language, scene_hash, self._image_part(image_data)
+        )
+        chat.model = handle.model
+        return chat, not handle.scene_cached
+    
+    def record_turn(self, session_id: str, user_query: str, answer: str, language: str = "en"):
+        """
+        Append a turn answered without Gemini (scene cache hit) to the live chat
+        
+        Keeps the chat in step with the session history, so a follow-up
+        question can refer to the replayed answer. Without a live chat there
+        is nothing to do: the next turn seeds a new chat from the session.
+        
+        Args:
+            session_id: Session the turn belongs to
+            user_query: Transcribed question (empty in snapshot mode)
+            answer: Answer that was replayed
+            language: Response language
+        """
+        chat = self.chats.get(session_id) if session_id else None
+        if chat is None:
+            return
+        
+        prompt = user_query or SNAPSHOT_PROMPTS.get(language, SNAPSHOT_PROMPTS["en"])
+        chat.history = list(chat.history) + [
+            {"role": "user", "parts": [prompt]},
+            {"role": "model", "parts": [answer]}
+        ]
+    
+    def _new_chat(self, language: str, history: list = None):
+        """Start a chat with the system instruction and optional prior turns"""
+        # The language's model carries the system instruction
+        return self.context_cache.language_model(language).start_chat(history=history or [])
+    
+    def _build_message(self, image_data: bytes, user_query: str, language: str,
+                       include_image: bool = True) -> list:
+        """Build the prompt and image parts for one turn"""
+        # Prepare the prompt (default prompt for snapshot mode); earlier
+        # turns reach the model through the chat history only
+        prompt = user_query or SNAPSHOT_PROMPTS.get(language, SNAPSHOT_PROMPTS["en"])
+        
+        if not include_image:
+            # The frame is already part of the cached context
+            return [prompt]
+        return [prompt, self._image_part(image_data)]
+    
+    def _image_part(self, image_data: bytes) -> Dict:
+        """Inline image part of a frame"""
+        # Send the validated JPEG bytes as an inline blob, so the SDK does not
+        # decode and re-encode the frame
+        return {
+            "mime_type": _image_mime_type(image_data),
+            "data": image_data
+        }
+    
+    def _error_message(self, language: str) -> str:
+        """Spoken message for a failed analysis"""
+        return ANALYSIS_ERROR_MESSAGES.get(language, ANALYSIS_ERROR_MESSAGES["en"])
     
     def clear_session(self, session_id: str):
         """Clear chat session for a user"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        if self.context_cache:
+            self.context_cache.clear_session(session_id)
+        if self.chats.pop(session_id) is not None:
             print(f"Cleared Gemini session: {session_id}")
+    
+    def get_chat_store_stats(self) -> Dict:
+        """Get chat store size, expiry and eviction counters"""
+        return self.chats.get_stats()
+    
+    def get_context_cache_stats(self) -> Optional[Dict]:
+        """Get local/provider context caching counters"""
+        return self.context_cache.get_stats() if self.context_cache else None
 
 # ============================================================================
 # Global Gemini Service Instance
@@ -174,10 +579,10 @@ class GeminiService:
 
 gemini_service = None
 
-def init_gemini_service(api_key: str = None) -> GeminiService:
+def init_gemini_service(api_key: str = None, session_ttl: int = None) -> GeminiService:
     """Initialize the global Gemini service"""
     global gemini_service
-    gemini_service = GeminiService(api_key)
+    gemini_service = GeminiService(api_key, session_ttl)
     return gemini_service
 
 def get_gemini_service() -> GeminiService:
@@ -0,0 +1,106 @@
+"""
+Image Conditioning Service Module
+
+Downscales and recompresses camera frames before they are uploaded to
+Gemini. Uses JPEG draft mode so the decoder itself scales by 1/2, 1/4 or 1/8
+(much cheaper than a full decode followed by a resize), applies EXIF
+orientation, and leaves frames that are already small enough untouched.
+"""
+
+import os
+import io
+from typing import Dict, Tuple
+
+# Try to import Pillow
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+    print("Pillow not available, images will be sent unchanged")
+
+# ============================================================================
+# Conditioning Profiles
+# ============================================================================
+
+# EXIF tag holding the camera orientation
+_EXIF_ORIENTATION = 0x0112
+
+def _profile_from_env(mode: str, max_side: int, quality: int) -> Dict:
+    """Read the conditioning profile of a mode from IMAGE_*_<MODE> variables"""
+    suffix = mode.upper()
+    return {
+        "max_side": int(os.getenv(f"IMAGE_MAX_SIDE_{suffix}", str(max_side))),
+        "quality": int(os.getenv(f"IMAGE_QUALITY_{suffix}", str(quality)))
+    }
+
+# Snapshot descriptions benefit from more detail than follow-up questions
+IMAGE_PROFILES = {
+    "snapshot": _profile_from_env("snapshot", 768, 80),
+    "conversation": _profile_from_env("conversation", 640, 75)
+}
+
+# Frames within the target size and below this many bytes are sent as-is
+IMAGE_SKIP_BYTES = int(os.getenv("IMAGE_SKIP_BYTES", str(96 * 1024)))
+
+def get_image_profile(mode: str) -> Dict:
+    """Get target max side and JPEG quality for a request mode"""
+    return IMAGE_PROFILES.get(mode, IMAGE_PROFILES["snapshot"])
+
+# ============================================================================
+# Conditioning
+# ============================================================================
+
+def _target_size(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+    """Scale (width, height) so the longer side is at most max_side"""
+    width, height = size
+    scale = min(1.0, max_side / max(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def condition_image(image_data: bytes, max_side: int, quality: int,
+                    skip_bytes: int = IMAGE_SKIP_BYTES) -> bytes:
+    """
+    Downscale and recompress a JPEG frame for upload
+
+    Module-level so it can run on the CPU process pool.
+
+    Args:
+        image_data: JPEG image data
+        max_side: Maximum length of the longer side in pixels
+        quality: JPEG quality of the re-encoded frame
+        skip_bytes: Frames within max_side and at most this size are kept
+
+    Returns:
+        Conditioned JPEG bytes (the original bytes if nothing was gained)
+    """
+    if not PIL_AVAILABLE:
+        return image_data
+
+    try:
+        # Only the header is parsed here; pixels are decoded on demand
+        image = Image.open(io.BytesIO(image_data))
+        orientation = image.getexif().get(_EXIF_ORIENTATION, 1)
+
+        if (max(image.size) <= max_side and orientation == 1
+                and len(image_data) <= skip_bytes):
+            return image_data
+
+        # Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding
+        # (the result stays at least as large as the target)
+        target = _target_size(image.size, max_side)
+        image.draft("RGB", target)
+
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.BILINEAR)
+
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=quality)
+        conditioned = output.getvalue()
+
+        if len(conditioned) >= len(image_data) and orientation == 1:
+            return image_data
+        return conditioned
+
+    except Exception as e:
+        print(f"Image conditioning failed, sending original: {e}")
+        return image_data
@@ -0,0 +1,254 @@
+"""
+Metrics Module
+
+Low-overhead latency instrumentation for the analyze pipeline. Stage
+timings (session load, STT, image prep, Gemini, TTS, response write) are
+recorded into fixed-bucket histograms, exported in the Prometheus text
+format on /metrics, and collected per request (through a context variable)
+for the Server-Timing response header.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# ============================================================================
+# Metric Types
+# ============================================================================
+
+# Upper bounds in seconds, from cache hits up to slow Gemini turns
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    """Escape a label value for the text exposition format"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    """Render {name="value",...} (empty when there are no labels)"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.values = {}  # label values -> count
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase the counter for a label combination"""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        """Prometheus text lines"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    """Fixed-bucket histogram with labels"""
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """Record one observation for a label combination"""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """
+        Estimate a quantile from the buckets (linear within a bucket)
+
+        Args:
+            q: Quantile in [0, 1]
+            **labels: Label values; series not matching are ignored
+
+        Returns:
+            Estimated value in seconds, or None without observations
+        """
+        with self.lock:
+            counts = [0] * (len(self.buckets) + 1)
+            for key, series in self.series.items():
+                if all(key[self.labelnames.index(name)] == str(value) for name, value in labels.items()):
+                    for i in range(len(counts)):
+                        counts[i] += series[i]
+        total = sum(counts)
+        if not total:
+            return None
+
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        """Prometheus text lines (cumulative buckets, sum and count)"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((key, list(series)) for key, series in self.series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+# ============================================================================
+# Pipeline Metrics
+# ============================================================================
+
+STAGE_SECONDS = Histogram(
+    "blind_stage_duration_seconds",
+    "Time spent in each pipeline stage",
+    ("stage", "backend", "language")
+)
+STAGE_FAILURES = Counter(
+    "blind_stage_failures_total",
+    "Pipeline stages that raised an exception",
+    ("stage",)
+)
+REQUEST_SECONDS = Histogram(
+    "blind_http_request_duration_seconds",
+    "Time until the response headers were sent",
+    ("method", "route")
+)
+REQUESTS = Counter(
+    "blind_http_requests_total",
+    "HTTP requests by route and status",
+    ("method", "route", "status")
+)
+
+METRICS = [STAGE_SECONDS, STAGE_FAILURES, REQUEST_SECONDS, REQUESTS]
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def get_stage_percentiles() -> Dict[str, Dict[str, float]]:
+    """Estimated p50/p95/p99 per stage, in milliseconds"""
+    stages = sorted({key[0] for key in list(STAGE_SECONDS.series)})
+    summary = {}
+    for stage in stages:
+        summary[stage] = {
+            f"p{int(q * 100)}_ms": round(STAGE_SECONDS.quantile(q, stage=stage) * 1000, 1)
+            for q in (0.5, 0.95, 0.99)
+        }
+    return summary
+
+# ============================================================================
+# Per-Request Stage Timings
+# ============================================================================
+
+# (stage, seconds, description) entries of the current request; tasks and
+# stage threads (see StageExecutor.run) share the list of their request
+_request_timings: ContextVar[Optional[list]] = ContextVar("request_timings", default=None)
+
+# Labels of the innermost running stage, filled in by the code that knows
+# them (e.g. which STT backend answered)
+_stage_labels: ContextVar[Optional[dict]] = ContextVar("stage_labels", default=None)
+
+def start_request_timings() -> list:
+    """Begin collecting stage timings for the current request"""
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+def record_stage(stage: str, seconds: float, labels: Dict = None):
+    """
+    Record a finished stage
+
+    Args:
+        stage: Stage name (session, stt, image, gemini, tts, response_write)
+        seconds: Duration
+        labels: Optional backend/language labels
+    """
+    labels = labels or {}
+    STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+    timings = _request_timings.get()
+    if timings is not None:
+        description = " ".join(str(labels[name]) for name in ("backend", "language") if labels.get(name))
+        timings.append((stage, seconds, description))
+
+@contextmanager
+def time_stage(stage: str, **labels):
+    """
+    Time a block as a pipeline stage
+
+    Yields the stage's label dict; code running inside the block (including
+    stage threads) can add labels with annotate_stage().
+    """
+    labels = dict(labels)
+    token = _stage_labels.set(labels)
+    start = time.perf_counter()
+    try:
+        yield labels
+    except BaseException:
+        STAGE_FAILURES.inc(stage=stage)
+        raise
+    finally:
+        _stage_labels.reset(token)
+        record_stage(stage, time.perf_counter() - start, labels)
+
+def annotate_stage(**labels):
+    """Set labels (backend, language) of the stage currently being timed"""
+    current = _stage_labels.get()
+    if current is not None:
+        current.update(labels)
+
+def server_timing_header(timings: List[Tuple[str, float, str]], total: float) -> str:
+    """
+    Server-Timing header value for the stages recorded so far
+
+    Args:
+        timings: (stage, seconds, description) entries
+        total: Seconds since the request started
+
+    Returns:
+        e.g. 'session;dur=2.1, stt;dur=640.3;desc="vosk en", total;dur=1830.2'
+    """
+    entries = []
+    for stage, seconds, description in list(timings):
+        entry = f"{stage};dur={seconds * 1000:.1f}"
+        if description:
+            entry += f';desc="{description}"'
+        entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
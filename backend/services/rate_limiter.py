@@ -0,0 +1,256 @@
+"""
+Rate Limiter Module
+
+Per-client request limits using GCRA (generic cell rate algorithm, the
+"virtual scheduling" form of a token bucket). Each client is one number,
+its theoretical arrival time (TAT), so a check is O(1) in time and memory.
+Limits are enforced across all workers through Redis (one Lua script call
+per request) or, without Redis, per process with idle clients evicted by a
+timer wheel.
+"""
+
+import os
+import time
+from typing import Dict, Optional
+
+from services.circuit_breaker import CircuitBreaker
+from services.timer_wheel import TimerWheel
+
+# Try to import the asyncio Redis client
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# ============================================================================
+# Check Result
+# ============================================================================
+
+class RateLimitResult:
+    """Outcome of one rate limit check"""
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, retry_after: float = 0.0):
+        """
+        Args:
+            allowed: The request may proceed
+            limit: Requests allowed per window
+            remaining: Requests still allowed right now
+            retry_after: Seconds until the next request is allowed (if denied)
+        """
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.retry_after = retry_after
+
+# ============================================================================
+# In-Process Backend
+# ============================================================================
+
+class LocalRateLimitBackend:
+    """GCRA state of each client in this process"""
+
+    def __init__(self, max_requests: int, window_seconds: float, tick_seconds: float = 1.0):
+        """
+        Initialize in-process backend
+
+        Args:
+            max_requests: Requests allowed per window (also the burst size)
+            window_seconds: Window length in seconds
+            tick_seconds: Granularity of idle-client eviction
+        """
+        self.max_requests = max_requests
+        self.window = window_seconds
+        self.interval = window_seconds / max_requests
+        self.tats = {}  # key -> theoretical arrival time (monotonic)
+        # A client whose TAT has passed has its full quota again, exactly
+        # like a client never seen, so it can be forgotten
+        self.wheel = TimerWheel(tick_seconds=tick_seconds)
+
+    def check(self, key: str, now: Optional[float] = None) -> RateLimitResult:
+        """Count one request from a client if allowed"""
+        now = time.monotonic() if now is None else now
+        for idle_key in self.wheel.advance(now):
+            self.tats.pop(idle_key, None)
+
+        tat = max(self.tats.get(key, now), now)
+        new_tat = tat + self.interval
+        allow_at = new_tat - self.window
+        if now < allow_at:
+            return RateLimitResult(False, self.max_requests, 0, allow_at - now)
+
+        self.tats[key] = new_tat
+        self.wheel.schedule(key, new_tat)
+        remaining = int((now - allow_at) / self.interval + 1e-9)
+        return RateLimitResult(True, self.max_requests, remaining)
+
+    def __len__(self) -> int:
+        return len(self.tats)
+
+# ============================================================================
+# Redis Backend
+# ============================================================================
+
+# Same algorithm as LocalRateLimitBackend, atomically in Redis using the
+# Redis clock (workers' clocks may differ). Times are in microseconds.
+GCRA_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000000 + tonumber(clock[2])
+local interval = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - window
+if now < allow_at then
+    return {0, 0, allow_at - now}
+end
+
+redis.call('SET', KEYS[1], string.format('%.0f', new_tat), 'PX', math.ceil((new_tat - now) / 1000))
+return {1, math.floor((now - allow_at) / interval), 0}
+"""
+
+class RedisRateLimitBackend:
+    """GCRA state of each client in Redis, shared by all workers"""
+
+    KEY_PREFIX = "ratelimit:"
+
+    def __init__(self, redis_url: str, max_requests: int, window_seconds: float,
+                 pool_size: int = 10, socket_timeout: float = 0.5):
+        """
+        Initialize Redis backend (no connection is made until first use)
+
+        Args:
+            redis_url: Redis connection URL
+            max_requests: Requests allowed per window (also the burst size)
+            window_seconds: Window length in seconds
+            pool_size: Maximum pooled connections per worker
+            socket_timeout: Seconds before a Redis call counts as failed
+        """
+        self.max_requests = max_requests
+        self.interval_us = int(window_seconds * 1000000 / max_requests)
+        self.window_us = int(window_seconds * 1000000)
+        self.client = aioredis.from_url(
+            redis_url,
+            max_connections=pool_size,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_timeout
+        )
+        self.script = self.client.register_script(GCRA_SCRIPT)
+
+    async def check(self, key: str) -> RateLimitResult:
+        """Count one request from a client if allowed"""
+        allowed, remaining, retry_after_us = await self.script(
+            keys=[self.KEY_PREFIX + key],
+            args=[self.interval_us, self.window_us]
+        )
+        return RateLimitResult(
+            bool(allowed), self.max_requests, int(remaining), int(retry_after_us) / 1000000
+        )
+
+    async def close(self):
+        """Close pooled connections"""
+        await self.client.connection_pool.disconnect()
+
+# ============================================================================
+# Rate Limiter Class
+# ============================================================================
+
+class RateLimiter:
+    """Redis-backed limiter that falls back to per-process limits"""
+
+    def __init__(self, max_requests: int = 10, window_seconds: float = 60,
+                 redis_url: Optional[str] = None):
+        """
+        Initialize rate limiter
+
+        Args:
+            max_requests: Requests allowed per window (also the burst size)
+            window_seconds: Window length in seconds
+            redis_url: Redis connection URL (None: per-process limits only)
+        """
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.local = LocalRateLimitBackend(max_requests, window_seconds)
+        self.redis = None
+        self.stats = {"allowed": 0, "limited": 0}
+
+        # While Redis is failing, limits are enforced per worker
+        self.breaker = CircuitBreaker(
+            "Rate limit Redis",
+            failure_threshold=int(os.getenv("REDIS_FAILURE_THRESHOLD", "3")),
+            reset_timeout=float(os.getenv("REDIS_RESET_TIMEOUT", "30"))
+        )
+
+        if REDIS_AVAILABLE and redis_url:
+            try:
+                self.redis = RedisRateLimitBackend(
+                    redis_url,
+                    max_requests,
+                    window_seconds,
+                    socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+                )
+            except Exception as e:
+                print(f"Invalid Redis configuration for rate limiting: {e}")
+                self.redis = None
+
+    async def check(self, key: str) -> RateLimitResult:
+        """
+        Count one request from a client if it is within its limit
+
+        Args:
+            key: Client identifier (session/device ID or IP)
+
+        Returns:
+            RateLimitResult
+        """
+        result = None
+        if self.redis and self.breaker.allow():
+            try:
+                result = await self.redis.check(key)
+                self.breaker.record_success()
+            except Exception as e:
+                self.breaker.record_failure(e)
+
+        if result is None:
+            result = self.local.check(key)
+
+        self.stats["allowed" if result.allowed else "limited"] += 1
+        return result
+
+    async def close(self):
+        """Release Redis connections"""
+        if self.redis:
+            await self.redis.close()
+
+    def get_stats(self) -> Dict:
+        """Get counters and backend state"""
+        stats = dict(self.stats)
+        stats["backend"] = "redis" if self.redis else "memory"
+        stats["limit"] = self.max_requests
+        stats["window_seconds"] = self.window_seconds
+        stats["local_keys"] = len(self.local)
+        stats["redis_circuit"] = self.breaker.get_stats() if self.redis else None
+        return stats
+
+# ============================================================================
+# Global Rate Limiter Instance
+# ============================================================================
+
+rate_limiter = None
+
+def init_rate_limiter(max_requests: int = 10, window_seconds: float = 60) -> RateLimiter:
+    """Initialize the global rate limiter (shared through Redis if REDIS_URL is set)"""
+    global rate_limiter
+    rate_limiter = RateLimiter(max_requests, window_seconds, os.getenv("REDIS_URL"))
+    return rate_limiter
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the global rate limiter instance"""
+    global rate_limiter
+    if rate_limiter is None:
+        rate_limiter = init_rate_limiter()
+    return rate_limiter
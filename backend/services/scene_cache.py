@@ -0,0 +1,206 @@
+"""
+Scene Cache Module
+
+Reuses recent Gemini answers when a user asks the same question about the
+same scene again (e.g. pressing the snapshot button repeatedly while
+facing the same direction). Frames are compared with a 64-bit perceptual
+difference hash (dHash); a recent frame of the same session within a
+configurable Hamming distance, with the same query and language, is a hit.
+"""
+
+import os
+import io
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+# Try to import Pillow
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# ============================================================================
+# Perceptual Hash
+# ============================================================================
+
+def compute_dhash(image_data: bytes) -> Optional[int]:
+    """
+    Compute the 64-bit difference hash of an image
+
+    The frame is decoded in JPEG draft mode at 1/8 scale, shrunk to 9x8
+    grayscale, and each bit records whether a pixel is brighter than its
+    right-hand neighbour. Module-level so it can run on the CPU process pool.
+
+    Args:
+        image_data: Encoded image data
+
+    Returns:
+        Hash as an int, or None if the image cannot be decoded
+    """
+    if not PIL_AVAILABLE:
+        return None
+
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        image.draft("L", (64, 64))
+        pixels = list(image.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    except Exception as e:
+        print(f"Could not hash image: {e}")
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count("1")
+
+def _normalize_query(query: str) -> str:
+    """Case- and punctuation-insensitive form of a user query"""
+    return " ".join(re.sub(r"[^\w\s]", " ", (query or "").lower()).split())
+
+# ============================================================================
+# Scene Cache Class
+# ============================================================================
+
+class SceneCache:
+    """Per-session cache of recent (frame hash, query) -> answer"""
+
+    def __init__(self, ttl_seconds: float = 60, max_distance: int = 6,
+                 entries_per_session: int = 4, max_sessions: int = 1000):
+        """
+        Initialize scene cache
+
+        Args:
+            ttl_seconds: How long an answer may be reused
+            max_distance: Maximum Hamming distance between frame hashes
+            entries_per_session: Recent scenes remembered per session
+            max_sessions: Sessions tracked before the least recent is evicted
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.entries_per_session = entries_per_session
+        self.max_sessions = max_sessions
+
+        self.sessions = OrderedDict()  # session_id -> deque of entries
+        self.lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "expired": 0,
+            "evictions": 0
+        }
+
+    def lookup(self, session_id: str, image_hash: Optional[int],
+               query: str, language: str) -> Optional[str]:
+        """
+        Find a reusable answer for a frame and query
+
+        Args:
+            session_id: User session ID
+            image_hash: dHash of the frame (None disables the lookup)
+            query: User query ("" in snapshot mode)
+            language: Response language
+
+        Returns:
+            Cached response text or None
+        """
+        if image_hash is None or not session_id:
+            return None
+
+        query_key = _normalize_query(query)
+        now = time.monotonic()
+
+        with self.lock:
+            entries = self.sessions.get(session_id)
+            if entries:
+                self._drop_expired(entries, now)
+                for entry in reversed(entries):
+                    if (entry["query"] == query_key and entry["language"] == language
+                            and hamming_distance(entry["hash"], image_hash) <= self.max_distance):
+                        self.sessions.move_to_end(session_id)
+                        self.stats["hits"] += 1
+                        return entry["response"]
+
+            self.stats["misses"] += 1
+            return None
+
+    def store(self, session_id: str, image_hash: Optional[int], query: str,
+              language: str, response_text: str):
+        """Remember the answer for a frame and query"""
+        if image_hash is None or not session_id or not response_text:
+            return
+
+        with self.lock:
+            entries = self.sessions.get(session_id)
+            if entries is None:
+                entries = deque(maxlen=self.entries_per_session)
+                self.sessions[session_id] = entries
+            self.sessions.move_to_end(session_id)
+
+            entries.append({
+                "hash": image_hash,
+                "query": _normalize_query(query),
+                "language": language,
+                "response": response_text,
+                "stored_at": time.monotonic()
+            })
+            self.stats["stores"] += 1
+
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear_session(self, session_id: str):
+        """Forget all scenes of a session"""
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def get_stats(self) -> Dict:
+        """Get hit/miss counters and hit ratio"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["sessions"] = len(self.sessions)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _drop_expired(self, entries: deque, now: float):
+        """Remove entries older than the TTL (lock held)"""
+        while entries and now - entries[0]["stored_at"] > self.ttl_seconds:
+            entries.popleft()
+            self.stats["expired"] += 1
+
+# ============================================================================
+# Global Scene Cache Instance
+# ============================================================================
+
+scene_cache = None
+
+def init_scene_cache() -> SceneCache:
+    """Initialize the global scene cache from environment settings"""
+    global scene_cache
+    scene_cache = SceneCache(
+        ttl_seconds=float(os.getenv("SCENE_CACHE_TTL", "60")),
+        max_distance=int(os.getenv("SCENE_CACHE_MAX_DISTANCE", "6")),
+        entries_per_session=int(os.getenv("SCENE_CACHE_ENTRIES_PER_SESSION", "4")),
+        max_sessions=int(os.getenv("SCENE_CACHE_MAX_SESSIONS", "1000"))
+    )
+    return scene_cache
+
+def get_scene_cache() -> SceneCache:
+    """Get the global scene cache instance"""
+    global scene_cache
+    if scene_cache is None:
+        scene_cache = init_scene_cache()
+    return scene_cache
@@ -10,10 +10,14 @@ Supports multilingual transcription with automatic language detection.
 
 import os
 import io
-from typing import Tuple, Optional
-import tempfile
+from typing import Dict, List, Tuple, Optional
 import json
 import wave
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from services.executor import DEFAULT_STAGE_LIMITS
+from services.metrics import annotate_stage
 
 # Import SpeechRecognition
 try:
@@ -46,6 +50,90 @@ try:
 except ImportError:
     LANGDETECT_AVAILABLE = False
 
+# Google Web Speech languages recognized concurrently (code, our code)
+RECOGNITION_LANGUAGES = [
+    ("en-US", "en"),
+    ("hi-IN", "hi")
+]
+
+# ============================================================================
+# Vosk Recognizer Pool
+# ============================================================================
+
+class VoskRecognizerPool:
+    """Bounded pool of reusable KaldiRecognizers per (language, sample rate)"""
+    
+    def __init__(self, models: Dict, max_idle: int = 4):
+        """
+        Initialize recognizer pool
+        
+        Args:
+            models: Loaded Vosk models by language code
+            max_idle: Maximum idle recognizers kept per (language, sample rate)
+        """
+        self.models = models
+        self.max_idle = max(0, max_idle)
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "returned": 0,
+            "discarded": 0
+        }
+    
+    def acquire(self, lang: str, sample_rate: int):
+        """
+        Get a recognizer for a language and sample rate
+        
+        Reuses an idle recognizer when one is available (hit), otherwise
+        allocates a new one (miss).
+        """
+        key = (lang, sample_rate)
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                self.stats["hits"] += 1
+                return idle.pop()
+            self.stats["misses"] += 1
+        
+        rec = KaldiRecognizer(self.models[lang], sample_rate)
+        rec.SetWords(True)
+        return rec
+    
+    def release(self, lang: str, sample_rate: int, rec, reusable: bool = True):
+        """
+        Reset a recognizer and return it to the pool
+        
+        Args:
+            lang: Language code the recognizer was acquired for
+            sample_rate: Sample rate the recognizer was acquired for
+            rec: The recognizer
+            reusable: False to drop it (e.g. after a decoding error)
+        """
+        if reusable:
+            try:
+                rec.Reset()
+            except Exception as e:
+                print(f"Could not reset Vosk recognizer for {lang}: {e}")
+                reusable = False
+        
+        key = (lang, sample_rate)
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if reusable and len(idle) < self.max_idle:
+                idle.append(rec)
+                self.stats["returned"] += 1
+            else:
+                self.stats["discarded"] += 1
+    
+    def get_stats(self) -> Dict:
+        """Get pool hit/miss counters and idle recognizer counts"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["idle"] = {f"{lang}:{rate}": len(recs) for (lang, rate), recs in self.idle.items()}
+        return stats
+
 # ============================================================================
 # STT Service Class
 # ============================================================================
@@ -62,10 +150,26 @@ class STTService:
         """
         self.recognizer = None
         self.vosk_models = {}
+        self.recognizer_pool = None
+        
+        # Concurrent per-language recognition (see _transcribe_speech_recognition)
+        self.language_rule = os.getenv("STT_LANGUAGE_RULE", "script").lower()
+        self.early_exit_confidence = float(os.getenv("STT_EARLY_EXIT_CONFIDENCE", "0.85"))
+        # An abandoned (losing) request keeps its thread until it returns, so
+        # every concurrent STT call needs one thread per language
+        stt_limit = int(os.getenv("STAGE_LIMIT_STT", str(DEFAULT_STAGE_LIMITS["stt"])))
+        self.recognition_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv(
+                "STT_RECOGNITION_WORKERS", str(stt_limit * len(RECOGNITION_LANGUAGES))
+            )),
+            thread_name_prefix="stt-recognize"
+        )
         
         # Initialize SpeechRecognition
         if SPEECH_RECOGNITION_AVAILABLE:
             self.recognizer = sr.Recognizer()
+            # Bounds each Web Speech request, including abandoned ones
+            self.recognizer.operation_timeout = float(os.getenv("STT_REQUEST_TIMEOUT", "8"))
             self.primary_backend = "speech_recognition"
             print("Using SpeechRecognition (Google Web Speech) as primary STT backend")
         else:
@@ -75,6 +179,10 @@ class STTService:
         # Initialize Vosk models
         if VOSK_AVAILABLE:
             self._load_vosk_models()
+            self.recognizer_pool = VoskRecognizerPool(
+                self.vosk_models,
+                max_idle=int(os.getenv("VOSK_POOL_SIZE", "4"))
+            )
             print("Vosk offline STT initialized as fallback")
         else:
             print("Warning: Vosk not available for offline fallback!")
@@ -116,6 +224,7 @@ class STTService:
                 text, language = result
                 if language not in {"en", "hi"}:
                     language = self._detect_language_from_text(text)
+                annotate_stage(backend="speech_recognition", language=language)
                 return text, language
         
         # Fallback to Vosk (offline) whenever available
@@ -125,16 +234,23 @@ class STTService:
                 text, language = result
                 if language not in {"en", "hi"}:
                     language = self._detect_language_from_text(text)
+                annotate_stage(backend="vosk", language=language)
                 return text, language
         
         # Return empty if all fail
         print("All STT backends failed")
+        annotate_stage(backend="none")
         return "", "en"
     
     def _transcribe_speech_recognition(self, audio_data: bytes, audio_format: str) -> Optional[Tuple[str, str]]:
         """
         Transcribe using SpeechRecognition (Google Web Speech API)
         
+        English and Hindi recognition run concurrently. If the first result
+        back already wins under STT_LANGUAGE_RULE (see _is_confident_result),
+        the other request is abandoned; otherwise the winner is picked by
+        the rule once both have answered.
+        
         Args:
             audio_data: Audio data as bytes
             audio_format: Audio format
@@ -151,35 +267,17 @@ class STTService:
             with sr.AudioFile(audio_io) as source:
                 audio = self.recognizer.record(source)
             
-            # Try recognizing with different languages
-            languages = [
-                ("en-US", "en"),
-                ("hi-IN", "hi")
+            # Recognize all languages at once
+            futures = [
+                self.recognition_pool.submit(self._recognize_google, audio, lang_code, short_code)
+                for lang_code, short_code in RECOGNITION_LANGUAGES
             ]
             
-            best_result = None
-            best_length = 0
-            
-            for lang_code, short_code in languages:
-                try:
-                    # Use Google Web Speech API (free, no API key required)
-                    text = self.recognizer.recognize_google(audio, language=lang_code)
-                    
-                    if text and len(text) > best_length:
-                        best_length = len(text)
-                        best_result = (text.strip(), short_code)
-                    
-                except sr.UnknownValueError:
-                    # Speech was unintelligible in this language
-                    continue
-                except sr.RequestError as e:
-                    # API request failed (might be offline)
-                    print(f"SpeechRecognition request error for {lang_code}: {e}")
-                    continue
+            best_result = self._choose_recognition_result(self._collect_recognition_results(futures))
             
             if best_result:
-                text, language = best_result
-                print(f"SpeechRecognition transcription: '{text}' (language: {language})")
+                text, language, confidence = best_result
+                print(f"SpeechRecognition transcription: '{text}' (language: {language}, confidence: {confidence:.2f})")
                 return text, language
             
             return None
@@ -188,10 +286,125 @@ class STTService:
             print(f"SpeechRecognition transcription error: {e}")
             return None
     
+    def _recognize_google(self, audio, lang_code: str, short_code: str) -> Optional[Tuple[str, str, float]]:
+        """
+        Recognize one language with Google Web Speech API
+        
+        Args:
+            audio: SpeechRecognition AudioData
+            lang_code: Google language code (en-US, hi-IN)
+            short_code: Our language code (en, hi)
+        
+        Returns:
+            Tuple of (text, language_code, confidence) or None
+        """
+        try:
+            # Use Google Web Speech API (free, no API key required)
+            response = self.recognizer.recognize_google(audio, language=lang_code, show_all=True)
+        except sr.UnknownValueError:
+            # Speech was unintelligible in this language
+            return None
+        except sr.RequestError as e:
+            # API request failed (might be offline)
+            print(f"SpeechRecognition request error for {lang_code}: {e}")
+            return None
+        
+        # show_all returns [] when nothing was recognized
+        if not isinstance(response, dict) or not response.get("alternative"):
+            return None
+        
+        best = response["alternative"][0]
+        text = best.get("transcript", "").strip()
+        if not text:
+            return None
+        
+        # Google only reports confidence for the top alternative, and not always
+        confidence = float(best.get("confidence", 0.0))
+        return text, short_code, confidence
+    
+    def _collect_recognition_results(self, futures: List) -> List[Tuple[str, str, float]]:
+        """
+        Gather per-language results as they finish
+        
+        Stops at the first result that wins under STT_LANGUAGE_RULE. Requests
+        not started yet are cancelled; running ones are left to finish (they
+        are bounded by the recognizer's operation timeout).
+        
+        Args:
+            futures: Futures of _recognize_google calls
+        
+        Returns:
+            Results received so far
+        """
+        results = []
+        for future in as_completed(futures):
+            result = future.result()
+            if not result:
+                continue
+            results.append(result)
+            
+            if self._is_confident_result(result):
+                # Early exit: don't wait for the other language
+                for other in futures:
+                    other.cancel()
+                break
+        return results
+    
+    def _is_confident_result(self, result: Tuple[str, str, float]) -> bool:
+        """
+        Check if a result wins under STT_LANGUAGE_RULE without the others
+        
+        longest: never (another transcript may be longer)
+        confidence: confidence reaches STT_EARLY_EXIT_CONFIDENCE
+        script: as confidence, and the text is in its language's script
+        """
+        text, language, confidence = result
+        if self.language_rule == "longest":
+            return False
+        if confidence < self.early_exit_confidence:
+            return False
+        if self.language_rule == "confidence":
+            return True
+        return self._script_matches(text, language)
+    
+    def _choose_recognition_result(self, results: List[Tuple[str, str, float]]) -> Optional[Tuple[str, str, float]]:
+        """
+        Pick the winning transcription according to STT_LANGUAGE_RULE
+        
+        Rules:
+            longest: longest transcript (previous behaviour)
+            confidence: highest confidence, then longest
+            script: prefer transcripts written in their language's script,
+                    then highest confidence, then longest
+        """
+        if not results:
+            return None
+        
+        if self.language_rule == "longest":
+            return max(results, key=lambda r: len(r[0]))
+        
+        if self.language_rule == "confidence":
+            return max(results, key=lambda r: (r[2], len(r[0])))
+        
+        return max(results, key=lambda r: (self._script_matches(r[0], r[1]), r[2], len(r[0])))
+    
+    def _script_matches(self, text: str, language: str) -> bool:
+        """Check that text is written in the script of its language"""
+        devanagari_count = sum(1 for c in text if '\u0900' <= c <= '\u097F')
+        letter_count = sum(1 for c in text if c.isalpha()) or 1
+        
+        if language == "hi":
+            return devanagari_count > letter_count * 0.3
+        return devanagari_count == 0
+    
     def _transcribe_vosk(self, audio_data: bytes, audio_format: str) -> Optional[Tuple[str, str]]:
         """
         Transcribe using Vosk (offline)
         
+        The WAV is read once from memory and the same frame chunks are fed to
+        every loaded language model in parallel threads. The language whose
+        word-level results have the highest mean confidence wins.
+        
         Args:
             audio_data: Audio data as bytes
             audio_format: Audio format
@@ -200,70 +413,112 @@ class STTService:
             Tuple of (transcribed_text, detected_language_code) or None on error
         """
         try:
-            # Save audio to temporary WAV file for processing
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-                temp_file.write(audio_data)
-                temp_file_path = temp_file.name
+            # Read WAV frames straight from the upload buffer
+            with wave.open(io.BytesIO(audio_data), "rb") as wf:
+                # Vosk requires 16kHz sample rate
+                sample_rate = wf.getframerate()
+                if sample_rate != 16000:
+                    print(f"Warning: Vosk expects 16kHz audio, got {sample_rate}Hz")
+                
+                chunks = []
+                while True:
+                    data = wf.readframes(4000)
+                    if len(data) == 0:
+                        break
+                    chunks.append(data)
             
-            # Read WAV file properties
-            wf = wave.open(temp_file_path, "rb")
+            # Decode with every language model at once
+            language_order = [lang for lang in ('en', 'hi') if lang in self.vosk_models]
+            futures = [
+                self.recognition_pool.submit(self._decode_vosk, lang, sample_rate, chunks)
+                for lang in language_order
+            ]
+            results = [future.result() for future in futures]
+            results = [result for result in results if result]
             
-            # Vosk requires 16kHz sample rate
-            sample_rate = wf.getframerate()
-            if sample_rate != 16000:
-                print(f"Warning: Vosk expects 16kHz audio, got {sample_rate}Hz")
+            if not results:
+                # No successful transcription
+                return None
             
-            # Try each language model
-            language_order = ['en', 'hi']  # Try English first, then Hindi
+            # Highest mean word confidence wins; English first on ties
+            text, lang, confidence = max(results, key=lambda r: r[2])
+            print(f"Vosk transcription: '{text}' (language: {lang}, confidence: {confidence:.2f})")
+            return text, lang
             
-            for lang in language_order:
-                if lang not in self.vosk_models:
-                    continue
-                
-                try:
-                    # Reset file pointer
-                    wf.rewind()
-                    
-                    # Create recognizer with model
-                    rec = KaldiRecognizer(self.vosk_models[lang], sample_rate)
-                    rec.SetWords(True)
-                    
-                    # Process audio in chunks
-                    while True:
-                        data = wf.readframes(4000)
-                        if len(data) == 0:
-                            break
-                        rec.AcceptWaveform(data)
-                    
-                    # Get final result
-                    result = json.loads(rec.FinalResult())
-                    text = result.get('text', '').strip()
-                    
-                    if text:
-                        # Found non-empty transcription
-                        print(f"Vosk transcription: '{text}' (language: {lang})")
-                        wf.close()
-                        os.unlink(temp_file_path)
-                        return text, lang
-                
-                except Exception as e:
-                    print(f"Error with Vosk model for {lang}: {e}")
-                    continue
+        except Exception as e:
+            print(f"Vosk transcription error: {e}")
+            return None
+    
+    def _decode_vosk(self, lang: str, sample_rate: int, chunks: List[bytes]) -> Optional[Tuple[str, str, float]]:
+        """
+        Decode audio chunks with one Vosk language model
+        
+        Args:
+            lang: Language code of the model
+            sample_rate: Sample rate of the audio
+            chunks: PCM frame chunks shared by all models
+        
+        Returns:
+            Tuple of (text, language_code, mean_word_confidence) or None
+        """
+        # Reuse a pooled recognizer instead of allocating decoder state
+        rec = self.recognizer_pool.acquire(lang, sample_rate)
+        reusable = True
+        try:
+            # Process audio in chunks, collecting word results of each utterance
+            words = []
+            texts = []
+            for data in chunks:
+                if rec.AcceptWaveform(data):
+                    self._collect_vosk_result(json.loads(rec.Result()), texts, words)
             
-            wf.close()
-            os.unlink(temp_file_path)
+            # Get final result
+            self._collect_vosk_result(json.loads(rec.FinalResult()), texts, words)
             
-            # No successful transcription
-            return None
+            text = " ".join(texts).strip()
+            if not text:
+                return None
             
+            confidence = sum(word.get('conf', 0.0) for word in words) / len(words) if words else 0.0
+            return text, lang, confidence
+        
         except Exception as e:
-            print(f"Vosk transcription error: {e}")
-            try:
-                os.unlink(temp_file_path)
-            except:
-                pass
+            print(f"Error with Vosk model for {lang}: {e}")
+            reusable = False
             return None
-
+        
+        finally:
+            self.recognizer_pool.release(lang, sample_rate, rec, reusable)
+    
+    def _collect_vosk_result(self, result: dict, texts: List[str], words: List[dict]):
+        """Append the text and word-level results of one Vosk utterance"""
+        text = result.get('text', '').strip()
+        if text:
+            texts.append(text)
+            words.extend(result.get('result', []))
+    
+    def warm_up(self) -> bool:
+        """
+        Run a first decode on every loaded Vosk model
+        
+        Pages in the model data and leaves one idle recognizer per model
+        in the pool, so the first real request does not pay for either.
+        
+        Returns:
+            True if at least one STT backend is usable
+        """
+        silence = b"\x00\x00" * 8000  # 0.5 s of 16kHz 16-bit audio
+        for lang in self.vosk_models:
+            self._decode_vosk(lang, 16000, [silence])
+        
+        return bool(self.recognizer or self.vosk_models)
+    
+    def get_recognizer_pool_stats(self) -> Dict:
+        """Get Vosk recognizer pool metrics (empty when Vosk is not loaded)"""
+        if not self.recognizer_pool:
+            return {}
+        return self.recognizer_pool.get_stats()
+    
     def _detect_language_from_text(self, text: str) -> str:
         """
         Detect language from transcribed text as fallback
@@ -0,0 +1,97 @@
+"""
+Timer Wheel Module
+
+Hashed timer wheel for expiring large numbers of keys. Scheduling,
+rescheduling and cancelling a key are O(1); each tick only looks at the keys
+hashed into the slots that became due, never at every key.
+"""
+
+import math
+import time
+from typing import Dict, Hashable, List
+
+# ============================================================================
+# Timer Wheel Class
+# ============================================================================
+
+class TimerWheel:
+    """Expiry deadlines bucketed into fixed-width time slots"""
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 4096):
+        """
+        Initialize timer wheel
+
+        Args:
+            tick_seconds: Width of one slot (expiry granularity)
+            slots: Number of slots; deadlines further away than one rotation
+                   stay in their slot until the rotation that reaches them
+        """
+        self.tick_seconds = tick_seconds
+        self.slots = [set() for _ in range(slots)]
+        self.deadlines = {}  # key -> (monotonic deadline, slot index)
+        # Last tick whose slot has been processed; the tick in progress
+        # never is, since deadlines later in it have not passed yet
+        self.last_tick = self._tick_of(time.monotonic()) - 1
+
+    def _tick_of(self, when: float) -> int:
+        """Absolute tick number of a monotonic time"""
+        return int(math.floor(when / self.tick_seconds))
+
+    def schedule(self, key: Hashable, deadline: float):
+        """
+        Set (or move) the expiry deadline of a key
+
+        Args:
+            key: Key to expire
+            deadline: Monotonic time at which the key expires
+        """
+        self.cancel(key)
+        # A deadline in an already-processed tick goes to the next tick's slot
+        tick = max(self._tick_of(deadline), self.last_tick + 1)
+        index = tick % len(self.slots)
+        self.slots[index].add(key)
+        self.deadlines[key] = (deadline, index)
+
+    def cancel(self, key: Hashable):
+        """Stop tracking a key"""
+        entry = self.deadlines.pop(key, None)
+        if entry is not None:
+            self.slots[entry[1]].discard(key)
+
+    def is_expired(self, key: Hashable, now: float) -> bool:
+        """True if the key's deadline has passed (even before its tick ran)"""
+        entry = self.deadlines.get(key)
+        return entry is not None and entry[0] <= now
+
+    def advance(self, now: float) -> List[Hashable]:
+        """
+        Process the slots of every tick that has fully passed
+
+        A key is returned at most one tick after its deadline.
+
+        Args:
+            now: Current monotonic time
+
+        Returns:
+            Keys whose deadlines have passed (no longer tracked)
+        """
+        current = self._tick_of(now)
+        expired = []
+        # Catch up on missed ticks, but never walk more than one rotation
+        first = max(self.last_tick + 1, current - len(self.slots))
+        for tick in range(first, current):
+            slot = self.slots[tick % len(self.slots)]
+            due = [key for key in slot if self.deadlines[key][0] <= now]
+            for key in due:
+                slot.discard(key)
+                del self.deadlines[key]
+            expired.extend(due)
+        self.last_tick = max(self.last_tick, current - 1)
+        return expired
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+    def get_stats(self) -> Dict:
+        """Get the number of tracked keys"""
+        return {"tracked": len(self.deadlines), "slots": len(self.slots)}
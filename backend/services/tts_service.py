@@ -7,8 +7,27 @@ Supports multilingual audio generation (English, Hindi).
 
 import os
 import io
-from typing import Optional
+import re
+import wave
+from typing import Dict, List, Optional, Tuple
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from services.executor import get_stage_executor
+from services.audio_cache import AudioCache
+from services.metrics import annotate_stage
+from services.audio_codec import (
+    codec_available,
+    convert_pcm,
+    transcode_mp3_to_wav,
+    get_audio_encoder,
+    DEFAULT_AUDIO_FORMAT,
+    NUMPY_AVAILABLE,
+    DEVICE_SAMPLE_RATE,
+    DEVICE_CHANNELS,
+    DEVICE_SAMPLE_WIDTH
+)
 
 # Try to import gTTS
 try:
@@ -26,6 +45,196 @@ except ImportError:
     PYTTSX3_AVAILABLE = False
     print("pyttsx3 library not available")
 
+# Try to import pydub for MP3 to WAV conversion
+try:
+    from pydub import AudioSegment
+    PYDUB_AVAILABLE = True
+except ImportError:
+    PYDUB_AVAILABLE = False
+
+# ============================================================================
+# Audio Transcoding
+# ============================================================================
+
+def _transcode_mp3_to_wav(mp3_data: bytes) -> bytes:
+    """
+    Convert MP3 bytes to 16kHz mono 16-bit WAV for I2S DAC playback
+    
+    Fallback for when in-process decoding (services.audio_codec) is not
+    available. Module-level so it can run on the CPU process pool.
+    
+    Args:
+        mp3_data: MP3 audio data
+    
+    Returns:
+        WAV audio data as bytes
+    """
+    audio = AudioSegment.from_file(io.BytesIO(mp3_data), format="mp3")
+    
+    # Convert to 16kHz mono for I2S DAC compatibility
+    audio = audio.set_frame_rate(16000)
+    audio = audio.set_channels(1)
+    audio = audio.set_sample_width(2)  # 16-bit
+    
+    # Export to WAV
+    wav_buffer = io.BytesIO()
+    audio.export(wav_buffer, format='wav')
+    return wav_buffer.getvalue()
+
+# ============================================================================
+# Streaming Helpers
+# ============================================================================
+
+# PCM format of streamed responses (matches the WAV output of synthesize)
+STREAM_SAMPLE_RATE = DEVICE_SAMPLE_RATE
+STREAM_CHANNELS = DEVICE_CHANNELS
+STREAM_SAMPLE_WIDTH = DEVICE_SAMPLE_WIDTH  # 16-bit
+
+# Sentence boundaries: Latin terminators and the Devanagari danda
+_SENTENCE_END = re.compile(r'(?<=[.!?\u0964\u0965])\s+|\n+')
+
+# Sentences shorter than this are merged with the next one, since each
+# synthesis call has a fixed round-trip cost
+MIN_SENTENCE_CHARS = 20
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split response text into sentences for incremental synthesis
+    
+    Args:
+        text: Full response text
+    
+    Returns:
+        List of non-empty sentences in order
+    """
+    sentences = []
+    pending = ""
+    
+    for part in _SENTENCE_END.split(text or ""):
+        part = part.strip()
+        if not part:
+            continue
+        pending = f"{pending} {part}" if pending else part
+        if len(pending) >= MIN_SENTENCE_CHARS:
+            sentences.append(pending)
+            pending = ""
+    
+    if pending:
+        sentences.append(pending)
+    
+    return sentences
+
+class PhraseSplitter:
+    """Incrementally cut streamed text into speakable phrases"""
+    
+    # Phrases longer than this are cut at the last clause break (comma,
+    # semicolon, colon) so speech can start before a long sentence ends
+    MAX_PHRASE_CHARS = 160
+    
+    _CLAUSE_BREAK = re.compile(r'[,;:]\s')
+    
+    def __init__(self):
+        self.buffer = ""
+    
+    def feed(self, text: str) -> List[str]:
+        """
+        Add streamed text and return the phrases it completed
+        
+        Args:
+            text: Next fragment of generated text
+        
+        Returns:
+            Completed phrases, in order (possibly empty)
+        """
+        self.buffer += text
+        
+        # Everything up to the last sentence boundary is complete
+        boundaries = list(_SENTENCE_END.finditer(self.buffer))
+        if boundaries:
+            cut = boundaries[-1].end()
+            sentences = split_sentences(self.buffer[:cut])
+            self.buffer = self.buffer[cut:]
+            
+            # Keep a trailing short fragment to merge with what follows
+            if sentences and len(sentences[-1]) < MIN_SENTENCE_CHARS:
+                self.buffer = f"{sentences.pop()} {self.buffer}"
+            if sentences:
+                return sentences
+        
+        if len(self.buffer) > self.MAX_PHRASE_CHARS:
+            breaks = list(self._CLAUSE_BREAK.finditer(self.buffer))
+            if breaks:
+                cut = breaks[-1].end()
+                phrase = self.buffer[:cut].strip()
+                self.buffer = self.buffer[cut:]
+                return [phrase]
+        
+        return []
+    
+    def flush(self) -> List[str]:
+        """Return whatever text remains once the stream has ended"""
+        phrases = split_sentences(self.buffer)
+        self.buffer = ""
+        return phrases
+
+def wav_to_pcm(wav_data: bytes) -> Optional[bytes]:
+    """
+    Extract PCM frames from WAV data in the stream format
+    
+    Converts sample rate, channels and sample width when the WAV does not
+    already match STREAM_SAMPLE_RATE / STREAM_CHANNELS / STREAM_SAMPLE_WIDTH.
+    
+    Args:
+        wav_data: WAV audio data
+    
+    Returns:
+        Raw PCM bytes or None if the data cannot be converted
+    """
+    try:
+        with wave.open(io.BytesIO(wav_data), "rb") as wf:
+            params = (wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+            frames = wf.readframes(wf.getnframes())
+    except Exception as e:
+        print(f"Could not read synthesized WAV: {e}")
+        return None
+    
+    if params == (STREAM_SAMPLE_RATE, STREAM_CHANNELS, STREAM_SAMPLE_WIDTH):
+        return frames
+    
+    frame_rate, channels, sample_width = params
+    if NUMPY_AVAILABLE:
+        return convert_pcm(frames, frame_rate, channels, sample_width, STREAM_SAMPLE_RATE)
+    
+    if not PYDUB_AVAILABLE:
+        print(f"Warning: cannot convert {params} audio to stream format without pydub")
+        return None
+    
+    audio = AudioSegment(data=frames, sample_width=sample_width,
+                         frame_rate=frame_rate, channels=channels)
+    audio = audio.set_frame_rate(STREAM_SAMPLE_RATE)
+    audio = audio.set_channels(STREAM_CHANNELS)
+    audio = audio.set_sample_width(STREAM_SAMPLE_WIDTH)
+    return audio.raw_data
+
+def encode_audio(wav_data: bytes, audio_format: str) -> Optional[bytes]:
+    """
+    Re-encode synthesized WAV into a negotiated output format
+    
+    Args:
+        wav_data: WAV audio data from synthesize
+        audio_format: Output format name (see services.audio_codec.AUDIO_ENCODERS)
+    
+    Returns:
+        Encoded WAV file, or None if the input could not be converted
+    """
+    if audio_format == DEFAULT_AUDIO_FORMAT:
+        return wav_data
+    
+    pcm = wav_to_pcm(wav_data)
+    if pcm is None:
+        return None
+    return get_audio_encoder(audio_format).encode_all(pcm)
+
 # ============================================================================
 # TTS Service Class
 # ============================================================================
@@ -45,8 +254,17 @@ class TTSService:
             self.primary_backend = None
             print("Warning: No TTS backend available!")
         
+        # Cache of synthesized audio (memory LRU plus optional disk store)
+        self.audio_cache = AudioCache(
+            max_bytes=int(float(os.getenv("TTS_CACHE_MAX_MB", "32")) * 1024 * 1024),
+            disk_dir=os.getenv("TTS_CACHE_DIR") or None,
+            disk_max_bytes=int(float(os.getenv("TTS_CACHE_DISK_MAX_MB", "256")) * 1024 * 1024)
+        )
+        
         # Initialize pyttsx3 engine if available
+        # (the engine is not thread-safe, so access is serialized by a lock)
         self.pyttsx3_engine = None
+        self.pyttsx3_lock = threading.Lock()
         if PYTTSX3_AVAILABLE:
             try:
                 self.pyttsx3_engine = pyttsx3.init()
@@ -96,22 +314,111 @@ class TTSService:
         if not text:
             return None
         
-        # Try primary backend first
-        if self.primary_backend == "gtts":
-            audio_data = self._synthesize_gtts(text, language)
-            if audio_data:
-                return audio_data
+        # Fixed and repeated phrases are served from the audio cache
+        cache_key = AudioCache.make_key(text, language, self.primary_backend, output_format)
+        audio_data = self.audio_cache.get(cache_key)
+        if audio_data:
+            annotate_stage(backend="cache", language=language)
+            return audio_data
+        
+        # Try primary backend first (only its output is cached, so a
+        # fallback voice never outlives an outage of the primary backend)
+        audio_data = self._synthesize_primary(text, language)
+        if audio_data:
+            self.audio_cache.put(cache_key, audio_data)
+            annotate_stage(backend=self.primary_backend, language=language)
+            return audio_data
         
         # Fallback to pyttsx3
-        if PYTTSX3_AVAILABLE and self.pyttsx3_engine:
+        if self.primary_backend != "pyttsx3" and PYTTSX3_AVAILABLE and self.pyttsx3_engine:
             audio_data = self._synthesize_pyttsx3(text, language)
             if audio_data:
+                annotate_stage(backend="pyttsx3", language=language)
                 return audio_data
         
         # If all fail, return None
         print("All TTS backends failed")
+        annotate_stage(backend="none", language=language)
         return None
     
+    def _synthesize_primary(self, text: str, language: str) -> Optional[bytes]:
+        """Synthesize with the primary backend only"""
+        if self.primary_backend == "gtts":
+            return self._synthesize_gtts(text, language)
+        if self.primary_backend == "pyttsx3" and self.pyttsx3_engine:
+            return self._synthesize_pyttsx3(text, language)
+        return None
+    
+    def prewarm(self, phrases: List[Tuple[str, str]], output_format: str = "wav") -> int:
+        """
+        Synthesize fixed phrases into the audio cache and pin them
+        
+        Phrases already in the on-disk store are loaded from it instead
+        of being synthesized again.
+        
+        Args:
+            phrases: (text, language) pairs
+            output_format: Output audio format
+        
+        Returns:
+            Number of phrases available in the cache
+        """
+        def prewarm_one(phrase: Tuple[str, str]) -> bool:
+            text, language = phrase
+            cache_key = AudioCache.make_key(text, language, self.primary_backend, output_format)
+            audio_data = self.audio_cache.get(cache_key) or self._synthesize_primary(text, language)
+            if not audio_data:
+                print(f"Could not prewarm phrase: {text[:40]}")
+                return False
+            self.audio_cache.put(cache_key, audio_data, pin=True)
+            return True
+        
+        with ThreadPoolExecutor(max_workers=4, thread_name_prefix="tts-prewarm") as pool:
+            count = sum(pool.map(prewarm_one, phrases))
+        
+        print(f"Prewarmed {count}/{len(phrases)} fixed phrases into the audio cache")
+        return count
+    
+    def get_cache_stats(self) -> Dict:
+        """Get audio cache hit/miss counters and sizes"""
+        return self.audio_cache.get_stats()
+    
+    def synthesize_pcm(self, text: str, language: str = "en") -> Optional[bytes]:
+        """
+        Convert text to raw PCM frames for streaming responses
+        
+        Args:
+            text: Text to convert to speech (typically one sentence)
+            language: Language code (en, hi)
+        
+        Returns:
+            PCM bytes (16kHz mono 16-bit, no header) or None on error
+        """
+        wav_data = self.synthesize(text, language, "wav")
+        if not wav_data:
+            return None
+        return wav_to_pcm(wav_data)
+    
+    def warm_up(self, phrases: List[Tuple[str, str]] = None) -> bool:
+        """
+        Run first syntheses so backend imports and connections are set up
+        
+        Args:
+            phrases: Fixed (text, language) phrases to prewarm into the cache
+        
+        Returns:
+            True if a TTS backend is usable
+        
+        Raises:
+            RuntimeError: If a backend exists but nothing could be synthesized
+        """
+        if not self.primary_backend:
+            return False
+        
+        if not self.prewarm(phrases or [("Ready.", "en")]):
+            raise RuntimeError("First synthesis failed")
+        return True
+    
     def _synthesize_gtts(self, text: str, language: str) -> Optional[bytes]:
         """
         Synthesize speech using gTTS and convert to WAV for I2S DAC playback
@@ -135,43 +442,24 @@ class TTSService:
             # Create gTTS object
             tts = gTTS(text=text, lang=gtts_lang, slow=False)
             
-            # Save to temporary MP3 file
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as mp3_file:
-                mp3_path = mp3_file.name
+            # Write MP3 straight into memory
+            mp3_buffer = io.BytesIO()
+            tts.write_to_fp(mp3_buffer)
+            mp3_data = mp3_buffer.getvalue()
             
-            tts.save(mp3_path)
+            if codec_available():
+                # Decode and resample in-process (no ffmpeg, no temp files)
+                audio_data = transcode_mp3_to_wav(mp3_data)
+            elif PYDUB_AVAILABLE:
+                # Convert MP3 to WAV on the CPU process pool (pydub + ffmpeg)
+                audio_data = get_stage_executor().run_cpu_sync(_transcode_mp3_to_wav, mp3_data)
+            else:
+                # Fallback: return MP3 if no decoder is available
+                print("Warning: no MP3 decoder available, returning MP3 (will not play correctly on I2S DAC)")
+                return mp3_data
             
-            # Convert MP3 to WAV using pydub
-            try:
-                from pydub import AudioSegment
-                
-                # Load MP3
-                audio = AudioSegment.from_mp3(mp3_path)
-                
-                # Convert to 16kHz mono for I2S DAC compatibility
-                audio = audio.set_frame_rate(16000)
-                audio = audio.set_channels(1)
-                audio = audio.set_sample_width(2)  # 16-bit
-                
-                # Export to WAV
-                wav_buffer = io.BytesIO()
-                audio.export(wav_buffer, format='wav')
-                wav_buffer.seek(0)
-                audio_data = wav_buffer.read()
-                
-                # Clean up MP3 file
-                os.unlink(mp3_path)
-                
-                print(f"gTTS synthesis successful (language: {gtts_lang}, WAV size: {len(audio_data)} bytes)")
-                return audio_data
-                
-            except ImportError:
-                # Fallback: return MP3 if pydub not available
-                print("Warning: pydub not available, returning MP3 (will not play correctly on I2S DAC)")
-                with open(mp3_path, 'rb') as f:
-                    audio_data = f.read()
-                os.unlink(mp3_path)
-                return audio_data
+            print(f"gTTS synthesis successful (language: {gtts_lang}, WAV size: {len(audio_data)} bytes)")
+            return audio_data
             
         except Exception as e:
             print(f"gTTS synthesis error: {e}")
@@ -192,18 +480,19 @@ class TTSService:
             if not self.pyttsx3_engine:
                 return None
             
-            # Set voice based on language
-            voice_id = self.voice_map.get(language)
-            if voice_id:
-                self.pyttsx3_engine.setProperty('voice', voice_id)
-            
             # Create temporary file for output
             with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
                 temp_file_path = temp_file.name
             
-            # Save to file
-            self.pyttsx3_engine.save_to_file(text, temp_file_path)
-            self.pyttsx3_engine.runAndWait()
+            with self.pyttsx3_lock:
+                # Set voice based on language
+                voice_id = self.voice_map.get(language)
+                if voice_id:
+                    self.pyttsx3_engine.setProperty('voice', voice_id)
+                
+                # Save to file
+                self.pyttsx3_engine.save_to_file(text, temp_file_path)
+                self.pyttsx3_engine.runAndWait()
             
             # Read the file
             with open(temp_file_path, 'rb') as audio_file:
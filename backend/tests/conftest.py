@@ -0,0 +1,174 @@
+"""
+Shared test setup and fixtures
+
+Tests import backend modules the way the server does (services.x,
+models.x, server.x), so the backend directory must be on the path.
+"""
+
+import os
+import sys
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def redis_backends():
+    """
+    Factory of RedisSessionBackends sharing one fake Redis server (one
+    backend per simulated worker); needs fakeredis
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    from models.session import RedisSessionBackend
+
+    server = fakeredis.FakeServer()
+
+    def make(local_cache_size: int = 1000) -> RedisSessionBackend:
+        backend = RedisSessionBackend("redis://localhost:6379", 1800, local_cache_size=local_cache_size)
+        backend.client = fakeredis.aioredis.FakeRedis(server=server)
+        return backend
+
+    return make
+
+# ============================================================================
+# Clocks
+# ============================================================================
+
+class FakeClock:
+    """Monotonic clock moved by hand (assign or add to .now)"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def fake_clock() -> FakeClock:
+    return FakeClock()
+
+# ============================================================================
+# Gemini Context Caching
+# ============================================================================
+
+class FakeModel:
+    """Model handed out by FakeCacheProvider"""
+
+    def __init__(self, model_name: str, system_instruction: str, cached_name: str = None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.cached_name = cached_name
+
+class FakeCacheProvider:
+    """Offline stand-in for the caching API (records calls, can reject)"""
+
+    available = True
+
+    def __init__(self):
+        self.reject_with = None  # raised by create(), to simulate rejections
+        self.created = []  # (model name, contents, ttl) of each create()
+
+    def local_model(self, model_name: str, system_instruction: str) -> FakeModel:
+        return FakeModel(model_name, system_instruction)
+
+    def create(self, model_name: str, system_instruction: str, contents: list,
+               ttl_seconds: int):
+        if self.reject_with is not None:
+            raise self.reject_with
+        self.created.append((model_name, contents, ttl_seconds))
+        name = f"cachedContents/fake-{len(self.created)}"
+        return FakeModel(model_name, system_instruction, name), name
+
+@pytest.fixture
+def cache_provider() -> FakeCacheProvider:
+    return FakeCacheProvider()
+
+@pytest.fixture
+def make_context_cache(cache_provider, fake_clock):
+    """Factory of ContextCaches using the fake provider and clock"""
+    from services.context_cache import ContextCache
+
+    def make(enabled: bool = True) -> ContextCache:
+        return ContextCache(
+            "gemini-1.5-flash",
+            lambda language: f"instruction-{language}",
+            provider_enabled=enabled,
+            cache_model_name="models/gemini-1.5-flash-001",
+            ttl_seconds=300,
+            scene_distance=6,
+            provider=cache_provider,
+            clock=fake_clock
+        )
+
+    return make
+
+# ============================================================================
+# Gemini Chats
+# ============================================================================
+
+class FakeResponse:
+    """Reply (or streamed chunk) of a FakeChat"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeChat:
+    """Gemini chat whose replies take a fixed time; a stream can fail midway"""
+
+    def __init__(self, delay: float = 0.0, text: str = "A chair in front of you.",
+                 history: list = None):
+        self.delay = delay
+        self.text = text
+        self.history = list(history or [])
+        self.model = None
+        self.calls = 0
+        self.stream_error = None  # raised by a stream after its first chunk
+        self.request_options = None
+
+    async def send_message_async(self, message):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return FakeResponse(self.text)
+
+    def send_message(self, message, stream=False, request_options=None):
+        self.calls += 1
+        self.request_options = request_options
+
+        def chunks():
+            yield FakeResponse(self.text)
+            if self.stream_error is not None:
+                raise self.stream_error
+
+        return chunks()
+
+class FakeContextCache:
+    provider_enabled = False
+
+@pytest.fixture
+def make_chat():
+    """Factory of FakeChats"""
+    return FakeChat
+
+@pytest.fixture
+def make_gemini_service():
+    """
+    Factory of GeminiServices without an API key; with a chat, every turn
+    is sent to that chat
+    """
+    from services.gemini_service import GeminiService
+
+    def make(chat: FakeChat = None, timeout: float = 0.2, deadline: float = 0.5,
+             max_retries: int = 2) -> GeminiService:
+        service = GeminiService(api_key=None)
+        service.timeout = timeout
+        service.deadline = deadline
+        service.max_retries = max_retries
+        service.retry_base = 0.0
+        if chat is not None:
+            service.model = object()
+            service.context_cache = FakeContextCache()
+            service._chat_for_turn = lambda *args: (chat, True)
+        return service
+
+    return make
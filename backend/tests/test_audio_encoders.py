@@ -0,0 +1,125 @@
+"""
+Output Encoding Tests (G.711 mu-law, IMA-ADPCM, WAV headers)
+
+Checked against a scalar G.711 reference encoder and a reference IMA-ADPCM
+decoder written out below.
+"""
+
+import struct
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from services.audio_codec import (
+    encode_mulaw,
+    encode_ima_adpcm_blocks,
+    get_audio_encoder,
+    IMA_BLOCK_ALIGN,
+    IMA_SAMPLES_PER_BLOCK,
+    WAVE_FORMAT_MULAW,
+    WAVE_FORMAT_IMA_ADPCM,
+    _IMA_STEP_TABLE,
+    _IMA_INDEX_TABLE
+)
+
+def _reference_mulaw(sample: int) -> int:
+    """linear2ulaw of the G.711 reference implementation (Sun g711.c)"""
+    sign = 0x80 if sample < 0 else 0
+    magnitude = min(abs(sample), 32635) + 0x84
+    exponent = 7
+    for segment, limit in enumerate((0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF, 0x3FFF, 0x7FFF)):
+        if magnitude <= limit:
+            exponent = segment
+            break
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return ~(sign | (exponent << 4) | mantissa) & 0xFF
+
+def _decode_ima_block(block: bytes) -> list:
+    """Reference decoder of one mono WAV IMA-ADPCM block"""
+    predictor, index = struct.unpack("<hB", block[:3])
+    samples = [predictor]
+    for byte in block[4:]:
+        for code in (byte & 0x0F, byte >> 4):
+            step = _IMA_STEP_TABLE[index]
+            delta = step >> 3
+            if code & 4:
+                delta += step
+            if code & 2:
+                delta += step >> 1
+            if code & 1:
+                delta += step >> 2
+            predictor += -delta if code & 8 else delta
+            predictor = max(-32768, min(32767, predictor))
+            index = max(0, min(88, index + _IMA_INDEX_TABLE[code & 7]))
+            samples.append(predictor)
+    return samples
+
+def _speech_like(seconds: float = 0.5, rate: int = 16000) -> "np.ndarray":
+    t = np.arange(int(seconds * rate)) / rate
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)
+    signal = (np.sin(2 * np.pi * 220 * t) + 0.5 * np.sin(2 * np.pi * 660 * t)) * envelope
+    return (signal * 12000).astype(np.int16)
+
+def _snr_db(reference: "np.ndarray", decoded: "np.ndarray") -> float:
+    noise = reference.astype(np.float64) - decoded.astype(np.float64)
+    return 10 * np.log10(np.sum(reference.astype(np.float64) ** 2) / np.sum(noise ** 2))
+
+def test_mulaw_matches_g711_reference_for_every_sample():
+    samples = np.arange(-32768, 32768, dtype=np.int16)
+
+    encoded = encode_mulaw(samples)
+
+    expected = bytes(_reference_mulaw(int(sample)) for sample in samples)
+    assert encoded == expected
+
+def test_ima_adpcm_round_trip():
+    samples = _speech_like()
+
+    encoded = encode_ima_adpcm_blocks(samples)
+
+    assert len(encoded) % IMA_BLOCK_ALIGN == 0
+    decoded = []
+    for offset in range(0, len(encoded), IMA_BLOCK_ALIGN):
+        block = encoded[offset:offset + IMA_BLOCK_ALIGN]
+        block_samples = _decode_ima_block(block)
+        assert len(block_samples) == IMA_SAMPLES_PER_BLOCK
+        # The header carries the block's first sample exactly
+        assert block_samples[0] == samples[offset // IMA_BLOCK_ALIGN * IMA_SAMPLES_PER_BLOCK]
+        decoded.extend(block_samples)
+
+    assert _snr_db(samples, np.array(decoded[:len(samples)])) > 30
+
+def test_streamed_adpcm_matches_whole_encoding():
+    samples = _speech_like()
+    pcm = samples.astype("<i2").tobytes()
+
+    encoder = get_audio_encoder("ima_adpcm")
+    streamed = b"".join(encoder.encode(pcm[i:i + 1234]) for i in range(0, len(pcm), 1234))
+    streamed += encoder.flush()
+
+    assert streamed == encode_ima_adpcm_blocks(samples)
+
+@pytest.mark.parametrize("audio_format, format_tag, block_align, bits", [
+    ("mulaw", WAVE_FORMAT_MULAW, 1, 8),
+    ("ima_adpcm", WAVE_FORMAT_IMA_ADPCM, IMA_BLOCK_ALIGN, 4)
+])
+def test_encoded_wav_header(audio_format, format_tag, block_align, bits):
+    pcm = _speech_like(0.1).astype("<i2").tobytes()
+
+    wav = get_audio_encoder(audio_format).encode_all(pcm)
+
+    assert wav[:4] == b"RIFF" and wav[8:12] == b"WAVE"
+    assert struct.unpack("<I", wav[4:8])[0] == len(wav) - 8
+    fmt_size = struct.unpack("<I", wav[16:20])[0]
+    tag, channels, rate, _, align, sample_bits = struct.unpack("<HHIIHH", wav[20:36])
+    assert (tag, channels, rate, align, sample_bits) == (format_tag, 1, 16000, block_align, bits)
+    fact = 20 + fmt_size
+    assert wav[fact:fact + 4] == b"fact"
+    assert struct.unpack("<I", wav[fact + 8:fact + 12])[0] == len(pcm) // 2
+    assert wav[fact + 12:fact + 16] == b"data"
+    assert struct.unpack("<I", wav[fact + 16:fact + 20])[0] == len(wav) - (fact + 20)
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        get_audio_encoder("opus")
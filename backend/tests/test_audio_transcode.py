@@ -0,0 +1,76 @@
+"""
+MP3 Transcoding Tests (miniaudio decode, NumPy resample to device WAV)
+
+tests/data/tone_440hz_24k.mp3 is a 0.5 s, 440 Hz mono tone at 24 kHz,
+the format gTTS produces.
+"""
+
+import os
+import struct
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("miniaudio")
+
+from services.audio_codec import (
+    decode_mp3,
+    transcode_mp3_to_wav,
+    convert_pcm,
+    DEVICE_SAMPLE_RATE
+)
+
+TONE_MP3 = os.path.join(os.path.dirname(__file__), "data", "tone_440hz_24k.mp3")
+
+def _dominant_frequency(pcm: bytes, sample_rate: int) -> float:
+    samples = np.frombuffer(pcm, dtype="<i2").astype(np.float64)
+    spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+    return np.fft.rfftfreq(len(samples), 1 / sample_rate)[np.argmax(spectrum)]
+
+@pytest.fixture
+def tone_mp3() -> bytes:
+    with open(TONE_MP3, "rb") as f:
+        return f.read()
+
+def test_mp3_is_decoded_at_its_native_format(tone_mp3):
+    samples, sample_rate = decode_mp3(tone_mp3)
+
+    assert sample_rate == 24000
+    assert samples.shape[1] == 1
+    assert samples.dtype == np.int16
+
+def test_mp3_becomes_device_wav(tone_mp3):
+    wav = transcode_mp3_to_wav(tone_mp3)
+
+    assert wav[:4] == b"RIFF" and wav[8:12] == b"WAVE"
+    _, format_tag, channels, sample_rate, _, _, bits = struct.unpack("<IHHIIHH", wav[16:36])
+    assert (format_tag, channels, sample_rate, bits) == (1, 1, DEVICE_SAMPLE_RATE, 16)
+    data_size = struct.unpack("<I", wav[40:44])[0]
+    assert data_size == len(wav) - 44
+
+    # About 0.5 s (plus the MP3 encoder's padding), still a 440 Hz tone
+    seconds = data_size / 2 / DEVICE_SAMPLE_RATE
+    assert 0.5 <= seconds < 0.65
+    assert abs(_dominant_frequency(wav[44:], DEVICE_SAMPLE_RATE) - 440) < 10
+
+def test_stereo_pcm_is_mixed_down_and_resampled():
+    rate = 44100
+    t = np.arange(rate) / rate
+    left = np.sin(2 * np.pi * 1000 * t) * 10000
+    stereo = np.stack([left, left], axis=1).astype("<i2").tobytes()
+
+    pcm = convert_pcm(stereo, rate, channels=2, sample_width=2)
+
+    assert len(pcm) == DEVICE_SAMPLE_RATE * 2
+    assert abs(_dominant_frequency(pcm, DEVICE_SAMPLE_RATE) - 1000) < 5
+
+def test_downsampling_filters_tones_above_the_new_nyquist():
+    rate = 48000
+    t = np.arange(rate) / rate
+    # 15 kHz would alias to 1 kHz at 16 kHz without the low-pass
+    tone = (np.sin(2 * np.pi * 15000 * t) * 10000).astype("<i2").tobytes()
+
+    pcm = convert_pcm(tone, rate, channels=1, sample_width=2)
+
+    residual = np.abs(np.frombuffer(pcm, dtype="<i2")[1000:-1000]).max()
+    assert residual < 1000
@@ -0,0 +1,92 @@
+"""
+Context Cache Tests (with an offline cache provider, see conftest.py)
+"""
+
+IMAGE_PART = {"mime_type": "image/jpeg", "data": b"\xff\xd8\xff"}
+
+def test_same_scene_reuses_cached_content(make_context_cache, cache_provider):
+    cache = make_context_cache()
+
+    first = cache.acquire("s1", "en", 0b1010, IMAGE_PART)
+    second = cache.acquire("s1", "en", 0b1011, IMAGE_PART)  # distance 1
+
+    assert first.scene_cached and second.scene_cached
+    assert second.name == first.name
+    assert second.model is first.model
+    assert len(cache_provider.created) == 1
+    model_name, contents, ttl = cache_provider.created[0]
+    assert model_name == "models/gemini-1.5-flash-001"
+    assert contents == [{"role": "user", "parts": [IMAGE_PART]}]
+    assert ttl == 300
+    assert cache.get_stats()["scene_hits"] == 1
+
+def test_new_scene_or_language_creates_new_content(make_context_cache, cache_provider):
+    cache = make_context_cache()
+
+    cache.acquire("s1", "en", 0, IMAGE_PART)
+    cache.acquire("s1", "en", (1 << 20) - 1, IMAGE_PART)  # distance 20
+    cache.acquire("s1", "hi", (1 << 20) - 1, IMAGE_PART)
+
+    assert len(cache_provider.created) == 3
+    assert cache.get_stats()["scene_creates"] == 3
+
+def test_expired_content_is_created_again(make_context_cache, cache_provider, fake_clock):
+    cache = make_context_cache()
+
+    first = cache.acquire("s1", "en", 7, IMAGE_PART)
+    fake_clock.now += 300 - 11  # still inside the TTL (minus the safety margin)
+    assert cache.acquire("s1", "en", 7, IMAGE_PART).name == first.name
+    fake_clock.now += 2  # within the margin of expiry
+    renewed = cache.acquire("s1", "en", 7, IMAGE_PART)
+
+    assert renewed.scene_cached
+    assert renewed.name != first.name
+    assert len(cache_provider.created) == 2
+
+def test_rejection_for_size_falls_back_to_uncached_model(make_context_cache, cache_provider):
+    cache_provider.reject_with = ValueError("Cached content is too small, minimum is 32768 tokens")
+    cache = make_context_cache()
+
+    handle = cache.acquire("s1", "en", 7, IMAGE_PART)
+
+    assert not handle.scene_cached
+    assert handle.model is cache.language_model("en")
+    assert handle.model.system_instruction == "instruction-en"
+    assert handle.model.cached_name is None
+    stats = cache.get_stats()
+    assert stats["provider_rejections"] == 1
+    assert stats["provider_enabled"] is False
+    # Later turns go straight to the local model
+    cache.acquire("s1", "en", 7, IMAGE_PART)
+    assert cache.get_stats()["local_turns"] == 1
+
+def test_transient_rejection_sends_frame_inline_but_keeps_trying(make_context_cache, cache_provider):
+    cache_provider.reject_with = ConnectionError("unavailable")
+    cache = make_context_cache()
+
+    assert not cache.acquire("s1", "en", 7, IMAGE_PART).scene_cached
+    assert cache.get_stats()["provider_enabled"] is True
+
+    cache_provider.reject_with = None
+    assert cache.acquire("s1", "en", 7, IMAGE_PART).scene_cached
+
+def test_disabled_provider_uses_one_local_model_per_language(make_context_cache, cache_provider):
+    cache = make_context_cache(enabled=False)
+
+    first = cache.acquire("s1", "en", 7, IMAGE_PART)
+    second = cache.acquire("s2", "en", 9, IMAGE_PART)
+
+    assert not first.scene_cached
+    assert first.model is second.model
+    assert cache_provider.created == []
+
+def test_clear_session_forgets_cached_scenes(make_context_cache, cache_provider):
+    cache = make_context_cache()
+    cache.acquire("s1", "en", 7, IMAGE_PART)
+    cache.acquire("s2", "en", 7, IMAGE_PART)
+
+    cache.clear_session("s1")
+
+    assert cache.get_stats()["cached_scenes"] == 1
+    cache.acquire("s1", "en", 7, IMAGE_PART)
+    assert len(cache_provider.created) == 3
@@ -0,0 +1,22 @@
+"""
+Stage Executor Tests (CPU process pool warm-up)
+"""
+
+import asyncio
+
+from services.executor import StageExecutor
+
+def test_warm_up_starts_every_cpu_worker():
+    executor = StageExecutor(cpu_workers=2)
+    try:
+        assert asyncio.run(executor.warm_up_cpu(("services.scene_cache",)))
+        assert len(executor.process_pool._processes) == 2
+    finally:
+        executor.shutdown()
+
+def test_warm_up_without_process_pool():
+    executor = StageExecutor(cpu_workers=0)
+    try:
+        assert asyncio.run(executor.warm_up_cpu()) is False
+    finally:
+        executor.shutdown()
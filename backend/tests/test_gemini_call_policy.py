@@ -0,0 +1,64 @@
+"""
+Gemini Call Policy Tests (deadline and retries, with a fake chat)
+"""
+
+import asyncio
+import time
+
+from services.gemini_service import GeminiService, ANALYSIS_ERROR_MESSAGES
+
+def _analyze(service: GeminiService) -> str:
+    return asyncio.run(service.analyze_image_async(
+        image_data=b"\xff\xd8\xff", user_query="what is ahead?", chat_history=[],
+        language="en", session_id=None
+    ))
+
+def test_retries_stop_when_an_attempt_no_longer_fits_the_deadline(make_chat, make_gemini_service):
+    chat = make_chat(delay=10)
+    service = make_gemini_service(chat, timeout=0.2, deadline=0.5, max_retries=5)
+
+    start = time.monotonic()
+    result = _analyze(service)
+    elapsed = time.monotonic() - start
+
+    assert result == ANALYSIS_ERROR_MESSAGES["en"]
+    # 0.2s + 0.2s; a third attempt would not fit in the remaining 0.1s
+    assert chat.calls == 2
+    assert elapsed < 0.5
+    assert service.stats["timeouts"] == 2
+    assert service.stats["retries"] == 1
+    assert service.stats["failures"] == 1
+
+def test_fast_answer_is_returned(make_chat, make_gemini_service):
+    chat = make_chat(delay=0.01)
+    service = make_gemini_service(chat)
+
+    assert _analyze(service) == "A chair in front of you."
+    assert chat.calls == 1
+    assert service.stats["failures"] == 0
+
+def test_turn_preparation_errors_return_the_spoken_error_message(make_chat, make_gemini_service):
+    service = make_gemini_service(make_chat(delay=0.01))
+
+    def broken_chat_for_turn(*args):
+        raise RuntimeError("chat store unavailable")
+
+    service._chat_for_turn = broken_chat_for_turn
+
+    assert _analyze(service) == ANALYSIS_ERROR_MESSAGES["en"]
+    assert service.stats["failures"] == 1
+
+def test_stream_has_a_timeout_and_drops_the_chat_when_it_fails(make_chat, make_gemini_service):
+    chat = make_chat(text="There is a door ")
+    chat.stream_error = ConnectionError("stream reset")
+    service = make_gemini_service(chat)
+    service.chats.put("session", chat)
+
+    fragments = list(service.analyze_image_stream(
+        image_data=b"\xff\xd8\xff", user_query="", chat_history=[],
+        language="en", session_id="session"
+    ))
+
+    assert fragments == ["There is a door "]
+    assert chat.request_options == {"timeout": 0.5}
+    assert "session" not in service.chats
@@ -0,0 +1,72 @@
+"""
+Request Handler Tests (pipeline task cleanup)
+"""
+
+import asyncio
+
+import pytest
+
+from server import handlers
+from server.middleware import UNEXPECTED_ERROR_MESSAGES
+
+class STTFailure(Exception):
+    pass
+
+@pytest.fixture
+def frame_tasks(monkeypatch):
+    """Slow stand-ins for image conditioning and hashing that record cancellation"""
+    cancelled = []
+
+    def slow(name):
+        async def run(*args):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(name)
+                raise
+        return run
+
+    async def failing_query(*args):
+        await asyncio.sleep(0)
+        raise STTFailure("no speech")
+
+    monkeypatch.setattr(handlers, "_condition_image", slow("image"))
+    monkeypatch.setattr(handlers, "_hash_scene", slow("hash"))
+    monkeypatch.setattr(handlers, "_prepare_query", failing_query)
+    return cancelled
+
+def test_failed_query_cancels_frame_tasks(frame_tasks):
+    async def run():
+        with pytest.raises(STTFailure):
+            await handlers._generate_response_text("s1", "conversation", b"jpeg", b"wav")
+        # Cancelled before the error propagates, not at loop shutdown
+        assert sorted(frame_tasks) == ["hash", "image"]
+
+    asyncio.run(run())
+
+def test_failed_query_cancels_frame_tasks_when_streaming(frame_tasks):
+    async def run():
+        with pytest.raises(STTFailure):
+            await handlers.handle_analyze_request_stream("s1", "conversation", b"jpeg", b"wav")
+        assert sorted(frame_tasks) == ["hash", "image"]
+
+    asyncio.run(run())
+
+def test_error_audio_speaks_fixed_phrase(monkeypatch):
+    spoken = []
+
+    class FakeTTS:
+        def synthesize(self, text, language, audio_format):
+            spoken.append((text, language))
+            return b"RIFF"
+
+    monkeypatch.setattr(handlers, "get_tts_service", FakeTTS)
+
+    assert handlers.generate_error_audio("KeyError: 'image'", "hi") == b"RIFF"
+    assert handlers.generate_error_audio("timeout", "fr") == b"RIFF"
+
+    # Same cacheable text whatever the error was
+    assert spoken == [
+        (UNEXPECTED_ERROR_MESSAGES["hi"], "hi"),
+        (UNEXPECTED_ERROR_MESSAGES["en"], "en")
+    ]
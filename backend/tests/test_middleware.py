@@ -0,0 +1,173 @@
+"""
+Middleware Tests (rate limiting and rate limit key extraction)
+"""
+
+import asyncio
+
+from fastapi import FastAPI, File, Form, UploadFile
+from fastapi.testclient import TestClient
+
+from server.middleware import RateLimitMiddleware, extract_rate_limit_key, MAX_KEY_SCAN_BYTES
+
+# ============================================================================
+# Exempt Paths
+# ============================================================================
+
+def _client(max_requests: int = 2) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/api/v1/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.get("/api/v1/ready")
+    async def ready():
+        return {"ready": True}
+
+    @app.get("/metrics")
+    async def metrics():
+        return "blind_http_requests_total 0"
+
+    @app.get("/api/v1/session/{session_id}")
+    async def session_info(session_id: str):
+        return {"session_id": session_id}
+
+    app.add_middleware(RateLimitMiddleware, max_requests=max_requests, window_seconds=60)
+    return TestClient(app)
+
+def test_probes_and_metrics_are_not_rate_limited():
+    client = _client(max_requests=2)
+
+    for _ in range(10):
+        assert client.get("/api/v1/health").status_code == 200
+        assert client.get("/metrics").status_code == 200
+        response = client.get("/api/v1/ready")
+        assert response.status_code == 200
+        assert "x-ratelimit-remaining" not in response.headers
+
+    # The probes and scrapes used none of the client's quota
+    first = client.get("/api/v1/session/abc")
+    second = client.get("/api/v1/session/abc")
+    assert first.headers["x-ratelimit-remaining"] == "1"
+    assert second.headers["x-ratelimit-remaining"] == "0"
+
+# ============================================================================
+# Rate Limit Key Extraction
+# ============================================================================
+
+BOUNDARY = b"----esp32boundary"
+
+def _multipart(fields) -> bytes:
+    """Multipart body of (name, value, filename) parts, in order"""
+    body = b""
+    for name, value, filename in fields:
+        disposition = f'form-data; name="{name}"'
+        if filename:
+            disposition += f'; filename="{filename}"'
+        body += b"--" + BOUNDARY + b"\r\nContent-Disposition: " + disposition.encode() + b"\r\n\r\n"
+        body += value + b"\r\n"
+    return body + b"--" + BOUNDARY + b"--\r\n"
+
+def _scope(headers=(), query: bytes = b"") -> dict:
+    return {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/v1/analyze",
+        "query_string": query,
+        "client": ("10.0.0.7", 50000),
+        "headers": [(b"content-type", b"multipart/form-data; boundary=" + BOUNDARY)] + list(headers)
+    }
+
+class ChunkedReceive:
+    """ASGI receive callable delivering a body in fixed-size chunks"""
+
+    def __init__(self, body: bytes, chunk_size: int):
+        self.chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        self.calls = 0
+
+    async def __call__(self):
+        index = self.calls
+        self.calls += 1
+        return {
+            "type": "http.request",
+            "body": self.chunks[index],
+            "more_body": index < len(self.chunks) - 1
+        }
+
+def _extract(scope: dict, receive: ChunkedReceive):
+    """Key, messages read during extraction, and the full body seen downstream"""
+    async def run():
+        key, downstream = await extract_rate_limit_key(scope, receive)
+        consumed = receive.calls
+        body = b""
+        while True:
+            message = await downstream()
+            body += message["body"]
+            if not message["more_body"]:
+                return key, consumed, body
+    return asyncio.run(run())
+
+IMAGE = bytes(range(256)) * 200  # 50 KB
+
+def test_header_key_is_used_without_reading_the_body():
+    body = _multipart([("session_id", b"from-form", None)])
+    receive = ChunkedReceive(body, 64)
+
+    key, consumed, replayed = _extract(_scope([(b"x-session-id", b"device-42")]), receive)
+
+    assert key == "device-42"
+    assert consumed == 0
+    assert replayed == body
+
+def test_key_is_found_in_first_field_split_across_chunks():
+    body = _multipart([("session_id", b"abc-123", None), ("image_file", IMAGE, "frame.jpg")])
+    receive = ChunkedReceive(body, 16)
+
+    key, consumed, replayed = _extract(_scope(), receive)
+
+    assert key == "abc-123"
+    # Reading stopped right after the field, long before the image
+    assert consumed * 16 < 200
+    assert replayed == body
+
+def test_key_after_the_image_is_not_searched_for():
+    body = _multipart([("image_file", IMAGE, "frame.jpg"), ("session_id", b"late", None)])
+    receive = ChunkedReceive(body, 1024)
+
+    key, consumed, replayed = _extract(_scope(), receive)
+
+    assert key == "10.0.0.7"
+    assert consumed == 1
+    assert replayed == body
+
+def test_scan_stops_at_the_byte_cap():
+    # First part headers never end within the cap
+    body = (b"--" + BOUNDARY + b"\r\nContent-Disposition: form-data; name=\"session_id\"\r\n"
+            + b"X-Padding: " + b"a" * 20000 + b"\r\n\r\nabc\r\n--" + BOUNDARY + b"--\r\n")
+    receive = ChunkedReceive(body, 1000)
+
+    key, consumed, replayed = _extract(_scope(), receive)
+
+    assert key == "10.0.0.7"
+    assert consumed == -(-MAX_KEY_SCAN_BYTES // 1000)
+    assert replayed == body
+
+def test_form_key_separates_quotas_and_form_arrives_intact():
+    app = FastAPI()
+
+    @app.post("/api/v1/analyze")
+    async def analyze(session_id: str = Form(...), image_file: UploadFile = File(...)):
+        return {"session_id": session_id, "image_size": len(await image_file.read())}
+
+    app.add_middleware(RateLimitMiddleware, max_requests=3, window_seconds=60)
+    client = TestClient(app)
+
+    def post(session_id: str):
+        return client.post("/api/v1/analyze", data={"session_id": session_id},
+                           files={"image_file": ("frame.jpg", IMAGE, "image/jpeg")})
+
+    first = post("device-a")
+    assert first.json() == {"session_id": "device-a", "image_size": len(IMAGE)}
+    assert first.headers["x-ratelimit-remaining"] == "2"
+    assert post("device-a").headers["x-ratelimit-remaining"] == "1"
+    assert post("device-b").headers["x-ratelimit-remaining"] == "2"
@@ -0,0 +1,55 @@
+"""
+Rate Limiter Tests (in-process GCRA backend)
+"""
+
+import asyncio
+import time
+
+from services.rate_limiter import LocalRateLimitBackend, RateLimiter
+
+def test_burst_then_limited_with_retry_after():
+    backend = LocalRateLimitBackend(max_requests=10, window_seconds=60)
+    now = time.monotonic()
+
+    results = [backend.check("device", now=now) for _ in range(11)]
+
+    assert [r.remaining for r in results[:10]] == list(range(9, -1, -1))
+    assert all(r.allowed for r in results[:10])
+    assert not results[10].allowed
+    assert abs(results[10].retry_after - 6.0) < 1e-6
+    # One request becomes available per interval
+    assert backend.check("device", now=now + 6.0).allowed
+    assert not backend.check("device", now=now + 6.1).allowed
+
+def test_idle_key_evicted_within_one_tick_of_its_deadline():
+    backend = LocalRateLimitBackend(max_requests=10, window_seconds=60, tick_seconds=1.0)
+    now = time.monotonic()
+    backend.check("idle", now=now)
+    deadline = backend.tats["idle"]  # quota fully refilled here
+
+    backend.check("other", now=deadline - 0.01)
+    assert "idle" in backend.tats
+
+    backend.check("other", now=deadline + 1.0 + 1e-3)
+    assert "idle" not in backend.tats
+
+def test_key_churn_keeps_memory_bounded():
+    backend = LocalRateLimitBackend(max_requests=10, window_seconds=60, tick_seconds=1.0)
+    start = time.monotonic()
+    # A new random key every 0.1s for ten minutes; each is idle after 6s
+    for i in range(6000):
+        backend.check(f"random-{i}", now=start + i * 0.1)
+    # Keys of the last ~7 seconds (interval plus one tick) at most
+    assert len(backend) <= 71
+
+def test_rate_limiter_without_redis_uses_local_backend():
+    limiter = RateLimiter(max_requests=2, window_seconds=60, redis_url=None)
+
+    async def run():
+        return [await limiter.check("device") for _ in range(3)]
+
+    results = asyncio.run(run())
+    assert [r.allowed for r in results] == [True, True, False]
+    stats = limiter.get_stats()
+    assert stats["backend"] == "memory"
+    assert (stats["allowed"], stats["limited"]) == (2, 1)
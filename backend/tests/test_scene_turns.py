@@ -0,0 +1,25 @@
+"""
+Scene Cache Hit Tests (replayed answers stay in the chat history)
+"""
+
+from services.gemini_service import SNAPSHOT_PROMPTS
+
+def test_replayed_answer_is_appended_to_live_chat(make_chat, make_gemini_service):
+    service = make_gemini_service()
+    chat = make_chat(history=[{"role": "user", "parts": ["What is ahead?"]},
+                              {"role": "model", "parts": ["A door."]}])
+    service.chats.put("s1", chat)
+
+    service.record_turn("s1", "What is ahead?", "A door.", "en")
+    service.record_turn("s1", "", "A hallway with a door.", "en")
+
+    assert [turn["role"] for turn in chat.history] == ["user", "model"] * 3
+    assert chat.history[-2] == {"role": "user", "parts": [SNAPSHOT_PROMPTS["en"]]}
+    assert chat.history[-1] == {"role": "model", "parts": ["A hallway with a door."]}
+
+def test_without_live_chat_nothing_is_created(make_gemini_service):
+    service = make_gemini_service()
+
+    service.record_turn("s1", "What is ahead?", "A door.", "en")
+
+    assert service.chats.get("s1") is None
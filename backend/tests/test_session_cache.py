@@ -0,0 +1,94 @@
+"""
+Per-Worker Session Cache Tests (version tokens, invalidation; fakeredis)
+
+Two RedisSessionBackends sharing one fake Redis server stand for two
+workers.
+"""
+
+import asyncio
+
+from models.session import SessionData
+
+def test_cached_session_is_served_while_its_version_is_current(redis_backends):
+    worker = redis_backends()
+
+    async def run():
+        await worker.save(SessionData("s1"))
+        first = await worker.load("s1")
+        second = await worker.load("s1")
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first is not second  # callers get independent copies
+    assert first.version == second.version
+    assert worker.local_cache.get_stats()["hits"] == 2
+
+def test_write_by_another_worker_makes_the_cached_copy_stale(redis_backends):
+    worker_a = redis_backends()
+    worker_b = redis_backends()
+
+    async def run():
+        await worker_a.save(SessionData("s1"))
+        await worker_a.load("s1")
+
+        session = await worker_b.load("s1")
+        session.add_interaction("what is ahead?", "en", "temp.jpg", "A door.")
+        await worker_b.append(session)
+
+        return await worker_a.load("s1")
+
+    reloaded = asyncio.run(run())
+
+    assert [item["ai_response"] for item in reloaded.chat_history] == ["A door."]
+    assert worker_a.local_cache.get_stats()["stale"] == 1
+
+def test_concurrent_appends_keep_both_turns(redis_backends):
+    worker_a = redis_backends()
+    worker_b = redis_backends()
+
+    async def run():
+        await worker_a.save(SessionData("s1"))
+        session_a = await worker_a.load("s1")
+        session_b = await worker_b.load("s1")
+
+        session_b.add_interaction("q1", "en", "temp.jpg", "from b")
+        await worker_b.append(session_b)
+        session_a.add_interaction("q2", "en", "temp.jpg", "from a")
+        await worker_a.append(session_a)
+
+        return session_a, await worker_a.load("s1")
+
+    session_a, reloaded = asyncio.run(run())
+
+    # Worker A's object missed B's turn, so it is not cached
+    assert session_a.version is None
+    assert [item["ai_response"] for item in reloaded.chat_history] == ["from b", "from a"]
+
+def test_writes_are_announced_to_other_workers(redis_backends):
+    worker_a = redis_backends()
+    worker_b = redis_backends()
+
+    async def run():
+        worker_a.start_invalidation()
+        try:
+            await worker_a.save(SessionData("s1"))
+            await worker_a.load("s1")
+            await asyncio.sleep(0.1)  # listener subscribed
+
+            session = await worker_b.load("s1")
+            session.touch()
+            await worker_b.append(session)
+
+            for _ in range(50):
+                if worker_a.local_cache.get_stats()["entries"] == 0:
+                    break
+                await asyncio.sleep(0.02)
+            return worker_a.local_cache.get_stats()
+        finally:
+            await worker_a.close()
+
+    stats = asyncio.run(run())
+
+    assert stats["entries"] == 0
+    assert stats["invalidations"] == 1
@@ -0,0 +1,129 @@
+"""
+Redis Session Storage Tests (with fakeredis)
+"""
+
+import json
+import asyncio
+
+import pytest
+
+from models.session import SessionData, MAX_INTERACTIONS
+
+def _interact(session: SessionData, n: int):
+    for i in range(n):
+        session.add_interaction(f"question {i}", "en", "temp.jpg", f"answer {i}")
+
+def test_append_after_expiry_rewrites_whole_session(redis_backends):
+    backend = redis_backends()
+
+    async def run():
+        session = SessionData("s1")
+        _interact(session, 3)
+        await backend.save(session)
+
+        # Keys expired (or were evicted) after the session was loaded
+        await backend.client.delete(*backend._keys("s1"))
+        _interact(session, 1)
+        await backend.append(session)
+
+        backend.local_cache.evict("s1")
+        return session, await backend.load("s1")
+
+    session, stored = asyncio.run(run())
+
+    assert [item["user_query"] for item in stored.chat_history] == [
+        "question 0", "question 1", "question 2", "question 0"
+    ]
+    assert stored.session_id == "s1"
+    assert stored.created_at == session.created_at
+    assert stored.version == session.version
+
+def test_append_of_session_kept_in_memory_during_outage(redis_backends):
+    backend = redis_backends()
+
+    async def run():
+        # Written to the in-memory backend while Redis was down: nothing
+        # pending, never stored in Redis
+        session = SessionData("s1")
+        _interact(session, 2)
+        session.pending_interactions = []
+        await backend.append(session)
+
+        backend.local_cache.evict("s1")
+        return await backend.load("s1")
+
+    stored = asyncio.run(run())
+
+    assert len(stored.chat_history) == 2
+
+def test_interactions_are_stored_as_messagepack(redis_backends):
+    msgpack = pytest.importorskip("msgpack")
+    backend = redis_backends()
+
+    async def run():
+        session = SessionData("s1")
+        _interact(session, 2)
+        await backend.save(session)
+        return await backend.client.lrange(backend._keys("s1")[1], 0, -1)
+
+    raw = asyncio.run(run())
+
+    assert len(raw) == 2
+    assert raw[0][:1] != b"{"
+    assert msgpack.unpackb(raw[1], raw=False)["ai_response"] == "answer 1"
+
+def test_appends_push_only_new_interactions_and_trim_the_log(redis_backends):
+    backend = redis_backends()
+
+    async def run():
+        session = SessionData("s1")
+        await backend.save(session)
+        for i in range(MAX_INTERACTIONS + 3):
+            session.add_interaction(f"question {i}", "hi", "temp.jpg", f"answer {i}")
+            await backend.append(session)
+            assert session.pending_interactions == []
+        backend.local_cache.evict("s1")
+        meta = await backend.client.hgetall(backend._keys("s1")[0])
+        return await backend.load("s1"), meta
+
+    stored, meta = asyncio.run(run())
+
+    assert [item["user_query"] for item in stored.chat_history] == [
+        f"question {i}" for i in range(3, MAX_INTERACTIONS + 3)
+    ]
+    assert stored.detected_language == "hi"
+    assert meta[b"session_id"] == b"s1"
+
+def test_legacy_json_session_is_migrated(redis_backends):
+    backend = redis_backends()
+    legacy = SessionData("s1")
+    _interact(legacy, 2)
+    legacy.detected_language = "hi"
+
+    async def run():
+        await backend.client.set(backend._legacy_key("s1"), json.dumps(legacy.to_dict()))
+        session = await backend.load("s1")
+        legacy_left = await backend.client.exists(backend._legacy_key("s1"))
+        backend.local_cache.evict("s1")
+        return session, legacy_left, await backend.load("s1")
+
+    session, legacy_left, reloaded = asyncio.run(run())
+
+    assert session.chat_history == legacy.chat_history
+    assert session.detected_language == "hi"
+    assert legacy_left == 0
+    assert reloaded.chat_history == legacy.chat_history
+    assert reloaded.created_at == legacy.created_at
+
+def test_json_encoded_interactions_are_still_readable(redis_backends):
+    backend = redis_backends()
+    interaction = {"user_query": "q", "detected_language": "en", "image_path": "x.jpg",
+                   "ai_response": "a", "timestamp": "2024-01-01T00:00:00"}
+
+    async def run():
+        meta_key, log_key = backend._keys("s1")
+        await backend.client.hset(meta_key, mapping={"session_id": "s1", "v": "abc"})
+        await backend.client.rpush(log_key, json.dumps(interaction).encode("utf-8"))
+        return await backend.load("s1")
+
+    assert asyncio.run(run()).chat_history == [interaction]
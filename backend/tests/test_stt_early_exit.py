@@ -0,0 +1,66 @@
+"""
+STT Concurrent Recognition Tests (early exit follows STT_LANGUAGE_RULE)
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.stt_service import STTService, RECOGNITION_LANGUAGES
+
+CONFIDENT_EN = ("what is in front of me", "en", 0.95)
+LONG_HI = ("मेरे सामने क्या है यह बताइए कृपया", "hi", 0.6)
+
+def _service(rule: str) -> STTService:
+    service = STTService()
+    service.language_rule = rule
+    service.early_exit_confidence = 0.85
+    return service
+
+def _run(service: STTService, delays_and_results):
+    """Collect results of fake recognitions that finish after the given delays"""
+    def recognize(delay, result):
+        time.sleep(delay)
+        return result
+
+    with ThreadPoolExecutor(max_workers=len(delays_and_results)) as pool:
+        futures = [pool.submit(recognize, delay, result) for delay, result in delays_and_results]
+        return service._collect_recognition_results(futures)
+
+def test_script_rule_exits_on_confident_result_in_script():
+    service = _service("script")
+
+    results = _run(service, [(0.0, CONFIDENT_EN), (0.3, LONG_HI)])
+
+    assert results == [CONFIDENT_EN]
+
+def test_script_rule_waits_when_script_does_not_match():
+    service = _service("script")
+    latin_hindi = ("mere saamne kya hai", "hi", 0.95)
+
+    results = _run(service, [(0.0, latin_hindi), (0.1, CONFIDENT_EN)])
+
+    assert results[0] == latin_hindi
+    assert service._choose_recognition_result(results) == CONFIDENT_EN
+
+def test_longest_rule_never_exits_early():
+    service = _service("longest")
+
+    results = _run(service, [(0.0, CONFIDENT_EN), (0.1, LONG_HI)])
+
+    assert len(results) == 2
+    assert service._choose_recognition_result(results) == LONG_HI
+
+def test_confidence_rule_ignores_script():
+    service = _service("confidence")
+    latin_hindi = ("mere saamne kya hai", "hi", 0.95)
+
+    assert service._is_confident_result(latin_hindi)
+    assert not service._is_confident_result(LONG_HI)
+
+def test_pool_has_a_thread_per_language_per_stt_call(monkeypatch):
+    monkeypatch.delenv("STT_RECOGNITION_WORKERS", raising=False)
+    monkeypatch.setenv("STAGE_LIMIT_STT", "5")
+
+    service = STTService()
+
+    assert service.recognition_pool._max_workers == 5 * len(RECOGNITION_LANGUAGES)
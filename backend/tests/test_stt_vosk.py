@@ -0,0 +1,101 @@
+"""
+Vosk Decoding Tests (in-memory WAV, every language model in one pass)
+
+Vosk itself is replaced by fake recognizers that record the audio they are
+fed and return a canned transcript per language.
+"""
+
+import io
+import json
+import wave
+
+import pytest
+
+from services import stt_service
+from services.stt_service import STTService, VoskRecognizerPool
+
+class FakeVoskModel:
+    def __init__(self, text: str, confidence: float):
+        self.text = text
+        self.confidence = confidence
+
+class FakeRecognizer:
+    """KaldiRecognizer stand-in; one canned utterance at the end of the audio"""
+
+    created = []
+
+    def __init__(self, model: FakeVoskModel, sample_rate: int):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.audio = b""
+        self.decoded = []  # audio of each finished decode
+        FakeRecognizer.created.append(self)
+
+    def SetWords(self, enabled: bool):
+        pass
+
+    def AcceptWaveform(self, data: bytes) -> bool:
+        self.audio += data
+        return False
+
+    def FinalResult(self) -> str:
+        self.decoded.append(self.audio)
+        words = [{"word": word, "conf": self.model.confidence} for word in self.model.text.split()]
+        return json.dumps({"text": self.model.text, "result": words})
+
+    def Reset(self):
+        self.audio = b""
+
+def _wav(frames: int, sample_rate: int = 16000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(bytes(range(256)) * (frames * 2 // 256) + b"\x00" * (frames * 2 % 256))
+    return buffer.getvalue()
+
+@pytest.fixture
+def vosk_service(monkeypatch):
+    FakeRecognizer.created = []
+    monkeypatch.setattr(stt_service, "KaldiRecognizer", FakeRecognizer, raising=False)
+    service = STTService()
+    service.vosk_models = {
+        "en": FakeVoskModel("where is the door", 0.9),
+        "hi": FakeVoskModel("दरवाजा कहाँ है", 0.6)
+    }
+    service.recognizer_pool = VoskRecognizerPool(service.vosk_models, max_idle=2)
+    return service
+
+def test_every_model_is_fed_the_whole_wav(vosk_service):
+    wav = _wav(frames=10000)  # 2.5 chunks of 4000 frames
+    with wave.open(io.BytesIO(wav), "rb") as wf:
+        pcm = wf.readframes(wf.getnframes())
+
+    text, language = vosk_service._transcribe_vosk(wav, "wav")
+
+    assert (text, language) == ("where is the door", "en")
+    assert sorted(rec.model.text for rec in FakeRecognizer.created) == sorted(
+        model.text for model in vosk_service.vosk_models.values()
+    )
+    for rec in FakeRecognizer.created:
+        assert rec.sample_rate == 16000
+        assert rec.decoded == [pcm]
+
+def test_highest_mean_word_confidence_wins(vosk_service):
+    vosk_service.vosk_models["hi"].confidence = 0.95
+
+    assert vosk_service._transcribe_vosk(_wav(frames=4000), "wav") == ("दरवाजा कहाँ है", "hi")
+
+def test_recognizers_are_reused_per_language_and_rate(vosk_service):
+    for _ in range(3):
+        vosk_service._transcribe_vosk(_wav(frames=4000), "wav")
+
+    stats = vosk_service.recognizer_pool.get_stats()
+    assert len(FakeRecognizer.created) == 2
+    assert stats["misses"] == 2
+    assert stats["hits"] == 4
+    assert stats["idle"] == {"en:16000": 1, "hi:16000": 1}
+
+def test_unreadable_audio_returns_none(vosk_service):
+    assert vosk_service._transcribe_vosk(b"not a wav", "wav") is None
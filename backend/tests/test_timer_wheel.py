@@ -0,0 +1,66 @@
+"""
+Timer Wheel Tests
+"""
+
+import math
+import time
+
+from services.timer_wheel import TimerWheel
+
+def _tick_start(wheel: TimerWheel, offset_ticks: int) -> float:
+    """Start of a tick some ticks after the current one"""
+    current = math.floor(time.monotonic() / wheel.tick_seconds)
+    return (current + offset_ticks) * wheel.tick_seconds
+
+def test_key_due_partway_through_a_tick_expires_once_the_tick_passes():
+    wheel = TimerWheel(tick_seconds=1.0, slots=8)
+    base = _tick_start(wheel, 2)
+    wheel.schedule("session", base + 3.8)
+
+    # Same tick, before the deadline: not yet due
+    assert wheel.advance(base + 3.2) == []
+    assert "session" in wheel.deadlines
+    # Same tick, after the deadline: only reported once the tick has passed
+    assert wheel.advance(base + 3.9) == []
+    assert wheel.is_expired("session", base + 3.9)
+    # Within one tick of the deadline (not one rotation later)
+    assert wheel.advance(base + 4.01) == ["session"]
+    assert len(wheel) == 0
+
+def test_keys_in_later_rotations_stay_until_due():
+    wheel = TimerWheel(tick_seconds=1.0, slots=4)
+    base = _tick_start(wheel, 1)
+    wheel.schedule("near", base + 1.5)
+    wheel.schedule("far", base + 5.5)  # same slot, one rotation later
+
+    assert wheel.advance(base + 2.1) == ["near"]
+    assert wheel.advance(base + 5.9) == []
+    assert wheel.advance(base + 6.1) == ["far"]
+
+def test_deadline_already_past_expires_on_next_tick():
+    wheel = TimerWheel(tick_seconds=1.0, slots=8)
+    base = _tick_start(wheel, 0)
+    wheel.advance(base + 0.5)
+    wheel.schedule("late", base - 10)
+
+    assert wheel.advance(base + 1.01) == ["late"]
+
+def test_cancel_and_reschedule():
+    wheel = TimerWheel(tick_seconds=1.0, slots=8)
+    base = _tick_start(wheel, 1)
+    wheel.schedule("a", base + 1.5)
+    wheel.schedule("b", base + 1.5)
+    wheel.cancel("a")
+    wheel.schedule("b", base + 3.5)
+
+    assert wheel.advance(base + 2.1) == []
+    assert wheel.advance(base + 4.1) == ["b"]
+    assert len(wheel) == 0
+
+def test_long_pause_catches_up_every_slot():
+    wheel = TimerWheel(tick_seconds=1.0, slots=4)
+    base = _tick_start(wheel, 1)
+    for i in range(4):
+        wheel.schedule(i, base + i + 0.5)
+
+    assert sorted(wheel.advance(base + 100)) == [0, 1, 2, 3]
@@ -679,6 +679,8 @@ bool uploadToBackend(bool includeAudio) {
   String boundary = String(MULTIPART_BOUNDARY);
   String contentType = "multipart/form-data; boundary=" + boundary;
   http.addHeader("Content-Type", contentType);
+  // Lets the server rate-limit without reading the multipart body
+  http.addHeader("X-Session-Id", sessionId);
   
   // Build request body
   String requestBody = "";